@@ -1,21 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlmodel import Session
 from app.db.session import get_session
 from app.db.models import AnalysisJob, AnalysisStatus
 from app.schemas.analysis import AdvancedAnalysisRequest, AnalysisResponse
-from app.services.advanced_ewas_service import AdvancedEWASService
-from app.services.annotation_service import AnnotationService
+from app.core.options import ANNOTATION_SOURCES, PREPROCESSING_STEPS
+from app.tasks.scheduler import schedule_analysis, get_scheduler, ADVANCED_TASK, ANNOTATION_TASK
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/ewas-advanced", response_model=AnalysisResponse)
 async def create_advanced_ewas_analysis(
     request: AdvancedAnalysisRequest,
-    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     """Submit advanced EWAS analysis with mixed models"""
+    if any(step not in PREPROCESSING_STEPS for step in request.preprocessing):
+        raise HTTPException(status_code=400, detail=f"preprocessing steps must be among: {', '.join(PREPROCESSING_STEPS)}")
+    
     analysis_job = AnalysisJob(
         name=f"Advanced_EWAS_{request.phenotype_column}",
         epigenome_file_id=request.epigenome_file_id,
@@ -23,6 +28,9 @@ async def create_advanced_ewas_analysis(
         phenotype_column=request.phenotype_column,
         covariates=json.dumps(request.covariates),
         model_type="mixed_model",
+        random_effects=json.dumps(request.random_effects) if request.random_effects is not None else None,
+        preprocessing=json.dumps(request.preprocessing),
+        priority=request.priority,
         owner_id=1
     )
     
@@ -30,8 +38,8 @@ async def create_advanced_ewas_analysis(
     session.commit()
     session.refresh(analysis_job)
     
-    # Run advanced analysis in background
-    background_tasks.add_task(run_advanced_ewas_analysis, analysis_job.id, request.random_effects)
+    # Queue advanced analysis
+    schedule_analysis(session, analysis_job, ADVANCED_TASK, request.random_effects)
     
     return AnalysisResponse(
         analysis_id=analysis_job.id,
@@ -42,10 +50,13 @@ async def create_advanced_ewas_analysis(
 @router.post("/annotate/{analysis_id}")
 async def annotate_results(
     analysis_id: int,
-    background_tasks: BackgroundTasks,
+    source: str = "auto",
     session: Session = Depends(get_session)
 ):
     """Annotate analysis results with gene information"""
+    if source not in ANNOTATION_SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(ANNOTATION_SOURCES)}")
+    
     analysis = session.get(AnalysisJob, analysis_id)
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
@@ -53,122 +64,75 @@ async def annotate_results(
     if analysis.status != AnalysisStatus.COMPLETED:
         raise HTTPException(status_code=400, detail="Analysis not completed")
     
-    background_tasks.add_task(annotate_analysis_results, analysis_id)
+    if analysis.annotation_status == AnalysisStatus.RUNNING:
+        raise HTTPException(status_code=400, detail="Annotation already running")
     
-    return {"message": "Annotation started", "analysis_id": analysis_id}
+    analysis.annotation_status = AnalysisStatus.PENDING
+    analysis.annotation_progress = 0
+    session.commit()
+    
+    # A worker thread annotates, off the event loop; each finished chunk is committed and readable at once
+    get_scheduler().submit(analysis_id, analysis.owner_id, ANNOTATION_TASK, source, priority=analysis.priority)
+    
+    return {"message": "Annotation started", "analysis_id": analysis_id, "source": source}
 
 @router.get("/pathway-enrichment/{analysis_id}")
 async def get_pathway_enrichment(
     analysis_id: int,
+    request: Request,
     p_threshold: float = 0.05,
+    method: str = "ora",
+    min_size: int = 5,
+    max_size: int = 500,
+    limit: int = 50,
     session: Session = Depends(get_session)
 ):
     """Get pathway enrichment for significant CpGs"""
+    if method not in ("ora", "rank"):
+        raise HTTPException(status_code=400, detail="method must be 'ora' or 'rank'")
+    
     analysis = session.get(AnalysisJob, analysis_id)
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
-    # Get significant results
-    from sqlmodel import select
-    from app.db.models import AnalysisResult
+    from app.core.cache import cached_response
+    from app.services.enrichment_service import EnrichmentService
     
-    statement = (
-        select(AnalysisResult)
-        .where(AnalysisResult.analysis_id == analysis_id)
-        .where(AnalysisResult.p_value < p_threshold)
+    enrichment_service = EnrichmentService()
+    if enrichment_service.library is None:
+        raise HTTPException(status_code=404, detail="No gene set library found")
+    
+    return cached_response(
+        request,
+        analysis,
+        lambda: _pathway_enrichment(session, analysis, enrichment_service, p_threshold, method, min_size, max_size, limit),
+        extra=enrichment_service.library.version or ""
     )
-    significant_results = session.exec(statement).all()
+
+def _pathway_enrichment(session, analysis, enrichment_service, p_threshold, method, min_size, max_size, limit) -> dict:
+    import numpy as np
+    from app.services.result_store import ResultRepository
     
-    if not significant_results:
-        return {"pathways": {}, "message": "No significant results found"}
+    results = ResultRepository(session).frame(analysis, ["gene_symbol", "p_value"])
+    results = results[results["gene_symbol"].notna() & ~results["gene_symbol"].isin(["unknown", "intergenic"])]
     
-    # Mock gene extraction (would need annotation data)
-    genes = [f"GENE_{i}" for i in range(len(significant_results))]
+    if method == "rank":
+        # Score each gene by its most significant CpG
+        best_p = results.groupby("gene_symbol")["p_value"].min()
+        gene_scores = dict(zip(best_p.index, -np.log10(np.clip(best_p.to_numpy(dtype=float), 1e-300, None))))
+        if not gene_scores:
+            return {"pathways": {}, "message": "No annotated results found"}
+        
+        pathways = enrichment_service.rank_enrichment(gene_scores, min_size, max_size, limit)
+        return {"pathways": pathways, "gene_count": len(gene_scores), "method": method}
     
-    annotation_service = AnnotationService()
-    pathways = annotation_service.get_pathway_enrichment(genes)
+    background = results["gene_symbol"].unique().tolist()
+    genes = results.loc[results["p_value"] < p_threshold, "gene_symbol"].unique().tolist()
     
-    return {"pathways": pathways, "gene_count": len(genes)}
-
-async def run_advanced_ewas_analysis(analysis_id: int, random_effects: list = None):
-    """Run advanced EWAS analysis with mixed models"""
-    from sqlmodel import create_engine
-    from app.core.config import settings
-    from app.db.models import DataFile, AnalysisResult
-    from app.services.file_storage_service import FileStorageService
-    from datetime import datetime
-    
-    engine = create_engine(settings.DATABASE_URL)
-    
-    with Session(engine) as session:
-        try:
-            analysis = session.get(AnalysisJob, analysis_id)
-            if not analysis:
-                return
-            
-            # Update status
-            analysis.status = AnalysisStatus.RUNNING
-            analysis.started_at = datetime.utcnow()
-            analysis.progress = 10
-            session.commit()
-            
-            # Get files
-            epigenome_file = session.get(DataFile, analysis.epigenome_file_id)
-            phenotype_file = session.get(DataFile, analysis.phenotype_file_id)
-            
-            if not epigenome_file or not phenotype_file:
-                analysis.status = AnalysisStatus.FAILED
-                analysis.error_message = "Required files not found"
-                session.commit()
-                return
-            
-            # Load data
-            storage_service = FileStorageService()
-            epigenome_data = storage_service.download_file(epigenome_file.file_path)
-            phenotype_data = storage_service.download_file(phenotype_file.file_path)
-            
-            analysis.progress = 30
-            session.commit()
-            
-            # Run advanced analysis
-            ewas_service = AdvancedEWASService()
-            covariates = json.loads(analysis.covariates)
-            
-            results = ewas_service.run_mixed_model_analysis(
-                epigenome_data=epigenome_data,
-                phenotype_data=phenotype_data,
-                phenotype_column=analysis.phenotype_column,
-                covariates=covariates,
-                random_effects=random_effects
-            )
-            
-            analysis.progress = 80
-            session.commit()
-            
-            # Save results
-            for result in results:
-                db_result = AnalysisResult(
-                    cpg_id=result['cpg_id'],
-                    chromosome=result['chromosome'],
-                    position=result['position'],
-                    beta=result['beta'],
-                    p_value=result['p_value'],
-                    fdr=result.get('fdr'),
-                    analysis_id=analysis_id
-                )
-                session.add(db_result)
-            
-            analysis.status = AnalysisStatus.COMPLETED
-            analysis.completed_at = datetime.utcnow()
-            analysis.progress = 100
-            session.commit()
-            
-        except Exception as e:
-            analysis.status = AnalysisStatus.FAILED
-            analysis.error_message = str(e)
-            session.commit()
+    if not genes:
+        return {"pathways": {}, "message": "No significant annotated results found"}
+    
+    pathways = enrichment_service.over_representation(genes, background, min_size, max_size, limit)
+    
+    return {"pathways": pathways, "gene_count": len(genes), "background_count": len(background), "method": method}
 
-async def annotate_analysis_results(analysis_id: int):
-    """Annotate analysis results with gene information"""
-    # This would run annotation in background
-    pass
\ No newline at end of file
@@ -1,19 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlmodel import Session
-from app.db.session import get_session
-from app.db.models import AnalysisJob, AnalysisStatus
-from app.schemas.analysis import AnalysisRequest, AnalysisResponse, AnalysisStatusResponse
-from app.tasks.ewas_tasks import run_ewas_analysis
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse, FileResponse
+from sqlmodel import Session, select
+from app.db.session import get_session, engine
+from app.core.progress import progress_broker
+from app.core.config import settings
+from app.db.models import AnalysisJob, AnalysisStatus, Batch, DataFile
+from app.schemas.analysis import AnalysisRequest, AnalysisResponse, AnalysisStatusResponse, SweepRequest, IncrementalUpdateRequest
+from app.core.options import PREPROCESSING_STEPS, check_sample_filter
+from app.services.request_validation import validate_analysis_request
+from app.tasks.scheduler import schedule_analysis, get_scheduler, EWAS_TASK, SWEEP_TASK, INCREMENTAL_TASK
 import json
+import os
 
 router = APIRouter()
 
 @router.post("/ewas", response_model=AnalysisResponse)
 async def create_ewas_analysis(
     request: AnalysisRequest,
-    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
+    try:
+        validate_analysis_request(session, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     analysis_job = AnalysisJob(
         name=f"EWAS_{request.phenotype_column}",
         epigenome_file_id=request.epigenome_file_id,
@@ -21,6 +31,13 @@ async def create_ewas_analysis(
         phenotype_column=request.phenotype_column,
         covariates=json.dumps(request.covariates),
         model_type=request.model_type,
+        case_level=request.case_level,
+        preprocessing=json.dumps(request.preprocessing),
+        confounders=request.confounders.model_dump_json() if request.confounders else None,
+        permutation=request.permutation.model_dump_json() if request.permutation else None,
+        sample_filter=json.dumps(request.sample_filter) if request.sample_filter else None,
+        incremental=request.incremental,
+        priority=request.priority,
         owner_id=1  # TODO: Get from current user
     )
     
@@ -28,8 +45,8 @@ async def create_ewas_analysis(
     session.commit()
     session.refresh(analysis_job)
     
-    # Run analysis in background
-    background_tasks.add_task(run_ewas_analysis, analysis_job.id)
+    # Queue the analysis; it starts once the scheduler can admit it
+    schedule_analysis(session, analysis_job, EWAS_TASK)
     
     return AnalysisResponse(
         analysis_id=analysis_job.id,
@@ -37,6 +54,107 @@ async def create_ewas_analysis(
         message="Analysis job submitted."
     )
 
+@router.post("/{analysis_id}/update", response_model=AnalysisResponse)
+async def update_analysis(
+    analysis_id: int,
+    request: IncrementalUpdateRequest,
+    session: Session = Depends(get_session)
+):
+    """New EWAS of an incremental analysis plus the samples in the given files, without rereading the original data"""
+    base = session.get(AnalysisJob, analysis_id)
+    if not base:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    if base.status != AnalysisStatus.COMPLETED or not base.sufficient_stats_path:
+        raise HTTPException(status_code=400, detail="Only completed analyses submitted with incremental=true can be updated")
+    
+    analysis_job = AnalysisJob(
+        name=f"{base.name}_update",
+        base_analysis_id=base.id,
+        epigenome_file_id=request.epigenome_file_id,
+        phenotype_file_id=request.phenotype_file_id,
+        phenotype_column=base.phenotype_column,
+        covariates=base.covariates,
+        model_type=base.model_type,
+        preprocessing=base.preprocessing,
+        sample_filter=base.sample_filter,
+        incremental=True,
+        priority=request.priority,
+        owner_id=base.owner_id
+    )
+    
+    session.add(analysis_job)
+    session.commit()
+    session.refresh(analysis_job)
+    
+    schedule_analysis(session, analysis_job, INCREMENTAL_TASK)
+    
+    return AnalysisResponse(
+        analysis_id=analysis_job.id,
+        status=analysis_job.status,
+        message=f"Update of analysis {base.id} submitted."
+    )
+
+@router.post("/sweep", response_model=dict)
+async def create_sweep_analysis(
+    request: SweepRequest,
+    session: Session = Depends(get_session)
+):
+    """Linear EWAS for every sample filter x covariate set, sharing one data load and design factorizations"""
+    if any(step not in PREPROCESSING_STEPS for step in request.preprocessing):
+        raise HTTPException(status_code=400, detail=f"preprocessing steps must be among: {', '.join(PREPROCESSING_STEPS)}")
+    if not request.sample_filters or not request.covariate_sets:
+        raise HTTPException(status_code=400, detail="At least one sample filter and one covariate set are required")
+    n_variants = len(request.sample_filters) * len(request.covariate_sets)
+    if n_variants > settings.SWEEP_MAX_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"A sweep can have at most {settings.SWEEP_MAX_VARIANTS} variants, got {n_variants}")
+    try:
+        for sample_filter in request.sample_filters:
+            check_sample_filter(sample_filter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    sweep_name = request.sweep_name or f"sweep_{request.phenotype_column}"
+    batch = Batch(name=sweep_name, owner_id=1, total_analyses=n_variants)
+    session.add(batch)
+    session.flush()
+    
+    variants = [(f, c) for f in request.sample_filters for c in request.covariate_sets]
+    analysis_jobs = [
+        AnalysisJob(
+            name=f"{sweep_name}_{i+1}_{request.phenotype_column}",
+            batch_id=batch.id,
+            epigenome_file_id=request.epigenome_file_id,
+            phenotype_file_id=request.phenotype_file_id,
+            phenotype_column=request.phenotype_column,
+            covariates=json.dumps(covariates),
+            sample_filter=json.dumps(sample_filter) if sample_filter else None,
+            model_type="linear_regression",
+            preprocessing=json.dumps(request.preprocessing),
+            priority=request.priority,
+            owner_id=1
+        )
+        for i, (sample_filter, covariates) in enumerate(variants)
+    ]
+    session.add_all(analysis_jobs)
+    session.commit()
+    analysis_jobs = session.exec(select(AnalysisJob).where(AnalysisJob.batch_id == batch.id).order_by(AnalysisJob.id)).all()
+    
+    # The whole sweep is one scheduled unit, queued under its first variant
+    analysis_ids = [job.id for job in analysis_jobs]
+    schedule_analysis(session, analysis_jobs[0], SWEEP_TASK, analysis_ids)
+    
+    return {
+        "batch_id": batch.id,
+        "batch_name": sweep_name,
+        "analysis_ids": analysis_ids,
+        "total_analyses": len(analysis_ids),
+        "variants": [
+            {"analysis_id": job.id, "sample_filter": sample_filter, "covariates": covariates}
+            for job, (sample_filter, covariates) in zip(analysis_jobs, variants)
+        ],
+        "message": f"Sweep of {n_variants} analyses submitted"
+    }
+
 @router.get("/{analysis_id}/status", response_model=AnalysisStatusResponse)
 async def get_analysis_status(
     analysis_id: int,
@@ -46,15 +164,107 @@ async def get_analysis_status(
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
+    # Live progress is newer than the periodically flushed DB value
+    live = progress_broker.get(analysis_id) or {}
+    
     return AnalysisStatusResponse(
         analysis_id=analysis.id,
-        status=analysis.status,
-        progress=analysis.progress,
+        status=live.get("status", analysis.status),
+        progress=live.get("progress", analysis.progress),
+        stage=live.get("stage"),
+        done=live.get("done"),
+        total=live.get("total"),
+        throughput=live.get("throughput"),
+        eta_seconds=live.get("eta_seconds"),
+        queue_position=get_scheduler().position(analysis.id),
         start_time=analysis.started_at,
         end_time=analysis.completed_at,
-        error_message=analysis.error_message
+        error_message=analysis.error_message,
+        annotation_status=analysis.annotation_status,
+        annotation_progress=analysis.annotation_progress
     )
 
+@router.get("/events")
+async def stream_all_progress():
+    """Server-Sent Events with progress of every running job"""
+    return StreamingResponse(progress_broker.stream(), media_type="text/event-stream")
+
+@router.get("/{analysis_id}/events")
+async def stream_analysis_progress(analysis_id: int):
+    """Server-Sent Events with live progress of one job"""
+    # Not using get_session: the session would be held open for the whole stream
+    with Session(engine) as session:
+        analysis = session.get(AnalysisJob, analysis_id)
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        snapshot = {"analysis_id": analysis.id, "status": analysis.status.value, "progress": analysis.progress}
+    
+    if progress_broker.get(analysis_id) is None and analysis.status in (AnalysisStatus.COMPLETED, AnalysisStatus.FAILED):
+        # Finished before this process tracked it: send the stored state once
+        async def stored_state():
+            yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+        return StreamingResponse(stored_state(), media_type="text/event-stream")
+    
+    return StreamingResponse(progress_broker.stream([analysis_id]), media_type="text/event-stream")
+
+@router.get("/{analysis_id}/qc")
+async def get_qc_report(
+    analysis_id: int,
+    session: Session = Depends(get_session)
+):
+    """Probes removed by pre-analysis QC, by reason"""
+    analysis = session.get(AnalysisJob, analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    if not analysis.qc_report:
+        raise HTTPException(status_code=404, detail="No QC report for this analysis")
+    return json.loads(analysis.qc_report)
+
+@router.get("/{analysis_id}/confounders")
+async def get_confounder_report(
+    analysis_id: int,
+    session: Session = Depends(get_session)
+):
+    """Estimated confounders that were added as covariates, with per-sample values"""
+    analysis = session.get(AnalysisJob, analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    if not analysis.confounder_report:
+        raise HTTPException(status_code=404, detail="No confounders were estimated for this analysis")
+    return json.loads(analysis.confounder_report)
+
+@router.get("/{analysis_id}/metrics")
+async def get_analysis_metrics(
+    analysis_id: int,
+    session: Session = Depends(get_session)
+):
+    """Wall time, CPU time, peak RSS and rows of each pipeline stage"""
+    analysis = session.get(AnalysisJob, analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    if not analysis.metrics:
+        raise HTTPException(status_code=404, detail="No metrics recorded for this analysis")
+    return json.loads(analysis.metrics)
+
+@router.get("/{analysis_id}/profile")
+async def get_analysis_profile(
+    analysis_id: int,
+    session: Session = Depends(get_session)
+):
+    """Sampled stacks of a slow job in collapsed-stack format (flamegraph.pl, speedscope)"""
+    analysis = session.get(AnalysisJob, analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    profile_path = json.loads(analysis.metrics).get("profile_path") if analysis.metrics else None
+    if not profile_path or not os.path.exists(profile_path):
+        raise HTTPException(status_code=404, detail="No profile for this analysis; enable PROFILER_ENABLED")
+    return FileResponse(profile_path, media_type="text/plain", filename=f"analysis_{analysis_id}.folded")
+
+@router.get("/queue")
+async def get_job_queue():
+    """Running and queued jobs with the scheduler's memory and CPU budgets"""
+    return get_scheduler().snapshot()
+
 @router.get("/all")
 async def list_analyses(session: Session = Depends(get_session)):
     analyses = session.query(AnalysisJob).filter(AnalysisJob.owner_id == 1).all()
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlmodel import Session
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
+from sqlmodel import Session, select
+from typing import Optional
 from app.db.session import get_session
-from app.db.models import AnalysisJob, AnalysisStatus
-from app.schemas.analysis import BatchAnalysisRequest, AnalysisResponse
-from app.tasks.ewas_tasks import run_ewas_analysis
+from app.db.models import AnalysisJob, AnalysisStatus, Batch
+from app.schemas.analysis import BatchAnalysisRequest, AnalysisResponse, MetaAnalysisRequest
+from app.core.cache import json_response
+from app.tasks.scheduler import schedule_analysis, EWAS_TASK
+from app.services.request_validation import validate_analysis_request
 import json
 
 router = APIRouter()
@@ -11,68 +15,102 @@ router = APIRouter()
 @router.post("/batch", response_model=dict)
 async def submit_batch_analysis(
     request: BatchAnalysisRequest,
-    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     """Submit multiple EWAS analyses as a batch"""
-    batch_ids = []
+    for analysis_req in request.analyses:
+        try:
+            validate_analysis_request(session, analysis_req)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    for i, analysis_req in enumerate(request.analyses):
-        analysis_job = AnalysisJob(
+    batch = Batch(name=request.batch_name, owner_id=1, total_analyses=len(request.analyses))
+    session.add(batch)
+    session.flush()
+    
+    analysis_jobs = [
+        AnalysisJob(
             name=f"{request.batch_name}_{i+1}_{analysis_req.phenotype_column}",
+            batch_id=batch.id,
             epigenome_file_id=analysis_req.epigenome_file_id,
             phenotype_file_id=analysis_req.phenotype_file_id,
             phenotype_column=analysis_req.phenotype_column,
             covariates=json.dumps(analysis_req.covariates),
             model_type=analysis_req.model_type,
+            case_level=analysis_req.case_level,
+            preprocessing=json.dumps(analysis_req.preprocessing),
+            confounders=analysis_req.confounders.model_dump_json() if analysis_req.confounders else None,
+            permutation=analysis_req.permutation.model_dump_json() if analysis_req.permutation else None,
+            sample_filter=json.dumps(analysis_req.sample_filter) if analysis_req.sample_filter else None,
+            incremental=analysis_req.incremental,
+            priority=analysis_req.priority,
             owner_id=1
         )
-        
-        session.add(analysis_job)
-        session.commit()
-        session.refresh(analysis_job)
-        
-        batch_ids.append(analysis_job.id)
-        
-        # Queue analysis
-        background_tasks.add_task(run_ewas_analysis, analysis_job.id)
+        for i, analysis_req in enumerate(request.analyses)
+    ]
+    
+    # One transaction for the whole batch; the flush assigns the job IDs
+    session.add_all(analysis_jobs)
+    session.flush()
+    batch_ids = [analysis_job.id for analysis_job in analysis_jobs]
+    session.commit()
+    
+    # Reload the committed jobs in one query rather than one refresh each
+    analysis_jobs = session.exec(select(AnalysisJob).where(AnalysisJob.batch_id == batch.id).order_by(AnalysisJob.id)).all()
+    
+    # Queue analyses; the scheduler admits jobs as memory and CPU slots allow
+    for analysis_job in analysis_jobs:
+        schedule_analysis(session, analysis_job, EWAS_TASK)
     
     return {
+        "batch_id": batch.id,
         "batch_name": request.batch_name,
         "analysis_ids": batch_ids,
         "total_analyses": len(batch_ids),
         "message": f"Batch of {len(batch_ids)} analyses submitted"
     }
 
-@router.get("/batch/{batch_name}/status")
+@router.get("/batch/{batch_id}/status")
 async def get_batch_status(
-    batch_name: str,
+    batch_id: int,
+    status: Optional[AnalysisStatus] = None,
+    limit: int = 100,
+    offset: int = 0,
     session: Session = Depends(get_session)
 ):
-    """Get status of all analyses in a batch"""
-    from sqlmodel import select
+    """Get aggregated status of a batch and a page of its analyses"""
+    batch = session.get(Batch, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
     
-    statement = select(AnalysisJob).where(AnalysisJob.name.like(f"{batch_name}_%"))
-    batch_analyses = session.exec(statement).all()
+    counts = dict(session.exec(
+        select(AnalysisJob.status, func.count())
+        .where(AnalysisJob.batch_id == batch_id)
+        .group_by(AnalysisJob.status)
+    ).all())
     
-    if not batch_analyses:
-        raise HTTPException(status_code=404, detail="Batch not found")
+    statement = select(AnalysisJob.id, AnalysisJob.name, AnalysisJob.status, AnalysisJob.progress).where(AnalysisJob.batch_id == batch_id)
+    if status is not None:
+        statement = statement.where(AnalysisJob.status == status)
+    page = session.exec(statement.order_by(AnalysisJob.id).offset(offset).limit(limit)).all()
     
     status_summary = {
-        "batch_name": batch_name,
-        "total_analyses": len(batch_analyses),
-        "completed": sum(1 for a in batch_analyses if a.status == AnalysisStatus.COMPLETED),
-        "running": sum(1 for a in batch_analyses if a.status == AnalysisStatus.RUNNING),
-        "pending": sum(1 for a in batch_analyses if a.status == AnalysisStatus.PENDING),
-        "failed": sum(1 for a in batch_analyses if a.status == AnalysisStatus.FAILED),
+        "batch_id": batch.id,
+        "batch_name": batch.name,
+        "created_at": batch.created_at,
+        "total_analyses": sum(counts.values()),
+        "completed": counts.get(AnalysisStatus.COMPLETED, 0),
+        "running": counts.get(AnalysisStatus.RUNNING, 0),
+        "pending": counts.get(AnalysisStatus.PENDING, 0),
+        "failed": counts.get(AnalysisStatus.FAILED, 0),
         "analyses": [
             {
-                "analysis_id": a.id,
-                "name": a.name,
-                "status": a.status,
-                "progress": a.progress
+                "analysis_id": analysis_id,
+                "name": name,
+                "status": analysis_status,
+                "progress": progress
             }
-            for a in batch_analyses
+            for analysis_id, name, analysis_status, progress in page
         ]
     }
     
@@ -82,57 +120,39 @@ async def get_batch_status(
 async def compare_analyses(
     analysis_id_1: int,
     analysis_id_2: int,
+    p_threshold: float = 0.05,
+    limit: int = 100,
     session: Session = Depends(get_session)
 ):
     """Compare results between two analyses"""
-    from sqlmodel import select
-    from app.db.models import AnalysisResult
+    from app.services.comparison_service import ComparisonService
     
-    # Get results for both analyses
-    results_1 = session.exec(
-        select(AnalysisResult).where(AnalysisResult.analysis_id == analysis_id_1)
-    ).all()
+    comparison = ComparisonService(session).compare_pair(analysis_id_1, analysis_id_2, p_threshold, limit)
     
-    results_2 = session.exec(
-        select(AnalysisResult).where(AnalysisResult.analysis_id == analysis_id_2)
-    ).all()
-    
-    if not results_1 or not results_2:
+    if comparison is None:
         raise HTTPException(status_code=404, detail="Results not found for comparison")
     
-    # Create comparison data
-    results_1_dict = {r.cpg_id: r for r in results_1}
-    results_2_dict = {r.cpg_id: r for r in results_2}
-    
-    common_cpgs = set(results_1_dict.keys()) & set(results_2_dict.keys())
-    
-    comparison_data = []
-    for cpg_id in common_cpgs:
-        r1 = results_1_dict[cpg_id]
-        r2 = results_2_dict[cpg_id]
-        
-        comparison_data.append({
-            "cpg_id": cpg_id,
-            "beta_1": r1.beta,
-            "beta_2": r2.beta,
-            "p_value_1": r1.p_value,
-            "p_value_2": r2.p_value,
-            "beta_diff": abs(r1.beta - r2.beta),
-            "consistent_direction": (r1.beta > 0) == (r2.beta > 0)
-        })
-    
-    # Calculate correlation
-    import numpy as np
-    betas_1 = [d["beta_1"] for d in comparison_data]
-    betas_2 = [d["beta_2"] for d in comparison_data]
-    
-    correlation = np.corrcoef(betas_1, betas_2)[0, 1] if len(betas_1) > 1 else 0
+    # Replication p-values and correlations can be NaN, which the default JSONResponse rejects
+    return json_response(comparison)
+
+@router.post("/meta-analysis")
+async def meta_analyze(
+    request: MetaAnalysisRequest,
+    session: Session = Depends(get_session)
+):
+    """Fixed- or random-effects meta-analysis across several analyses"""
+    if len(request.analysis_ids) < 2:
+        raise HTTPException(status_code=400, detail="At least two analyses are required")
     
-    return {
-        "analysis_1": analysis_id_1,
-        "analysis_2": analysis_id_2,
-        "common_cpgs": len(common_cpgs),
-        "beta_correlation": float(correlation),
-        "consistent_direction_pct": sum(d["consistent_direction"] for d in comparison_data) / len(comparison_data) * 100,
-        "comparison_data": comparison_data[:100]  # Limit for response size
-    }
\ No newline at end of file
+    if request.method not in ("fixed", "random"):
+        raise HTTPException(status_code=400, detail="method must be 'fixed' or 'random'")
+    
+    from app.services.comparison_service import ComparisonService
+    
+    meta = ComparisonService(session).meta_analysis(request.analysis_ids, request.method, request.limit)
+    
+    if meta is None:
+        raise HTTPException(status_code=404, detail="No shared results found for meta-analysis")
+    
+    # A zero standard error or degenerate beta gives NaN or infinite z-scores
+    return json_response(meta)
@@ -1,42 +1,53 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request, Header
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
-from typing import List
+from typing import List, Optional
+from app.core.config import settings
 from app.db.session import get_session
-from app.db.models import DataFile, FileType
+from app.db.models import DataFile, FileType, UploadSession
 from app.services.file_storage_service import FileStorageService
-from app.schemas.file import FileResponse
+from app.schemas.file import FileResponse, UploadSessionCreate, UploadSessionResponse
+import json
 
 router = APIRouter()
 
-@router.post("/upload/epigenome", response_model=FileResponse)
-async def upload_epigenome_file(
-    file: UploadFile = File(...),
-    session: Session = Depends(get_session)
-):
-    if not file.filename.endswith(('.tsv', '.csv', '.bed')):
-        raise HTTPException(status_code=400, detail="Invalid file format")
+async def _store_upload(file: UploadFile, file_type: FileType, session: Session) -> FileResponse:
+    from app.services.upload_service import register_upload
     
     storage_service = FileStorageService()
-    file_path = await storage_service.upload_file(file, FileType.EPIGENOME)
-    
-    db_file = DataFile(
-        filename=file.filename,
-        file_type=FileType.EPIGENOME,
-        file_path=file_path,
-        file_size=file.size or 0,
-        owner_id=1  # TODO: Get from current user
-    )
+    summary = await storage_service.save_upload(file, file_type)
+    
+    if not summary["validation"]["is_valid"]:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "File validation failed", "validation": summary["validation"]}
+        )
     
-    session.add(db_file)
-    session.commit()
-    session.refresh(db_file)
+    db_file, duplicate = register_upload(session, file.filename, file_type, summary)
     
+    return _file_response(db_file, "duplicate" if duplicate else "uploaded")
+
+def _file_response(db_file: DataFile, status: str) -> FileResponse:
     return FileResponse(
         file_id=db_file.id,
         filename=db_file.filename,
-        status="uploaded"
+        status=status,
+        sha256=db_file.sha256,
+        row_count=db_file.row_count,
+        column_count=db_file.column_count,
+        validation=json.loads(db_file.validation) if db_file.validation else None
     )
 
+@router.post("/upload/epigenome", response_model=FileResponse)
+async def upload_epigenome_file(
+    file: UploadFile = File(...),
+    session: Session = Depends(get_session)
+):
+    if not file.filename.endswith(('.tsv', '.csv', '.bed')):
+        raise HTTPException(status_code=400, detail="Invalid file format")
+    
+    return await _store_upload(file, FileType.EPIGENOME, session)
+
 @router.post("/upload/phenotype", response_model=FileResponse)
 async def upload_phenotype_file(
     file: UploadFile = File(...),
@@ -45,27 +56,146 @@ async def upload_phenotype_file(
     if not file.filename.endswith(('.csv', '.tsv')):
         raise HTTPException(status_code=400, detail="Invalid file format")
     
-    storage_service = FileStorageService()
-    file_path = await storage_service.upload_file(file, FileType.PHENOTYPE)
-    
-    db_file = DataFile(
-        filename=file.filename,
-        file_type=FileType.PHENOTYPE,
-        file_path=file_path,
-        file_size=file.size or 0,
-        owner_id=1  # TODO: Get from current user
+    return await _store_upload(file, FileType.PHENOTYPE, session)
+
+@router.post("/uploads", response_model=UploadSessionResponse)
+async def create_upload_session(
+    request: UploadSessionCreate,
+    session: Session = Depends(get_session)
+):
+    """Start a resumable chunked upload"""
+    try:
+        file_type = FileType(request.file_type)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    
+    from app.services.upload_service import ResumableUploadService
+    
+    upload = ResumableUploadService(session).create(request.filename, file_type, request.total_size)
+    return _upload_response(upload)
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    upload_id: str,
+    session: Session = Depends(get_session)
+):
+    """Current offset and running validation of an upload, used to resume it"""
+    from app.services.upload_service import ResumableUploadService
+    
+    upload = _get_upload(session, upload_id)
+    validation = ResumableUploadService(session).validation(upload) if upload.status == "active" else None
+    return _upload_response(upload, validation)
+
+@router.put("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    session: Session = Depends(get_session)
+):
+    """Append the raw request body at ``offset``"""
+    from app.services.upload_service import ResumableUploadService, UploadOffsetMismatch
+    
+    upload = _get_upload(session, upload_id)
+    if upload.status != "active":
+        raise HTTPException(status_code=400, detail=f"Upload is {upload.status}")
+    
+    upload_service = ResumableUploadService(session)
+    try:
+        upload = await upload_service.append(upload, offset, request.stream())
+    except UploadOffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return _upload_response(upload, upload_service.validation(upload))
+
+@router.post("/uploads/{upload_id}/complete", response_model=FileResponse)
+async def complete_upload(
+    upload_id: str,
+    session: Session = Depends(get_session)
+):
+    """Finish an upload; identical content already stored is deduplicated by hash"""
+    from app.services.upload_service import ResumableUploadService
+    
+    upload = _get_upload(session, upload_id)
+    if upload.status != "active":
+        raise HTTPException(status_code=400, detail=f"Upload is {upload.status}")
+    
+    try:
+        db_file, duplicate, validation = ResumableUploadService(session).complete(upload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if db_file is None:
+        raise HTTPException(status_code=400, detail={"message": "File validation failed", "validation": validation})
+    
+    return _file_response(db_file, "duplicate" if duplicate else "uploaded")
+
+def _get_upload(session: Session, upload_id: str) -> UploadSession:
+    upload = session.get(UploadSession, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+def _upload_response(upload: UploadSession, validation: dict = None) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        upload_id=upload.id,
+        filename=upload.filename,
+        offset=upload.offset,
+        total_size=upload.total_size,
+        status=upload.status,
+        chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        validation=validation
     )
+
+@router.get("/{file_id}/download")
+async def download_file(
+    file_id: int,
+    range: Optional[str] = Header(None),
+    session: Session = Depends(get_session)
+):
+    """Stream a stored file; honours a single ``Range: bytes=start-end`` header"""
+    db_file = session.get(DataFile, file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
     
-    session.add(db_file)
-    session.commit()
-    session.refresh(db_file)
+    storage_service = FileStorageService()
+    size = storage_service.file_size(db_file.file_path)
+    headers = {"Accept-Ranges": "bytes", "Content-Disposition": f'attachment; filename="{db_file.filename}"'}
     
-    return FileResponse(
-        file_id=db_file.id,
-        filename=db_file.filename,
-        status="uploaded"
+    if range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(storage_service.iter_file(db_file.file_path), media_type="application/octet-stream", headers=headers)
+    
+    start, end = _parse_range(range, size)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        storage_service.iter_file(db_file.file_path, start, end + 1),
+        status_code=206,
+        media_type="application/octet-stream",
+        headers=headers
     )
 
+def _parse_range(header: str, size: int):
+    try:
+        unit, spec = header.split("=", 1)
+        first, last = spec.strip().split("-", 1)
+        if unit.strip() != "bytes" or "," in spec:
+            raise ValueError
+        if first == "":
+            # Suffix range: the last N bytes
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Range header")
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
 @router.get("/", response_model=List[dict])
 async def list_files(session: Session = Depends(get_session)):
     files = session.query(DataFile).filter(DataFile.owner_id == 1).all()  # TODO: Filter by current user
@@ -73,9 +203,12 @@ async def list_files(session: Session = Depends(get_session)):
         {
             "file_id": f.id,
             "filename": f.filename,
-            "type": f.file_type,
-            "size_bytes": f.file_size,
-            "uploaded_at": f.uploaded_at
+            "type": f.type,
+            "size_bytes": f.size_bytes,
+            "uploaded_at": f.created_at,
+            "sha256": f.sha256,
+            "row_count": f.row_count,
+            "column_count": f.column_count
         }
         for f in files
-    ]
\ No newline at end of file
+    ]
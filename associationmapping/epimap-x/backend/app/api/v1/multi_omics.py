@@ -2,8 +2,6 @@ from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFi
 from sqlmodel import Session
 from app.db.session import get_session
 from app.db.models import AnalysisJob, AnalysisStatus, DataFile, FileType
-from app.services.multi_omics_service import MultiOmicsService
-from app.services.machine_learning_service import MachineLearningService
 from app.services.file_storage_service import FileStorageService
 from pydantic import BaseModel
 from typing import List, Optional
@@ -30,26 +28,20 @@ async def upload_expression_file(
     session: Session = Depends(get_session)
 ):
     """Upload gene expression data file"""
+    from app.services.upload_service import register_upload
+    
     storage_service = FileStorageService()
     
     try:
-        file_path = await storage_service.upload_file(file, FileType.EXPRESSION)
-        
-        db_file = DataFile(
-            filename=file.filename,
-            file_path=file_path,
-            size_bytes=file.size,
-            type=FileType.EXPRESSION,
-            owner_id=1
-        )
-        
-        session.add(db_file)
-        session.commit()
-        session.refresh(db_file)
+        summary = await storage_service.save_upload(file, FileType.EXPRESSION, require_valid=False)
+        db_file, duplicate = register_upload(session, file.filename, FileType.EXPRESSION, summary)
         
         return {
             "file_id": db_file.id,
             "filename": db_file.filename,
+            "sha256": db_file.sha256,
+            "duplicate": duplicate,
+            "validation": summary["validation"],
             "message": "Expression file uploaded successfully"
         }
     except Exception as e:
@@ -222,12 +214,9 @@ async def predict_with_model(
 
 async def run_integration_analysis(analysis_id: int, expression_file_id: int):
     """Background task for multi-omics integration"""
-    from sqlmodel import create_engine
-    from app.core.config import settings
+    from app.db.session import engine
     from datetime import datetime
     
-    engine = create_engine(settings.DATABASE_URL)
-    
     with Session(engine) as session:
         try:
             analysis = session.get(AnalysisJob, analysis_id)
@@ -274,12 +263,9 @@ async def run_integration_analysis(analysis_id: int, expression_file_id: int):
 
 async def train_ml_model_task(analysis_id: int, model_type: str):
     """Background task for ML model training"""
-    from sqlmodel import create_engine
-    from app.core.config import settings
+    from app.db.session import engine
     from datetime import datetime
     
-    engine = create_engine(settings.DATABASE_URL)
-    
     with Session(engine) as session:
         try:
             analysis = session.get(AnalysisJob, analysis_id)
@@ -1,104 +1,216 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
 from app.db.session import get_session
-from app.db.models import AnalysisResult, AnalysisJob
-from typing import List
-import numpy as np
+from app.db.models import AnalysisJob, AnalysisStatus
+from app.core.cache import cached_response
+from app.core.options import EXPORT_FORMATS
+from typing import List, Optional
+
+# Services (and numpy/pandas behind them) are imported where a response is computed,
+# so cached responses and worker startup never load them
 
 router = APIRouter()
 
+def _get_analysis(session: Session, analysis_id: int) -> AnalysisJob:
+    analysis = session.get(AnalysisJob, analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return analysis
+
+def _neg_log10(p_values):
+    import numpy as np
+    return -np.log10(np.clip(p_values, 1e-300, None))  # Avoid log(0)
+
+@router.get("/{analysis_id}/summary")
+async def get_results_summary(
+    analysis_id: int,
+    session: Session = Depends(get_session)
+):
+    """Summary statistics stored with the analysis"""
+    analysis = _get_analysis(session, analysis_id)
+    return {
+        "analysis_id": analysis_id,
+        "n_tests": analysis.n_tests,
+        "n_significant": analysis.n_significant,
+        "min_p_value": analysis.min_p_value,
+        "lambda_gc": analysis.lambda_gc,
+        "store": "parquet" if analysis.result_path else "sql"
+    }
+
 @router.get("/{analysis_id}/manhattan")
 async def get_manhattan_data(
     analysis_id: int,
+    request: Request,
+    chromosome: Optional[str] = None,
+    max_p: Optional[float] = None,
     session: Session = Depends(get_session)
 ):
-    # Verify analysis exists
-    analysis = session.get(AnalysisJob, analysis_id)
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
+    analysis = _get_analysis(session, analysis_id)
     
-    # Get results
-    statement = select(AnalysisResult).where(AnalysisResult.analysis_id == analysis_id)
-    results = session.exec(statement).all()
-    
-    manhattan_data = []
-    for result in results:
-        log10_p = -np.log10(max(result.p_value, 1e-300))  # Avoid log(0)
-        manhattan_data.append({
-            "chrom": result.chromosome,
-            "pos": result.position,
-            "p_value": result.p_value,
-            "log10_p": log10_p,
-            "cpg_id": result.cpg_id
+    def compute():
+        import pandas as pd
+        from app.services.result_store import ResultRepository, to_records
+        
+        # Only the plotted columns are read; chromosome/p-value filters are applied inside the store
+        df = ResultRepository(session).frame(
+            analysis, ["chromosome", "position", "p_value", "cpg_id"], chromosome=chromosome, max_p=max_p
+        )
+        
+        manhattan_data = pd.DataFrame({
+            "chrom": df["chromosome"],
+            "pos": df["position"],
+            "p_value": df["p_value"],
+            "log10_p": _neg_log10(df["p_value"].to_numpy(dtype=float)),
+            "cpg_id": df["cpg_id"]
         })
+        return to_records(manhattan_data)
     
-    return manhattan_data
+    return cached_response(request, analysis, compute)
 
 @router.get("/{analysis_id}/qqplot_data")
 async def get_qqplot_data(
     analysis_id: int,
+    request: Request,
     session: Session = Depends(get_session)
 ):
-    # Verify analysis exists
-    analysis = session.get(AnalysisJob, analysis_id)
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
-    
-    # Get p-values
-    statement = select(AnalysisResult.p_value).where(AnalysisResult.analysis_id == analysis_id)
-    p_values = session.exec(statement).all()
-    
-    if not p_values:
-        return []
-    
-    # Calculate expected vs observed
-    p_values = np.array(p_values)
-    p_values = p_values[~np.isnan(p_values)]  # Remove NaN values
-    p_values = np.sort(p_values)
+    analysis = _get_analysis(session, analysis_id)
     
-    n = len(p_values)
-    expected = np.arange(1, n + 1) / (n + 1)
+    def compute():
+        import numpy as np
+        import pandas as pd
+        from app.services.result_store import ResultRepository, to_records
+        
+        # Get p-values
+        p_values = ResultRepository(session).frame(analysis, ["p_value"])["p_value"].to_numpy(dtype=float)
+        
+        if not len(p_values):
+            return []
+        
+        # Calculate expected vs observed
+        p_values = p_values[~np.isnan(p_values)]  # Remove NaN values
+        p_values = np.sort(p_values)
+        
+        n = len(p_values)
+        expected = np.arange(1, n + 1) / (n + 1)
+        
+        return to_records(pd.DataFrame({
+            "expected": -np.log10(expected),
+            "observed": _neg_log10(p_values)
+        }))
     
-    qq_data = []
-    for i in range(n):
-        qq_data.append({
-            "expected": -np.log10(expected[i]),
-            "observed": -np.log10(max(p_values[i], 1e-300))
-        })
-    
-    return qq_data
+    return cached_response(request, analysis, compute)
 
 @router.get("/{analysis_id}/table")
 async def get_results_table(
     analysis_id: int,
+    request: Request,
     limit: int = 100,
     offset: int = 0,
     session: Session = Depends(get_session)
 ):
-    # Verify analysis exists
-    analysis = session.get(AnalysisJob, analysis_id)
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
+    analysis = _get_analysis(session, analysis_id)
+    
+    def compute():
+        from app.services.result_store import ResultRepository, to_records
+        return to_records(ResultRepository(session).top(analysis, limit, offset).drop(columns=["se"]))
     
     # Get results with pagination, ordered by p-value
-    statement = (
-        select(AnalysisResult)
-        .where(AnalysisResult.analysis_id == analysis_id)
-        .order_by(AnalysisResult.p_value)
-        .offset(offset)
-        .limit(limit)
+    return cached_response(request, analysis, compute)
+
+@router.get("/{analysis_id}/export")
+async def export_results(
+    analysis_id: int,
+    format: str = "csv",
+    session: Session = Depends(get_session)
+):
+    """Download every result of an analysis as CSV, TSV.gz or Parquet, streamed batch by batch"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    analysis = _get_analysis(session, analysis_id)
+    
+    from app.services.result_export import ResultExporter
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        ResultExporter(analysis.id).stream(format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="analysis_{analysis_id}_results.{extension}"'}
     )
-    results = session.exec(statement).all()
-    
-    table_data = []
-    for result in results:
-        table_data.append({
-            "cpg_id": result.cpg_id,
-            "chromosome": result.chromosome,
-            "position": result.position,
-            "beta": result.beta,
-            "p_value": result.p_value,
-            "fdr": result.fdr
-        })
+
+@router.get("/{analysis_id}/region")
+async def get_region_results(
+    analysis_id: int,
+    chromosome: str,
+    request: Request,
+    start: int = 0,
+    end: Optional[int] = None,
+    session: Session = Depends(get_session)
+):
+    """All results inside a genomic window, in position order"""
+    analysis = _get_analysis(session, analysis_id)
+    
+    def compute():
+        from app.services.result_store import ResultRepository, to_records
+        results = ResultRepository(session).frame(analysis, chromosome=chromosome, start=start, end=end)
+        return to_records(results.sort_values("position", kind="stable"))
+    
+    return cached_response(request, analysis, compute)
+
+@router.get("/compare/{analysis_id_1}/{analysis_id_2}")
+async def compare_results(
+    analysis_id_1: int,
+    analysis_id_2: int,
+    request: Request,
+    p_threshold: float = 0.05,
+    limit: int = 100,
+    session: Session = Depends(get_session)
+):
+    """Compare two result sets on their shared CpGs"""
+    analysis_1 = _get_analysis(session, analysis_id_1)
+    analysis_2 = _get_analysis(session, analysis_id_2)
+    
+    def compute():
+        from app.services.comparison_service import ComparisonService
+        comparison = ComparisonService(session).compare_pair(analysis_id_1, analysis_id_2, p_threshold, limit)
+        if comparison is None:
+            raise HTTPException(status_code=404, detail="No shared CpGs found between the analyses")
+        return comparison
+    
+    return cached_response(request, analysis_1, compute, related=[analysis_2])
+
+@router.post("/{analysis_id}/dmr")
+async def find_differential_regions(
+    analysis_id: int,
+    max_distance: Optional[int] = None,
+    seed_p: Optional[float] = None,
+    min_cpgs: Optional[int] = None,
+    session: Session = Depends(get_session)
+):
+    """Detect differentially methylated regions and store them with the analysis"""
+    analysis = _get_analysis(session, analysis_id)
+    if analysis.status != AnalysisStatus.COMPLETED:
+        raise HTTPException(status_code=400, detail="Analysis must be completed first")
+    
+    from app.services.dmr_service import DMRService
+    
+    service = DMRService(max_distance=max_distance, seed_p=seed_p, min_cpgs=min_cpgs)
+    return service.run(session, analysis)
+
+@router.get("/{analysis_id}/dmr")
+async def get_differential_regions(
+    analysis_id: int,
+    request: Request,
+    max_p: Optional[float] = None,
+    limit: int = 100,
+    offset: int = 0,
+    session: Session = Depends(get_session)
+):
+    """Stored regions, most significant first"""
+    analysis = _get_analysis(session, analysis_id)
+    
+    def compute():
+        from app.services.dmr_service import stored_regions
+        return [region.model_dump(exclude={"id", "analysis_id"}) for region in stored_regions(session, analysis_id, max_p, limit, offset)]
     
-    return table_data
\ No newline at end of file
+    return cached_response(request, analysis, compute)
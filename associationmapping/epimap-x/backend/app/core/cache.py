@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+from fastapi import Request, Response
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Two-tier cache of serialized JSON responses: an in-process LRU in front of an optional Redis.
+
+    Keys embed the analysis's ``results_version``, which changes whenever its
+    results are rewritten, so entries never need to be expired by time.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024, redis_url: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._redis = _connect_redis(redis_url) if redis_url else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+
+        if self._redis is not None:
+            try:
+                body = self._redis.get(f"response:{key}")
+            except Exception as e:
+                logger.warning("Redis cache read failed: %s", e)
+                body = None
+            if body is not None:
+                self._put_local(key, body)
+                with self._lock:
+                    self.hits += 1
+                return body
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, body: bytes):
+        self._put_local(key, body)
+        if self._redis is not None:
+            try:
+                self._redis.set(f"response:{key}", body, ex=settings.RESPONSE_CACHE_REDIS_TTL)
+            except Exception as e:
+                logger.warning("Redis cache write failed: %s", e)
+
+    def invalidate(self, analysis_id: int):
+        """Drop local entries of an analysis; Redis entries become unreachable once its version changes"""
+        prefix = f"{analysis_id}:"
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._size -= len(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _put_local(self, key: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+def _connect_redis(redis_url: str):
+    try:
+        import redis
+        client = redis.Redis.from_url(redis_url)
+        client.ping()
+        return client
+    except Exception as e:
+        logger.warning("Redis response cache disabled: %s", e)
+        return None
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    redis_url=settings.REDIS_URL if settings.RESPONSE_CACHE_REDIS else None
+)
+
+def _is_cacheable(analysis) -> bool:
+    from app.db.models import AnalysisStatus
+    return (
+        analysis.status == AnalysisStatus.COMPLETED
+        and analysis.annotation_status not in (AnalysisStatus.PENDING, AnalysisStatus.RUNNING)
+    )
+
+def _json_default(value):
+    # numpy scalars and similar
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+def _finite(value):
+    """``value`` with NaN and infinite floats (numpy ones included) replaced by None"""
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    if isinstance(value, float) or (getattr(getattr(value, "dtype", None), "kind", None) == "f" and getattr(value, "ndim", 1) == 0):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    return value
+
+def _serialize(data: Any) -> bytes:
+    # Strict JSON like Starlette's JSONResponse: browsers' JSON.parse rejects bare NaN and Infinity
+    try:
+        return json.dumps(data, default=_json_default, allow_nan=False).encode()
+    except ValueError:
+        return json.dumps(_finite(data), default=_json_default, allow_nan=False).encode()
+
+def json_response(data: Any) -> Response:
+    """Uncached strict-JSON response; NaN and infinite values become null instead of failing"""
+    return Response(content=_serialize(data), media_type="application/json")
+
+def cached_response(request: Request, analysis, compute: Callable[[], Any], related: Iterable = (), extra: str = "") -> Response:
+    """Serve ``compute()`` for a completed analysis from cache, answering If-None-Match with 304.
+
+    The key covers the analysis (and any ``related`` analyses the response is
+    built from), their results versions, the route and the query string;
+    ``extra`` adds anything else the response depends on.
+    """
+    analyses = [analysis, *related]
+    if not settings.RESPONSE_CACHE_ENABLED or not all(_is_cacheable(a) for a in analyses):
+        return json_response(compute())
+
+    versions = ",".join(f"{a.id}.{a.results_version}" for a in analyses)
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    key = f"{analysis.id}:{versions}:{request.url.path}?{query}:{extra}"
+    etag = f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    # The ETag is derived from the key alone, so a revalidation needs no lookup at all
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key)
+    if body is None:
+        body = _serialize(compute())
+        response_cache.set(key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -3,17 +3,124 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     # SQLite for local development
     DATABASE_URL: str = "sqlite:///./epimap.db"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    SQLITE_BUSY_TIMEOUT_MS: int = 30000
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
     REDIS_URL: str = "redis://localhost:6379"
     MINIO_ENDPOINT: str = "localhost:9000"
     MINIO_ACCESS_KEY: str = "minioadmin"
     MINIO_SECRET_KEY: str = "minioadmin"
     MINIO_BUCKET_NAME: str = "epimap-data"
+    MINIO_SECURE: bool = False
     SECRET_KEY: str = "your-secret-key-here"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
-    # Local file storage fallback
+    # File storage
+    # "local", "s3" (MinIO/AWS, needs boto3) or "s3-local" (directory-backed S3 stand-in)
+    STORAGE_BACKEND: str = "local"
     LOCAL_STORAGE_PATH: str = "./uploads"
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    # Result storage: "sql" (AnalysisResult rows) or "parquet" (one file per analysis, needs pyarrow)
+    RESULT_STORE: str = "sql"
+    RESULT_STORE_PATH: str = "./results"
+    RESULT_STORE_COMPRESSION: str = "zstd"
+    RESULT_STORE_ROW_GROUP_SIZE: int = 100_000
+    RESULT_STORE_TOP_ROWS: int = 10_000  # best rows also kept in p-value order for the result table
+    EXPORT_BATCH_SIZE: int = 50_000
+    EXPORT_COMPRESSION_LEVEL: int = 6
+
+    # Response cache for completed analyses (in-process LRU, optionally backed by Redis)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 256
+    RESPONSE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    RESPONSE_CACHE_REDIS: bool = False
+    RESPONSE_CACHE_REDIS_TTL: int = 7 * 24 * 3600
+
+    # Probe QC before modelling
+    QC_ENABLED: bool = True
+    QC_MAX_MISSING_RATE: float = 0.2
+    QC_MIN_VARIANCE: float = 1e-12
+    QC_MIN_SAMPLES: int = 10
+    QC_MAX_DETECTION_FAILURE_RATE: float = 0.1
+    QC_DETECTION_P_THRESHOLD: float = 0.01
+    QC_BLACKLIST_PATH: str = "./probe_blacklists"
+    QC_REPORT_EXAMPLES: int = 20
+
+    # Preprocessing pipeline artifacts (keyed by input hash and steps); least recently used are evicted above the cap
+    PREPROCESSING_CACHE_PATH: str = "./cache/preprocessed"
+    PREPROCESSING_CACHE_MAX_BYTES: int = 20 * 1024 * 1024 * 1024  # 0 disables the cache
+    PREPROCESSING_BETA_OFFSET: float = 1e-6
+
+    # Confounder estimation: surrogate variables (randomized SVD) or reference-based cell proportions
+    CONFOUNDER_MAX_COMPONENTS: int = 10
+    CONFOUNDER_OVERSAMPLING: int = 10
+    CONFOUNDER_POWER_ITERATIONS: int = 2
+    CELL_REFERENCE_PATH: str = "./cell_references"
+
+    # Permutation testing (empirical and max-T p-values)
+    PERMUTATION_COUNT: int = 1000
+    PERMUTATION_BATCH_SIZE: int = 256
+    PERMUTATION_STOP_HITS: int = 20
+
+    # Differentially methylated regions (comb-p style)
+    DMR_MAX_DISTANCE: int = 750
+    DMR_ACF_STEP: int = 50
+    DMR_SEED_P: float = 1e-3
+    DMR_MIN_CPGS: int = 3
+    DMR_MIN_PAIRS: int = 10
+
+    # Block checkpoints and recovery of jobs orphaned by a restart
+    CHECKPOINT_ENABLED: bool = True
+    CHECKPOINT_PATH: str = "./checkpoints"
+    JOB_WATCHDOG_ENABLED: bool = True
+    JOB_WATCHDOG_INTERVAL: float = 60.0
+    JOB_HEARTBEAT_TIMEOUT: float = 900.0
+    JOB_HEARTBEAT_INTERVAL: float = 60.0  # running jobs refresh their heartbeat this often
+    JOB_MAX_ATTEMPTS: int = 3
+
+    # Per-CpG sufficient statistics kept by incremental analyses, so new samples can be folded in later
+    SUFFICIENT_STATS_PATH: str = "./sufficient_stats"
+
+    # Job admission: a job starts only when its estimated memory and a CPU slot are free
+    SCHEDULER_CPU_SLOTS: int = 0  # 0 = number of CPUs
+    SCHEDULER_MEMORY_BUDGET: int = 0  # bytes; 0 = SCHEDULER_MEMORY_FRACTION of physical RAM
+    SCHEDULER_MEMORY_FRACTION: float = 0.7
+    SCHEDULER_MEMORY_FACTOR: float = 3.0
+    SCHEDULER_JOB_BASE_MEMORY: int = 200 * 1024 * 1024
+
+    # Per-stage job metrics (stored on the job, exported at /metrics) and the opt-in sampling profiler
+    METRICS_ENABLED: bool = True
+    METRICS_RSS_SAMPLE_INTERVAL: float = 0.1
+    PROFILER_ENABLED: bool = False
+    PROFILER_INTERVAL: float = 0.01
+    PROFILER_MIN_JOB_SECONDS: float = 60.0  # only jobs at least this slow keep their profile
+    PROFILE_PATH: str = "./profiles"
+
+    # Analysis execution and live progress
+    EWAS_CHUNK_SIZE: int = 1000
+    SWEEP_MAX_VARIANTS: int = 64
+    PROGRESS_FLUSH_SECONDS: float = 5.0
+    PROGRESS_POLL_SECONDS: float = 0.5
+    PROGRESS_HEARTBEAT_SECONDS: float = 15.0
+
+    # Remote annotation (Ensembl REST)
+    ANNOTATION_BASE_URL: str = "https://rest.ensembl.org"
+    ANNOTATION_MAX_CONCURRENCY: int = 8
+    ANNOTATION_REQUESTS_PER_SECOND: float = 15.0
+    ANNOTATION_MAX_RETRIES: int = 3
+    ANNOTATION_BACKOFF_BASE: float = 0.5
+    ANNOTATION_TIMEOUT: float = 30.0
+    ANNOTATION_WINDOW_SIZE: int = 1_000_000
+    ANNOTATION_CACHE_PATH: str = "./cache/annotation_cache.db"
+    ANNOTATION_CHUNK_SIZE: int = 500
+
+    # Directory of GO/KEGG-style .gmt gene set files used for enrichment
+    GENESET_PATH: str = "./genesets"
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,280 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.core.config import settings
+
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # No procfs: fall back to the lifetime peak
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class StageRecord:
+    """Handle yielded by ``stage``; set ``rows`` to the number of items the stage processed"""
+
+    def __init__(self, name: str, rows: Optional[int] = None):
+        self.name = name
+        self.rows = rows
+
+class MetricsRegistry:
+    """Process-wide aggregates of finished stages and jobs, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict] = {}
+        self._jobs: Counter = Counter()
+        self._job_durations = _histogram()
+
+    def observe_stage(self, name: str, wall: float, cpu: float, peak_rss: int, rows: Optional[int]):
+        with self._lock:
+            stage = self._stages.setdefault(name, {"duration": _histogram(), "cpu": 0.0, "rows": 0, "peak_rss": 0})
+            _observe(stage["duration"], wall)
+            stage["cpu"] += cpu
+            stage["rows"] += rows or 0
+            stage["peak_rss"] = peak_rss
+
+    def observe_job(self, status: str, wall: float):
+        with self._lock:
+            self._jobs[status] += 1
+            _observe(self._job_durations, wall)
+
+    def render(self, gauges: Optional[List[Tuple[str, str, Dict[str, str], float]]] = None) -> str:
+        """Exposition text; ``gauges`` adds (name, help, labels, value) samples read at scrape time"""
+        lines = []
+        with self._lock:
+            lines += _render_histogram(
+                "epimap_stage_duration_seconds", "Wall time of analysis pipeline stages",
+                {name: stage["duration"] for name, stage in self._stages.items()}, "stage"
+            )
+            lines += _render_samples("epimap_stage_cpu_seconds_total", "counter", "CPU time of the job thread per stage",
+                                     [({"stage": name}, stage["cpu"]) for name, stage in self._stages.items()])
+            lines += _render_samples("epimap_stage_rows_total", "counter", "Rows (CpGs or results) processed per stage",
+                                     [({"stage": name}, stage["rows"]) for name, stage in self._stages.items()])
+            lines += _render_samples("epimap_stage_peak_rss_bytes", "gauge", "Peak process RSS during the latest run of each stage",
+                                     [({"stage": name}, stage["peak_rss"]) for name, stage in self._stages.items()])
+            lines += _render_samples("epimap_jobs_finished_total", "counter", "Instrumented analysis jobs by final status",
+                                     [({"status": status}, count) for status, count in sorted(self._jobs.items())])
+            lines += _render_histogram("epimap_job_duration_seconds", "Wall time of instrumented analysis jobs",
+                                       {None: self._job_durations}, None)
+        grouped: "OrderedDict[str, Tuple[str, List]]" = OrderedDict()
+        for name, help_text, labels, value in gauges or []:
+            grouped.setdefault(name, (help_text, []))[1].append((labels, value))
+        for name, (help_text, samples) in grouped.items():
+            lines += _render_samples(name, "gauge", help_text, samples)
+        return "\n".join(lines) + "\n"
+
+def _histogram() -> Dict:
+    return {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0}
+
+def _observe(histogram: Dict, value: float):
+    for i, bound in enumerate(DURATION_BUCKETS):
+        if value <= bound:
+            histogram["buckets"][i] += 1
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+def _number(value) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _render_samples(name: str, kind: str, help_text: str, samples: List[Tuple[Dict, float]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples]
+    return lines
+
+def _render_histogram(name: str, help_text: str, histograms: Dict, label: Optional[str]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, histogram in histograms.items():
+        base = {label: key} if label else {}
+        for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+            lines.append(f"{name}_bucket{_labels({**base, 'le': f'{bound:g}'})} {count}")
+        lines.append(f"{name}_bucket{_labels({**base, 'le': '+Inf'})} {histogram['count']}")
+        lines.append(f"{name}_sum{_labels(base)} {_number(histogram['sum'])}")
+        lines.append(f"{name}_count{_labels(base)} {histogram['count']}")
+    return lines
+
+registry = MetricsRegistry()
+_current: ContextVar[Optional["JobMetrics"]] = ContextVar("job_metrics", default=None)
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None) -> Iterator[StageRecord]:
+    """Time a pipeline stage of the job running in this context; a no-op outside instrumented jobs"""
+    metrics = _current.get()
+    if metrics is None:
+        yield StageRecord(name, rows)
+        return
+    with metrics.stage(name, rows) as record:
+        yield record
+
+class JobMetrics:
+    """Per-stage wall time, CPU time, peak RSS and row counts of one analysis job.
+
+    ``activate`` makes the instance current for the job's thread, so services
+    can mark stages with ``stage(...)`` without it being passed around. A
+    sampler thread tracks peak RSS (process-wide) and, with the profiler
+    enabled, samples the job thread's stack; jobs slower than
+    PROFILER_MIN_JOB_SECONDS keep the samples as a collapsed-stack file
+    (flamegraph.pl / speedscope format). CPU time is that of the job's
+    thread, so work done in BLAS or other worker threads is not included.
+    """
+
+    def __init__(self, analysis_id: int, profile: Optional[bool] = None):
+        self.analysis_id = analysis_id
+        self.profile = settings.PROFILER_ENABLED if profile is None else profile
+        self.stages: "OrderedDict[str, Dict]" = OrderedDict()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._stacks: Counter = Counter()
+        self._stage_peak = 0
+        self._peak = 0
+        self._started = self._started_cpu = None
+        self._report = None
+
+    @contextmanager
+    def activate(self):
+        if not settings.METRICS_ENABLED:
+            yield self
+            return
+        token = _current.set(self)
+        self._thread_id = threading.get_ident()
+        self._started, self._started_cpu = time.perf_counter(), time.thread_time()
+        self._peak = self._stage_peak = current_rss()
+        self._sampler = threading.Thread(target=self._sample, name=f"metrics-{self.analysis_id}", daemon=True)
+        self._sampler.start()
+        try:
+            yield self
+        finally:
+            self._stop_sampler()
+            _current.reset(token)
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[StageRecord]:
+        record = StageRecord(name, rows)
+        self._stage_peak = current_rss()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            peak = max(self._stage_peak, current_rss())
+            self._peak = max(self._peak, peak)
+            # A stage entered several times (e.g. cache writes) accumulates into one entry
+            entry = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_bytes": 0, "rows": None, "calls": 0})
+            entry["wall_seconds"] += wall
+            entry["cpu_seconds"] += cpu
+            entry["peak_rss_bytes"] = max(entry["peak_rss_bytes"], peak)
+            if record.rows is not None:
+                entry["rows"] = (entry["rows"] or 0) + int(record.rows)
+            entry["calls"] += 1
+            registry.observe_stage(name, wall, cpu, peak, record.rows)
+
+    def report(self, status: str) -> Optional[Dict]:
+        """Stop sampling and summarize the job; None when metrics are disabled"""
+        if self._started is None:
+            return None
+        if self._report is not None:
+            return self._report
+        wall = time.perf_counter() - self._started
+        cpu = time.thread_time() - self._started_cpu
+        self._stop_sampler()
+        registry.observe_job(status, wall)
+
+        self._report = {
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "peak_rss_bytes": max(self._peak, current_rss()),
+            "stages": [
+                {
+                    "stage": name,
+                    "wall_seconds": round(entry["wall_seconds"], 4),
+                    "cpu_seconds": round(entry["cpu_seconds"], 4),
+                    "peak_rss_bytes": entry["peak_rss_bytes"],
+                    "rows": entry["rows"],
+                    "rows_per_second": round(entry["rows"] / entry["wall_seconds"], 1) if entry["rows"] and entry["wall_seconds"] > 0 else None,
+                    "calls": entry["calls"]
+                }
+                for name, entry in self.stages.items()
+            ],
+            "profile_path": self._dump_profile() if self.profile and wall >= settings.PROFILER_MIN_JOB_SECONDS else None
+        }
+        return self._report
+
+    def _sample(self):
+        interval = settings.PROFILER_INTERVAL if self.profile else settings.METRICS_RSS_SAMPLE_INTERVAL
+        next_rss = 0.0
+        while not self._stop.wait(interval):
+            now = time.perf_counter()
+            if now >= next_rss:
+                rss = current_rss()
+                self._stage_peak = max(self._stage_peak, rss)
+                self._peak = max(self._peak, rss)
+                next_rss = now + settings.METRICS_RSS_SAMPLE_INTERVAL
+            if self.profile:
+                frame = sys._current_frames().get(self._thread_id)
+                if frame is not None:
+                    self._stacks[_collapse(frame)] += 1
+
+    def _stop_sampler(self):
+        self._stop.set()
+        if self._sampler is not None and self._sampler is not threading.current_thread():
+            self._sampler.join()
+
+    def _dump_profile(self) -> Optional[str]:
+        if not self._stacks:
+            return None
+        os.makedirs(settings.PROFILE_PATH, exist_ok=True)
+        path = os.path.join(settings.PROFILE_PATH, f"analysis_{self.analysis_id}.folded")
+        with open(path, "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+def _collapse(frame, max_depth: int = 128) -> str:
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def render_metrics() -> str:
+    """Prometheus exposition of job metrics, plus job counts, scheduler state and process memory"""
+    from sqlalchemy import func
+    from sqlmodel import Session, select
+    from app.db.session import engine
+    from app.db.models import AnalysisJob
+    from app.tasks.scheduler import get_scheduler
+
+    gauges = [("epimap_process_resident_memory_bytes", "Resident memory of the API process", {}, current_rss())]
+    with Session(engine) as session:
+        counts = session.exec(select(AnalysisJob.status, func.count()).group_by(AnalysisJob.status)).all()
+    gauges += [("epimap_analysis_jobs", "Analysis jobs by status", {"status": getattr(status, "value", status)}, count) for status, count in counts]
+
+    snapshot = get_scheduler().snapshot()
+    gauges += [
+        ("epimap_scheduler_running_jobs", "Jobs admitted by the scheduler", {}, len(snapshot["running"])),
+        ("epimap_scheduler_queued_jobs", "Jobs waiting for memory or a CPU slot", {}, len(snapshot["queued"])),
+        ("epimap_scheduler_memory_reserved_bytes", "Estimated memory of running jobs", {}, snapshot["memory_reserved"]),
+        ("epimap_scheduler_memory_budget_bytes", "Memory budget of the scheduler", {}, snapshot["memory_budget"])
+    ]
+    return registry.render(gauges)
@@ -0,0 +1,75 @@
+from typing import Dict, List, Optional
+
+# Names requests are validated against. They live here, away from the
+# services that implement them, so the API can check a request without
+# importing numpy/pandas/statsmodels; the services import them from here.
+
+MODEL_TYPES = ("linear_regression", "logistic_regression", "poisson_regression", "negative_binomial")
+
+PREPROCESSING_STEPS = ("m_values", "quantile", "standardize_covariates")
+
+# Preprocessing steps computed across samples; new samples could not be transformed the same way
+CROSS_SAMPLE_STEPS = ("quantile", "standardize_covariates")
+
+CONFOUNDER_METHODS = ("sva", "cell_type")
+
+ANNOTATION_SOURCES = ("auto", "local", "remote")
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "tsv.gz": ("application/gzip", "tsv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+def check_sample_filter(sample_filter: Optional[Dict]):
+    """Raise ValueError for conditions ``sample_mask`` cannot apply"""
+    for column, condition in (sample_filter or {}).items():
+        if isinstance(condition, dict):
+            if not condition or set(condition) - {"min", "max"}:
+                raise ValueError(f"Range filter on '{column}' takes only 'min' and/or 'max'")
+            if any(not isinstance(v, (int, float)) for v in condition.values() if v is not None):
+                raise ValueError(f"Range filter on '{column}' needs numeric bounds")
+        elif isinstance(condition, list) and not condition:
+            raise ValueError(f"Filter on '{column}' allows no values")
+
+# Two-level phenotype labels recognised as case / control when a logistic request gives no case_level
+CASE_LABELS = ("case", "cases", "1", "yes", "y", "affected", "true", "positive", "disease", "patient")
+CONTROL_LABELS = ("control", "controls", "0", "no", "n", "unaffected", "false", "negative", "healthy", "normal")
+
+def resolve_case_level(levels: List, case_level: Optional[str] = None):
+    """The one of two phenotype ``levels`` a logistic model codes as 1; ValueError when it is not clear which
+
+    An explicit ``case_level`` must name one of the levels. Otherwise numeric
+    codings (0/1, 1/2) take the larger value, and text labels are matched
+    against CASE_LABELS and CONTROL_LABELS.
+    """
+    if len(levels) != 2:
+        raise ValueError(f"logistic_regression needs a phenotype with exactly two values, got {len(levels)}")
+    if case_level is not None:
+        matches = [level for level in levels if _same_level(level, case_level)]
+        if len(matches) != 1:
+            raise ValueError(f"case_level '{case_level}' is not one of the phenotype values: {', '.join(map(str, levels))}")
+        return matches[0]
+    numbers = [_as_number(level) for level in levels]
+    if None not in numbers:
+        return levels[numbers.index(max(numbers))]
+    labels = [str(level).strip().lower() for level in levels]
+    cases = [level for level, label in zip(levels, labels) if label in CASE_LABELS]
+    controls = [level for level, label in zip(levels, labels) if label in CONTROL_LABELS]
+    if len(cases) == 1 and cases[0] not in controls:
+        return cases[0]
+    if len(controls) == 1 and not cases:
+        return levels[1 - levels.index(controls[0])]
+    raise ValueError(f"Cannot tell which of {', '.join(map(str, levels))} is the case; set case_level")
+
+def _as_number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _same_level(level, case_level: str) -> bool:
+    if str(level).strip() == case_level.strip():
+        return True
+    level_number, case_number = _as_number(level), _as_number(case_level)
+    return level_number is not None and level_number == case_number
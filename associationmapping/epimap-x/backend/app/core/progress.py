@@ -0,0 +1,167 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Iterable, AsyncIterator, Tuple
+from app.core.config import settings
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+
+class ProgressBroker:
+    """In-memory store of live job progress that SSE subscribers watch without touching the DB"""
+
+    def __init__(self, retention_seconds: float = 3600):
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[int, Dict] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def start(self, analysis_id: int, total: int = 0, stage: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            self._version += 1
+            self._jobs[analysis_id] = {
+                "analysis_id": analysis_id,
+                "status": "RUNNING",
+                "stage": stage,
+                "progress": 0,
+                "done": 0,
+                "total": total,
+                "started_at": now,
+                "updated_at": now,
+                "stage_started_at": now,
+                "version": self._version
+            }
+            self._evict(now)
+
+    def update(
+        self,
+        analysis_id: int,
+        done: Optional[int] = None,
+        total: Optional[int] = None,
+        progress: Optional[int] = None,
+        stage: Optional[str] = None,
+        status: Optional[str] = None
+    ):
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(analysis_id)
+            if job is None:
+                return
+            if stage is not None and stage != job["stage"]:
+                job["stage"] = stage
+                job["stage_started_at"] = now
+                job["done"] = 0
+            if done is not None:
+                job["done"] = done
+            if total is not None:
+                job["total"] = total
+            if progress is not None:
+                job["progress"] = progress
+            if status is not None:
+                job["status"] = status
+            job["updated_at"] = now
+            self._version += 1
+            job["version"] = self._version
+
+    def finish(self, analysis_id: int, status: str, progress: int = 100):
+        self.update(analysis_id, progress=progress, status=status)
+
+    def get(self, analysis_id: int) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(analysis_id)
+            return self._describe(job) if job else None
+
+    def changed_since(self, version: int, analysis_ids: Optional[Iterable[int]] = None) -> Tuple[int, List[Dict]]:
+        """Return the current version and every job updated after ``version``"""
+        with self._lock:
+            jobs = self._jobs.values() if analysis_ids is None else (
+                self._jobs[i] for i in analysis_ids if i in self._jobs
+            )
+            changed = [self._describe(job) for job in jobs if job["version"] > version]
+            return self._version, changed
+
+    async def stream(self, analysis_ids: Optional[Iterable[int]] = None) -> AsyncIterator[str]:
+        """Server-Sent Events for the given jobs (all jobs if None)"""
+        analysis_ids = list(analysis_ids) if analysis_ids is not None else None
+        version = 0
+        last_sent = time.monotonic()
+        while True:
+            version, changed = self.changed_since(version, analysis_ids)
+            for job in changed:
+                yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+                last_sent = time.monotonic()
+
+            if analysis_ids is not None and all(
+                (self.get(i) or {}).get("status", "PENDING") in TERMINAL_STATUSES for i in analysis_ids
+            ):
+                return
+
+            if time.monotonic() - last_sent >= settings.PROGRESS_HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+
+            await asyncio.sleep(settings.PROGRESS_POLL_SECONDS)
+
+    def _describe(self, job: Dict) -> Dict:
+        elapsed = max(job["updated_at"] - job["stage_started_at"], 1e-9)
+        throughput = job["done"] / elapsed if job["done"] else 0.0
+        remaining = max(job["total"] - job["done"], 0)
+        eta = remaining / throughput if throughput > 0 and job["status"] not in TERMINAL_STATUSES else None
+        return {
+            "analysis_id": job["analysis_id"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "progress": job["progress"],
+            "done": job["done"],
+            "total": job["total"],
+            "throughput": round(throughput, 2),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "elapsed_seconds": round(job["updated_at"] - job["started_at"], 2)
+        }
+
+    def _evict(self, now: float):
+        expired = [
+            analysis_id for analysis_id, job in self._jobs.items()
+            if job["status"] in TERMINAL_STATUSES and now - job["updated_at"] > self.retention_seconds
+        ]
+        for analysis_id in expired:
+            del self._jobs[analysis_id]
+
+progress_broker = ProgressBroker()
+
+class ProgressReporter:
+    """Per-job callback that publishes every update but commits progress to the DB at most once per interval.
+
+    ``start`` and ``end`` map the stage's done/total onto the job's overall
+    percentage, e.g. fitting CpGs covers 30-80%. A ``lazy`` reporter announces
+    its stage on the first update instead of on construction.
+    """
+
+    def __init__(self, session, analysis, stage: str, start: int = 0, end: int = 100, broker: ProgressBroker = None, lazy: bool = False):
+        self.session = session
+        self.analysis = analysis
+        self.stage = stage
+        self.start = start
+        self.end = end
+        self.broker = broker or progress_broker
+        self.flush_interval = settings.PROGRESS_FLUSH_SECONDS
+        self._last_flush = time.monotonic()
+        self._announced = not lazy
+        if not lazy:
+            self.broker.update(analysis.id, stage=stage, done=0, progress=start)
+
+    def __call__(self, done: int, total: int):
+        if not self._announced:
+            self.broker.update(self.analysis.id, stage=self.stage)
+            self._announced = True
+        progress = self.start + int((self.end - self.start) * done / total) if total else self.end
+        self.broker.update(self.analysis.id, done=done, total=total, progress=progress)
+
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.analysis.progress = progress
+            self.analysis.heartbeat_at = datetime.utcnow()
+            self.session.commit()
+            self._last_flush = now
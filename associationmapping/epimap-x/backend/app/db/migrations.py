@@ -0,0 +1,107 @@
+"""
+Schema upgrades for databases created by an older version.
+
+``create_all`` only creates missing tables, so a column or index added to an
+existing table is also listed here and added at startup when it is absent.
+Each step is idempotent and entries are only ever appended.
+"""
+import logging
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlmodel import SQLModel
+
+logger = logging.getLogger(__name__)
+
+# (table, column, value for existing rows); the column type comes from the model
+COLUMNS = [
+    # Background annotation
+    ("analysisjob", "annotation_status", None),
+    ("analysisjob", "annotation_progress", 0),
+    ("analysisresult", "gene_symbol", None),
+    ("analysisresult", "feature_type", None),
+    # Upload hashing and validation
+    ("datafile", "sha256", None),
+    ("datafile", "row_count", None),
+    ("datafile", "column_count", None),
+    ("datafile", "validation", None),
+    # Parquet result store and summary statistics
+    ("analysisjob", "result_path", None),
+    ("analysisjob", "n_tests", None),
+    ("analysisjob", "n_significant", None),
+    ("analysisjob", "min_p_value", None),
+    ("analysisjob", "lambda_gc", None),
+    # Response cache keys
+    ("analysisjob", "results_version", 0),
+    # Probe QC
+    ("analysisjob", "qc_report", None),
+    # Preprocessing pipeline
+    ("analysisjob", "preprocessing", None),
+    # Confounder estimation
+    ("analysisjob", "confounders", None),
+    ("analysisjob", "confounder_report", None),
+    # Permutation testing
+    ("analysisjob", "permutation", None),
+    ("analysisresult", "empirical_p", None),
+    ("analysisresult", "fwer_p", None),
+    # Logistic case level
+    ("analysisjob", "case_level", None),
+    # Crash recovery
+    ("analysisjob", "heartbeat_at", None),
+    ("analysisjob", "attempts", 0),
+    ("analysisjob", "checkpoint_key", None),
+    ("analysisjob", "random_effects", None),
+    # Scheduler priority
+    ("analysisjob", "priority", 0),
+    # Batches
+    ("analysisjob", "batch_id", None),
+    # Job metrics
+    ("analysisjob", "metrics", None),
+    # Sweeps
+    ("analysisjob", "sample_filter", None),
+    # Incremental updates
+    ("analysisjob", "incremental", False),
+    ("analysisjob", "sufficient_stats_path", None),
+    ("analysisjob", "base_analysis_id", None),
+    # Result columns the shipped epimap.db predates
+    ("analysisresult", "se", None),
+    ("analysisresult", "bonferroni", None),
+]
+
+# (table, index name) of indexes declared on the models
+INDEXES = [
+    # Per-analysis result lookups by CpG and by p-value
+    ("analysisresult", "ix_analysisresult_analysis_cpg"),
+    ("analysisresult", "ix_analysisresult_analysis_p"),
+    # Deduplicating uploads by content hash
+    ("datafile", "ix_datafile_sha256"),
+    # Batch status counts
+    ("analysisjob", "ix_analysisjob_batch_status"),
+]
+
+def upgrade_schema(engine):
+    """Add the listed columns and indexes that an existing database is missing"""
+    tables = SQLModel.metadata.tables
+    inspector = inspect(engine)
+    existing = {name: {column["name"] for column in inspector.get_columns(name)} for name in inspector.get_table_names()}
+
+    for table, name, default in COLUMNS:
+        if name in existing.get(table, {name}):
+            continue
+        column = tables[table].c[name]
+        ddl = f"ALTER TABLE {table} ADD COLUMN {name} {column.type.compile(dialect=engine.dialect)}"
+        if default is not None:
+            value = literal(default, column.type).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+            ddl += f" DEFAULT {value}"
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(ddl))
+        except (OperationalError, ProgrammingError):
+            # Another worker may have added it first
+            if name not in {column["name"] for column in inspect(engine).get_columns(table)}:
+                raise
+        logger.info("Added column %s.%s", table, name)
+
+    for table, name in INDEXES:
+        index = next(index for index in tables[table].indexes if index.name == name)
+        with engine.begin() as connection:
+            index.create(connection, checkfirst=True)
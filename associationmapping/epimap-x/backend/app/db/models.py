@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, UniqueConstraint
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -23,6 +24,10 @@ class DataFile(SQLModel, table=True):
     type: FileType
     owner_id: int
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    sha256: Optional[str] = Field(default=None, index=True)
+    row_count: Optional[int] = None
+    column_count: Optional[int] = None
+    validation: Optional[str] = None  # JSON string
     
     # Relationships
     analyses_as_epigenome: List["AnalysisJob"] = Relationship(
@@ -34,21 +39,78 @@ class DataFile(SQLModel, table=True):
         sa_relationship_kwargs={"foreign_keys": "AnalysisJob.phenotype_file_id"}
     )
 
+class UploadSession(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    filename: str
+    type: FileType
+    temp_path: str
+    offset: int = Field(default=0)
+    total_size: Optional[int] = None
+    status: str = Field(default="active")  # active, completed, failed
+    data_file_id: Optional[int] = Field(default=None, foreign_key="datafile.id")
+    owner_id: int
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Batch(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True)
+    owner_id: int = Field(index=True)
+    total_analyses: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    
+    analyses: List["AnalysisJob"] = Relationship(back_populates="batch")
+
 class AnalysisJob(SQLModel, table=True):
+    __table_args__ = (
+        # Batch status is a COUNT ... GROUP BY status over this index
+        Index("ix_analysisjob_batch_status", "batch_id", "status"),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
+    batch_id: Optional[int] = Field(default=None, foreign_key="batch.id")
     epigenome_file_id: int = Field(foreign_key="datafile.id")
     phenotype_file_id: int = Field(foreign_key="datafile.id")
     phenotype_column: str
     covariates: str  # JSON string
+    sample_filter: Optional[str] = None  # JSON: phenotype column -> value(s) or {"min", "max"}; restricts the samples
     model_type: str
+    case_level: Optional[str] = None  # logistic_regression: phenotype value coded as 1 (recognised labels when omitted)
     status: AnalysisStatus = Field(default=AnalysisStatus.PENDING)
     progress: int = Field(default=0)
     owner_id: int
+    priority: int = Field(default=0)  # higher runs first
     created_at: datetime = Field(default_factory=datetime.utcnow)
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     error_message: Optional[str] = None
+    annotation_status: Optional[AnalysisStatus] = None
+    annotation_progress: int = Field(default=0)
+    
+    # Per-CpG rows live in AnalysisResult, or in this Parquet file when the Parquet result store is used
+    result_path: Optional[str] = None
+    n_tests: Optional[int] = None
+    n_significant: Optional[int] = None
+    min_p_value: Optional[float] = None
+    lambda_gc: Optional[float] = None
+    preprocessing: Optional[str] = None  # JSON list of preprocessing step names
+    qc_report: Optional[str] = None  # JSON string
+    confounders: Optional[str] = None  # JSON: method, n_components, reference
+    confounder_report: Optional[str] = None  # JSON string
+    permutation: Optional[str] = None  # JSON: n_permutations, max_t, adaptive, seed
+    random_effects: Optional[str] = None  # JSON list of grouping columns; mixed models only
+    # Crash recovery: workers refresh the heartbeat; the watchdog requeues jobs whose heartbeat is stale
+    heartbeat_at: Optional[datetime] = None
+    attempts: int = Field(default=0)
+    checkpoint_key: Optional[str] = None
+    metrics: Optional[str] = None  # JSON: per-stage wall/CPU time, peak RSS and rows
+    # Incremental analyses keep per-CpG sufficient statistics; an update adds new samples to its base's
+    incremental: bool = Field(default=False)
+    sufficient_stats_path: Optional[str] = None
+    base_analysis_id: Optional[int] = Field(default=None, foreign_key="analysisjob.id")
+    # Bumped whenever stored results change; part of every response cache key
+    results_version: int = Field(default=0)
     
     # Relationships
     epigenome_file: Optional[DataFile] = Relationship(
@@ -60,8 +122,14 @@ class AnalysisJob(SQLModel, table=True):
         sa_relationship_kwargs={"foreign_keys": "AnalysisJob.phenotype_file_id"}
     )
     results: List["AnalysisResult"] = Relationship(back_populates="analysis")
+    batch: Optional[Batch] = Relationship(back_populates="analyses")
 
 class AnalysisResult(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_analysisresult_analysis_cpg", "analysis_id", "cpg_id"),
+        Index("ix_analysisresult_analysis_p", "analysis_id", "p_value"),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     cpg_id: str
     chromosome: str
@@ -71,11 +139,45 @@ class AnalysisResult(SQLModel, table=True):
     p_value: float
     fdr: Optional[float] = None
     bonferroni: Optional[float] = None
+    empirical_p: Optional[float] = None
+    fwer_p: Optional[float] = None
+    gene_symbol: Optional[str] = None
+    feature_type: Optional[str] = None
     analysis_id: int = Field(foreign_key="analysisjob.id")
     
     # Relationships
     analysis: Optional[AnalysisJob] = Relationship(back_populates="results")
 
+class ResultCheckpoint(SQLModel, table=True):
+    __table_args__ = (
+        UniqueConstraint("analysis_id", "block_id", name="uq_resultcheckpoint_analysis_block"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    analysis_id: int = Field(foreign_key="analysisjob.id", index=True)
+    block_id: int
+    n_results: int
+    path: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DifferentialRegion(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_differentialregion_analysis_p", "analysis_id", "p_value"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    analysis_id: int = Field(foreign_key="analysisjob.id")
+    chromosome: str
+    start: int
+    end: int
+    n_cpgs: int
+    z_score: float
+    p_value: float
+    p_sidak: float
+    fdr: Optional[float] = None
+    min_p_value: float
+    mean_beta: Optional[float] = None
+
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(unique=True)
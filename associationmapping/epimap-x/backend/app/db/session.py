@@ -1,11 +1,54 @@
+from sqlalchemy import event
 from sqlmodel import create_engine, SQLModel, Session
 from app.core.config import settings
+from app.db.migrations import upgrade_schema
 
-engine = create_engine(settings.DATABASE_URL)
+def build_engine(database_url: str = None):
+    """Create an engine with pooling and, for SQLite, WAL and busy-timeout pragmas"""
+    database_url = database_url or settings.DATABASE_URL
+    
+    if not database_url.startswith("sqlite"):
+        return create_engine(
+            database_url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+    
+    connect_args = {
+        "check_same_thread": False,
+        "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+    }
+    if ":memory:" in database_url:
+        sqlite_engine = create_engine(database_url, connect_args=connect_args)
+    else:
+        sqlite_engine = create_engine(
+            database_url,
+            connect_args=connect_args,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT
+        )
+    
+    @event.listens_for(sqlite_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.close()
+    
+    return sqlite_engine
+
+# Single engine shared by the API and every background task
+engine = build_engine()
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -1,8 +1,13 @@
+import asyncio
+import sys
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.config import settings
+from app.core.metrics import CONTENT_TYPE, render_metrics
 from app.api.v1.router import api_router
 from app.db.session import create_db_and_tables
+from app.tasks.watchdog import job_watchdog
 
 app = FastAPI(
     title="EpiMap X API",
@@ -19,8 +24,20 @@ app.add_middleware(
 )
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     create_db_and_tables()
+    if settings.JOB_WATCHDOG_ENABLED:
+        app.state.watchdog = asyncio.create_task(job_watchdog())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    watchdog = getattr(app.state, "watchdog", None)
+    if watchdog is not None:
+        watchdog.cancel()
+    # Only loaded (with aiohttp) once something annotated; nothing to close otherwise
+    annotation_client = sys.modules.get("app.services.annotation_client")
+    if annotation_client is not None:
+        await annotation_client.close_annotation_client()
 
 app.include_router(api_router, prefix="/api/v1")
 
@@ -30,4 +47,9 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
@@ -1,13 +1,48 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
+class ConfounderOptions(BaseModel):
+    method: str = "sva"  # sva or cell_type
+    n_components: Optional[int] = None  # sva only; estimated from the data when omitted
+    reference: Optional[str] = None  # cell_type only; name of a reference panel
+
+class PermutationOptions(BaseModel):
+    n_permutations: int = Field(default=1000, gt=0)
+    max_t: bool = True  # family-wise p-values; disables adaptive stopping
+    adaptive: bool = True
+    seed: int = 0
+
 class AnalysisRequest(BaseModel):
     epigenome_file_id: int
     phenotype_file_id: int
     phenotype_column: str
     covariates: List[str]
-    model_type: str = "linear_regression"
+    model_type: str = "linear_regression"  # or logistic_regression, poisson_regression, negative_binomial
+    case_level: Optional[str] = None  # logistic_regression: phenotype value modelled as the case, e.g. "case"
+    preprocessing: List[str] = []  # m_values, quantile, standardize_covariates
+    confounders: Optional[ConfounderOptions] = None
+    permutation: Optional[PermutationOptions] = None
+    sample_filter: Optional[Dict[str, Any]] = None  # e.g. {"sex": "F", "age": {"min": 50}}
+    incremental: bool = False  # keep sufficient statistics so new samples can be added later (linear only)
+    priority: int = 0  # higher runs first
+
+class IncrementalUpdateRequest(BaseModel):
+    """Files holding only the samples to add to an incremental analysis"""
+    epigenome_file_id: int
+    phenotype_file_id: int
+    priority: int = 0
+
+class SweepRequest(BaseModel):
+    """Every combination of a sample filter and a covariate set, run together on one data load"""
+    epigenome_file_id: int
+    phenotype_file_id: int
+    phenotype_column: str
+    sample_filters: List[Dict[str, Any]] = [{}]  # {} = all samples
+    covariate_sets: List[List[str]] = [[]]
+    preprocessing: List[str] = []
+    sweep_name: Optional[str] = None
+    priority: int = 0
 
 class AdvancedAnalysisRequest(BaseModel):
     epigenome_file_id: int
@@ -17,6 +52,8 @@ class AdvancedAnalysisRequest(BaseModel):
     random_effects: Optional[List[str]] = None
     model_type: str = "mixed_model"
     correction_method: str = "fdr"
+    preprocessing: List[str] = ["standardize_covariates"]
+    priority: int = 0
 
 class AnalysisResponse(BaseModel):
     analysis_id: int
@@ -30,7 +67,20 @@ class AnalysisStatusResponse(BaseModel):
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
     error_message: Optional[str] = None
+    annotation_status: Optional[str] = None
+    annotation_progress: int = 0
+    stage: Optional[str] = None
+    done: Optional[int] = None
+    total: Optional[int] = None
+    throughput: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    queue_position: Optional[int] = None
 
 class BatchAnalysisRequest(BaseModel):
     analyses: List[AnalysisRequest]
-    batch_name: str
\ No newline at end of file
+    batch_name: str
+
+class MetaAnalysisRequest(BaseModel):
+    analysis_ids: List[int]
+    method: str = "fixed"
+    limit: int = 100
@@ -1,11 +1,29 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict
 
 class FileResponse(BaseModel):
     file_id: int
     filename: str
     status: str
+    sha256: Optional[str] = None
+    row_count: Optional[int] = None
+    column_count: Optional[int] = None
+    validation: Optional[Dict] = None
 
 class FileUpload(BaseModel):
     filename: str
-    file_type: str
\ No newline at end of file
+    file_type: str
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    file_type: str
+    total_size: Optional[int] = None
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    filename: str
+    offset: int
+    total_size: Optional[int] = None
+    status: str
+    chunk_size: int
+    validation: Optional[Dict] = None
@@ -1,26 +1,29 @@
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
-from sklearn.preprocessing import StandardScaler
-from typing import List, Dict, Optional
-import io
+from typing import List, Dict, Optional, Callable, Union, BinaryIO
+from app.core.config import settings
+from app.services.qc_service import ProbeQCService
+from app.utils.data_parser import read_table
 
 class AdvancedEWASService:
     def __init__(self):
-        self.scaler = StandardScaler()
+        self.qc_report = None
     
     def run_mixed_model_analysis(
         self,
-        epigenome_data: bytes,
-        phenotype_data: bytes,
+        epigenome_data: Union[bytes, BinaryIO, pd.DataFrame],
+        phenotype_data: Union[bytes, pd.DataFrame],
         phenotype_column: str,
         covariates: List[str],
-        random_effects: Optional[List[str]] = None
+        random_effects: Optional[List[str]] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        qc_service: Optional[ProbeQCService] = None
     ) -> List[Dict]:
         """Run EWAS with mixed linear model for population structure"""
         # Load and prepare data
-        epigenome_df = pd.read_csv(io.BytesIO(epigenome_data), sep='\t', index_col=0)
-        phenotype_df = pd.read_csv(io.BytesIO(phenotype_data), index_col=0)
+        epigenome_df = read_table(epigenome_data, sep='\t', index_col=0)
+        phenotype_df = read_table(phenotype_data, index_col=0)
         
         # Align samples
         common_samples = epigenome_df.columns.intersection(phenotype_df.index)
@@ -31,68 +34,75 @@ class AdvancedEWASService:
         y = phenotype_df[phenotype_column]
         X_covariates = phenotype_df[covariates] if covariates else pd.DataFrame(index=phenotype_df.index)
         
-        # Standardize covariates
-        if not X_covariates.empty:
-            X_covariates_scaled = pd.DataFrame(
-                self.scaler.fit_transform(X_covariates),
-                index=X_covariates.index,
-                columns=X_covariates.columns
-            )
-        else:
-            X_covariates_scaled = X_covariates
+        # Drop probes that cannot be modelled before fitting anything
+        self.qc_report = None
+        if qc_service is not None:
+            complete = (y.notna() & X_covariates.notna().all(axis=1)).to_numpy()
+            epigenome_df, self.qc_report = qc_service.filter(epigenome_df, complete)
+        
+        # Covariates are standardized by the preprocessing pipeline's standardize_covariates step
+        X_covariates_scaled = X_covariates
         
         results = []
         
-        # Run analysis for each CpG with robust standard errors
-        for cpg_id in epigenome_df.index:
-            try:
-                methylation = epigenome_df.loc[cpg_id]
-                
-                # Prepare design matrix
-                X = pd.concat([methylation, X_covariates_scaled], axis=1)
-                X = sm.add_constant(X)
-                
-                # Remove samples with missing data
-                complete_cases = ~(X.isna().any(axis=1) | y.isna())
-                X_clean = X[complete_cases]
-                y_clean = y[complete_cases]
-                
-                if len(X_clean) < 10:
+        # Run analysis for each CpG, chunk by chunk with robust standard errors
+        cpg_ids = epigenome_df.index
+        total = len(cpg_ids)
+        chunk_size = settings.EWAS_CHUNK_SIZE
+        
+        for chunk_start in range(0, total, chunk_size):
+            for cpg_id in cpg_ids[chunk_start:chunk_start + chunk_size]:
+                try:
+                    methylation = epigenome_df.loc[cpg_id]
+                    
+                    # Prepare design matrix
+                    X = pd.concat([methylation, X_covariates_scaled], axis=1)
+                    X = sm.add_constant(X)
+                    
+                    # Remove samples with missing data
+                    complete_cases = ~(X.isna().any(axis=1) | y.isna())
+                    X_clean = X[complete_cases]
+                    y_clean = y[complete_cases]
+                    
+                    if len(X_clean) < 10:
+                        continue
+                    
+                    # Fit robust linear model
+                    model = sm.OLS(y_clean, X_clean)
+                    fitted_model = model.fit(cov_type='HC3')  # Robust standard errors
+                    
+                    # Extract results
+                    beta = fitted_model.params.iloc[1]
+                    p_value = fitted_model.pvalues.iloc[1]
+                    se = fitted_model.bse.iloc[1]
+                    
+                    # Calculate effect size (Cohen's d)
+                    pooled_std = np.sqrt(((methylation.std() ** 2) + (y.std() ** 2)) / 2)
+                    cohens_d = beta / pooled_std if pooled_std > 0 else 0
+                    
+                    # Parse chromosome and position
+                    if ':' in cpg_id:
+                        chrom, pos = cpg_id.split(':')
+                        position = int(pos)
+                    else:
+                        chrom = "unknown"
+                        position = 0
+                    
+                    results.append({
+                        'cpg_id': cpg_id,
+                        'chromosome': chrom,
+                        'position': position,
+                        'beta': float(beta),
+                        'se': float(se),
+                        'p_value': float(p_value),
+                        'cohens_d': float(cohens_d)
+                    })
+                    
+                except Exception:
                     continue
-                
-                # Fit robust linear model
-                model = sm.OLS(y_clean, X_clean)
-                fitted_model = model.fit(cov_type='HC3')  # Robust standard errors
-                
-                # Extract results
-                beta = fitted_model.params.iloc[1]
-                p_value = fitted_model.pvalues.iloc[1]
-                se = fitted_model.bse.iloc[1]
-                
-                # Calculate effect size (Cohen's d)
-                pooled_std = np.sqrt(((methylation.std() ** 2) + (y.std() ** 2)) / 2)
-                cohens_d = beta / pooled_std if pooled_std > 0 else 0
-                
-                # Parse chromosome and position
-                if ':' in cpg_id:
-                    chrom, pos = cpg_id.split(':')
-                    position = int(pos)
-                else:
-                    chrom = "unknown"
-                    position = 0
-                
-                results.append({
-                    'cpg_id': cpg_id,
-                    'chromosome': chrom,
-                    'position': position,
-                    'beta': float(beta),
-                    'se': float(se),
-                    'p_value': float(p_value),
-                    'cohens_d': float(cohens_d)
-                })
-                
-            except Exception:
-                continue
+            
+            if progress_callback:
+                progress_callback(min(chunk_start + chunk_size, total), total)
         
         # Apply multiple testing corrections
         if results:
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from app.core.config import settings
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by every request of a client"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and consume it"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class ResponseCache:
+    """Persistent on-disk cache of JSON responses keyed by request URL"""
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class AnnotationClient:
+    """Reusable Ensembl REST client with pooling, rate limiting, retries and caching.
+
+    CpGs are batched by tiling each chromosome into fixed windows of
+    ``window_size`` bp: one overlap query is issued per window and genes are
+    assigned to CpGs locally. Ensembl's overlap endpoint is GET-only, and
+    grid-aligned windows keep cached responses reusable across analyses.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        requests_per_second: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        window_size: Optional[int] = None,
+        cache_path: Optional[str] = None,
+        timeout: Optional[float] = None
+    ):
+        self.base_url = (base_url or settings.ANNOTATION_BASE_URL).rstrip("/")
+        self.max_concurrency = max_concurrency or settings.ANNOTATION_MAX_CONCURRENCY
+        self.max_retries = max_retries if max_retries is not None else settings.ANNOTATION_MAX_RETRIES
+        self.window_size = window_size or settings.ANNOTATION_WINDOW_SIZE
+        self.timeout = timeout or settings.ANNOTATION_TIMEOUT
+        self.rate_limiter = TokenBucket(
+            requests_per_second if requests_per_second is not None else settings.ANNOTATION_REQUESTS_PER_SECOND
+        )
+        cache_path = cache_path or settings.ANNOTATION_CACHE_PATH
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled session, recreating it if the event loop changed"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # A session is bound to the loop it was created on; release the old one before replacing it
+            await self.close()
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Content-Type": "application/json", "Accept": "application/json"}
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.rate_limiter = TokenBucket(self.rate_limiter.rate, self.rate_limiter.capacity)
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        session, loop = self._session, self._loop
+        self._session = None
+        if session is None or session.closed:
+            return
+        if loop is not None and loop is not asyncio.get_running_loop() and loop.is_running():
+            # Still serving requests on another thread: close it there
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop))
+        else:
+            await session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def get_json(self, path: str):
+        """GET a JSON document, served from the cache when possible"""
+        url = f"{self.base_url}{path}"
+        if self.cache is not None:
+            cached = self.cache.get(url)
+            if cached is not None:
+                return cached
+
+        session = await self._get_session()
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with self._semaphore:
+                await self.rate_limiter.acquire()
+                try:
+                    async with session.get(url) as response:
+                        if response.status == 200:
+                            data = await response.json(content_type=None)
+                            if self.cache is not None:
+                                self.cache.set(url, data)
+                            return data
+                        if response.status == 429 or response.status >= 500:
+                            retry_after = response.headers.get("Retry-After")
+                            last_error = aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        else:
+                            response.raise_for_status()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    last_error = e
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff_delay(attempt, retry_after))
+
+        raise last_error
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        base = settings.ANNOTATION_BACKOFF_BASE * (2 ** attempt)
+        return base + random.uniform(0, base)
+
+    async def get_genes_in_window(self, chrom: str, window_start: int) -> List[Dict]:
+        """Fetch all genes overlapping one grid-aligned window"""
+        window_end = window_start + self.window_size - 1
+        return await self.get_json(
+            f"/overlap/region/human/{chrom}:{max(window_start, 1)}-{window_end}?feature=gene"
+        )
+
+    async def annotate_positions(self, positions: Dict[str, Tuple[str, int]]) -> Dict[str, Dict]:
+        """Annotate ``{cpg_id: (chrom, pos)}`` with the gene overlapping each position"""
+        windows: Dict[Tuple[str, int], List[str]] = defaultdict(list)
+        for cpg_id, (chrom, pos) in positions.items():
+            chrom_clean = chrom.replace("chr", "")
+            window_start = (pos // self.window_size) * self.window_size
+            windows[(chrom_clean, window_start)].append(cpg_id)
+
+        keys = list(windows.keys())
+        responses = await asyncio.gather(
+            *(self.get_genes_in_window(chrom, start) for chrom, start in keys),
+            return_exceptions=True
+        )
+
+        annotations = {}
+        for key, genes in zip(keys, responses):
+            for cpg_id in windows[key]:
+                if isinstance(genes, Exception):
+                    annotations[cpg_id] = {"gene": "unknown", "feature": "unknown"}
+                else:
+                    annotations[cpg_id] = self._assign_gene(genes, positions[cpg_id][1])
+        return annotations
+
+    @staticmethod
+    def _assign_gene(genes: List[Dict], pos: int) -> Dict:
+        overlapping = [g for g in genes if g.get("start", 0) <= pos <= g.get("end", -1)]
+        if not overlapping:
+            return {"gene": "intergenic", "feature": "intergenic"}
+
+        # Prefer the shortest overlapping gene, which is usually the most specific
+        gene_info = min(overlapping, key=lambda g: g["end"] - g["start"])
+        return {
+            "gene": gene_info.get("external_name", "unknown"),
+            "gene_id": gene_info.get("id", "unknown"),
+            "biotype": gene_info.get("biotype", "unknown"),
+            "feature": "gene_body"
+        }
+
+_client: Optional[AnnotationClient] = None
+
+def get_annotation_client() -> AnnotationClient:
+    """Return the process-wide annotation client"""
+    global _client
+    if _client is None:
+        _client = AnnotationClient()
+    return _client
+
+async def close_annotation_client():
+    if _client is not None:
+        await _client.close()
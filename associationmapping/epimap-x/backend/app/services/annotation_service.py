@@ -1,79 +1,68 @@
 import pandas as pd
-import requests
 from typing import List, Dict, Optional
-import asyncio
-import aiohttp
+from sqlmodel import Session, select
+from app.db.models import Annotation
+from app.services.annotation_client import AnnotationClient, get_annotation_client
+from app.core.options import ANNOTATION_SOURCES
 
 class AnnotationService:
-    def __init__(self):
-        self.ensembl_base_url = "https://rest.ensembl.org"
+    def __init__(self, client: Optional[AnnotationClient] = None):
+        self.client = client or get_annotation_client()
         self.ucsc_base_url = "https://api.genome.ucsc.edu"
     
     async def annotate_cpgs(self, cpg_list: List[str]) -> Dict[str, Dict]:
         """Annotate CpGs with gene information"""
+        positions = {}
         annotations = {}
         
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for cpg_id in cpg_list[:100]:  # Limit to avoid rate limiting
-                if ':' in cpg_id:
-                    chrom, pos = cpg_id.split(':')
-                    tasks.append(self._get_gene_annotation(session, cpg_id, chrom, int(pos)))
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for cpg_id, result in zip(cpg_list[:100], results):
-                if not isinstance(result, Exception):
-                    annotations[cpg_id] = result
-                else:
-                    annotations[cpg_id] = {"gene": "unknown", "feature": "unknown"}
+        for cpg_id in cpg_list:
+            if ':' in cpg_id:
+                chrom, pos = cpg_id.split(':')
+                positions[cpg_id] = (chrom, int(pos))
+            else:
+                annotations[cpg_id] = {"gene": "unknown", "feature": "unknown"}
+        
+        # Requests are batched per genomic window, rate limited and cached by the client
+        annotations.update(await self.client.annotate_positions(positions))
         
         return annotations
     
-    async def _get_gene_annotation(self, session: aiohttp.ClientSession, cpg_id: str, chrom: str, pos: int) -> Dict:
-        """Get gene annotation for a single CpG"""
-        try:
-            # Clean chromosome name
-            chrom_clean = chrom.replace('chr', '')
-            
-            # Query Ensembl REST API
-            url = f"{self.ensembl_base_url}/overlap/region/human/{chrom_clean}:{pos}-{pos}?feature=gene"
-            
-            async with session.get(url, headers={"Content-Type": "application/json"}) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if data:
-                        gene_info = data[0]
-                        return {
-                            "gene": gene_info.get("external_name", "unknown"),
-                            "gene_id": gene_info.get("id", "unknown"),
-                            "biotype": gene_info.get("biotype", "unknown"),
-                            "feature": "gene_body"
-                        }
-            
-            return {"gene": "intergenic", "feature": "intergenic"}
-            
-        except Exception:
-            return {"gene": "unknown", "feature": "unknown"}
+    def lookup_local_annotations(self, session: Session, cpg_list: List[str]) -> Dict[str, Dict]:
+        """Annotate CpGs from the local Annotation table"""
+        statement = select(Annotation).where(Annotation.cpg_id.in_(cpg_list))
+        return {
+            a.cpg_id: {
+                "gene": a.gene_symbol or "intergenic",
+                "gene_id": a.gene_id,
+                "feature": a.feature_type
+            }
+            for a in session.exec(statement)
+        }
     
-    def get_pathway_enrichment(self, gene_list: List[str]) -> Dict:
-        """Get pathway enrichment for gene list (simplified)"""
-        # This would typically use KEGG, GO, or other pathway databases
-        # For now, return mock enrichment results
+    async def annotate_chunk(self, session: Session, cpg_list: List[str], source: str = "auto") -> Dict[str, Dict]:
+        """Annotate a chunk of CpGs locally, remotely, or locally with remote fallback"""
+        annotations = {}
+        if source in ("auto", "local"):
+            annotations = self.lookup_local_annotations(session, cpg_list)
         
-        pathways = {
-            "DNA_methylation": {"genes": [], "p_value": 0.001, "description": "DNA methylation process"},
-            "chromatin_organization": {"genes": [], "p_value": 0.005, "description": "Chromatin organization"},
-            "transcription_regulation": {"genes": [], "p_value": 0.01, "description": "Transcriptional regulation"}
-        }
+        missing = [cpg_id for cpg_id in cpg_list if cpg_id not in annotations]
+        if missing and source in ("auto", "remote"):
+            annotations.update(await self.annotate_cpgs(missing))
+        
+        for cpg_id in missing:
+            annotations.setdefault(cpg_id, {"gene": "unknown", "feature": "unknown"})
+        
+        return annotations
+    
+    def get_pathway_enrichment(self, gene_list: List[str], background: Optional[List[str]] = None) -> Dict:
+        """Get over-represented pathways for a gene list from the local gene set library"""
+        from app.services.enrichment_service import EnrichmentService
         
-        # Mock assignment of genes to pathways
-        for i, gene in enumerate(gene_list[:10]):
-            pathway_key = list(pathways.keys())[i % 3]
-            pathways[pathway_key]["genes"].append(gene)
+        enrichment_service = EnrichmentService()
+        if enrichment_service.library is None:
+            return {}
         
-        return pathways
+        return enrichment_service.over_representation(gene_list, background=background)
     
     def get_cpg_island_annotation(self, cpg_positions: List[tuple]) -> Dict[str, str]:
         """Annotate CpGs with CpG island information"""
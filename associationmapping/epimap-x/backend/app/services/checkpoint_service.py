@@ -0,0 +1,74 @@
+import hashlib
+import os
+import shutil
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import delete
+from sqlmodel import Session, select
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.db.models import AnalysisJob, ResultCheckpoint
+
+class CheckpointStore:
+    """Durable per-block results of a running analysis, so a restarted job skips finished blocks.
+
+    Each block's results are written to a file (temp file + rename) before a
+    ResultCheckpoint row is committed for it, so a committed row always
+    points at a complete file. Checkpoints only apply to the run they were
+    made for: ``begin`` fingerprints the run key, the CpGs left after QC and
+    the block size, and discards checkpoints from any other run.
+    """
+
+    def __init__(self, session: Session, analysis: AnalysisJob, run_key: str, root: Optional[str] = None):
+        self.session = session
+        self.analysis = analysis
+        self.run_key = run_key
+        self.directory = os.path.join(root or settings.CHECKPOINT_PATH, f"analysis_{analysis.id}")
+
+    def begin(self, cpg_ids: pd.Index, chunk_size: int) -> Dict[int, List[Dict]]:
+        """Results of the blocks already completed by an earlier attempt of the same run"""
+        digest = hashlib.sha256(f"{self.run_key}|{chunk_size}|{len(cpg_ids)}".encode())
+        digest.update(pd.util.hash_pandas_object(pd.Series(cpg_ids), index=False).to_numpy().tobytes())
+        fingerprint = digest.hexdigest()
+
+        if self.analysis.checkpoint_key != fingerprint:
+            self.clear()
+            self.analysis.checkpoint_key = fingerprint
+            self.session.commit()
+            return {}
+
+        completed = {}
+        checkpoints = self.session.exec(
+            select(ResultCheckpoint).where(ResultCheckpoint.analysis_id == self.analysis.id)
+        ).all()
+        for checkpoint in checkpoints:
+            try:
+                completed[checkpoint.block_id] = pd.read_pickle(checkpoint.path).to_dict(orient="records")
+            except (OSError, EOFError, ValueError):
+                # Unreadable block: it is simply recomputed
+                self.session.delete(checkpoint)
+        self.session.commit()
+        return completed
+
+    def save(self, block_id: int, results: List[Dict]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"block_{block_id:06d}.pkl")
+        temp_path = f"{path}.tmp"
+        pd.DataFrame(results).to_pickle(temp_path)
+        os.replace(temp_path, path)
+
+        self.session.add(ResultCheckpoint(
+            analysis_id=self.analysis.id,
+            block_id=block_id,
+            n_results=len(results),
+            path=path
+        ))
+        self.analysis.heartbeat_at = datetime.utcnow()
+        self.session.commit()
+
+    def clear(self):
+        """Drop all checkpoints of the analysis, e.g. once its results are saved"""
+        self.session.exec(delete(ResultCheckpoint).where(ResultCheckpoint.analysis_id == self.analysis.id))
+        self.analysis.checkpoint_key = None
+        self.session.commit()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,167 @@
+import pandas as pd
+import numpy as np
+from scipy import stats
+from sqlmodel import Session
+from typing import List, Dict, Optional
+from app.db.models import AnalysisJob
+from app.services.result_store import ResultRepository
+from app.utils.multiple_testing import benjamini_hochberg
+
+class ComparisonService:
+    """Columnar comparison and meta-analysis of EWAS result sets"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.repository = ResultRepository(session)
+
+    def compare_pair(self, analysis_id_1: int, analysis_id_2: int, p_threshold: float = 0.05, limit: int = 100) -> Dict:
+        """Join two result sets on cpg_id and compare them vectorized"""
+        left = self._load_columns(analysis_id_1)
+        right = self._load_columns(analysis_id_2)
+        df = left.join(right, how="inner", lsuffix="_1", rsuffix="_2").reset_index()
+        df = df[["cpg_id", "beta_1", "se_1", "p_value_1", "beta_2", "se_2", "p_value_2"]]
+        if df.empty:
+            return None
+
+        b1 = df["beta_1"].to_numpy(dtype=float)
+        b2 = df["beta_2"].to_numpy(dtype=float)
+        p1 = df["p_value_1"].to_numpy(dtype=float)
+        z2 = _z_scores(b2, df["se_2"].to_numpy(dtype=float), df["p_value_2"].to_numpy(dtype=float))
+
+        consistent = np.sign(b1) == np.sign(b2)
+        # One-sided p-value of analysis 2 in the direction observed in analysis 1
+        replication_p = stats.norm.sf(np.sign(b1) * z2)
+
+        discovered = p1 < p_threshold
+        n_discovered = int(discovered.sum())
+        replicated = discovered & (replication_p < 0.05 / max(n_discovered, 1))
+        sign_test_p = (
+            stats.binomtest(int(consistent[discovered].sum()), n_discovered, 0.5, alternative="greater").pvalue
+            if n_discovered else None
+        )
+
+        df["beta_diff"] = np.abs(b1 - b2)
+        df["consistent_direction"] = consistent
+        df["replication_p"] = replication_p
+        top = df.iloc[np.argsort(p1, kind="stable")[:limit]]
+
+        return {
+            "analysis_1": analysis_id_1,
+            "analysis_2": analysis_id_2,
+            "common_cpgs": len(df),
+            "beta_correlation": _correlation(b1, b2),
+            "consistent_direction_pct": float(consistent.mean() * 100),
+            "discovery_cpgs": n_discovered,
+            "replicated_cpgs": int(replicated.sum()),
+            "direction_sign_test_p": sign_test_p,
+            "comparison_data": top.drop(columns=["se_1", "se_2"]).to_dict(orient="records")
+        }
+
+    def meta_analysis(self, analysis_ids: List[int], method: str = "fixed", limit: int = 100) -> Dict:
+        """Inverse-variance meta-analysis of CpGs shared by all analyses"""
+        frames = [self._load_columns(analysis_id) for analysis_id in analysis_ids]
+        if any(f.empty for f in frames):
+            return None
+
+        common = frames[0].index
+        for frame in frames[1:]:
+            common = common.intersection(frame.index)
+        if len(common) == 0:
+            return None
+
+        betas = np.column_stack([f["beta"].reindex(common).to_numpy(dtype=float) for f in frames])
+        ses = np.column_stack([
+            _standard_errors(
+                f["beta"].reindex(common).to_numpy(dtype=float),
+                f["se"].reindex(common).to_numpy(dtype=float),
+                f["p_value"].reindex(common).to_numpy(dtype=float)
+            )
+            for f in frames
+        ])
+
+        # CpGs whose standard error cannot be recovered in some analysis carry no weight
+        valid = (np.isfinite(betas) & np.isfinite(ses) & (ses > 0)).all(axis=1)
+        common, betas, ses = common[valid], betas[valid], ses[valid]
+        if len(common) == 0:
+            return None
+
+        weights = 1.0 / ses ** 2
+        sum_w = weights.sum(axis=1)
+        beta_fixed = (weights * betas).sum(axis=1) / sum_w
+        q = (weights * (betas - beta_fixed[:, None]) ** 2).sum(axis=1)
+        df = len(analysis_ids) - 1
+        i2 = np.where(q > 0, np.clip((q - df) / np.where(q > 0, q, 1), 0, None), 0.0)
+        heterogeneity_p = stats.chi2.sf(q, df) if df > 0 else np.ones(len(q))
+
+        if method == "random":
+            # DerSimonian-Laird between-study variance
+            c = sum_w - (weights ** 2).sum(axis=1) / sum_w
+            tau2 = np.clip((q - df) / np.where(c > 0, c, np.inf), 0, None)
+            weights = 1.0 / (ses ** 2 + tau2[:, None])
+            sum_w = weights.sum(axis=1)
+            beta_meta = (weights * betas).sum(axis=1) / sum_w
+        else:
+            tau2 = np.zeros(len(q))
+            beta_meta = beta_fixed
+
+        se_meta = 1.0 / np.sqrt(sum_w)
+        z = beta_meta / se_meta
+        p_meta = 2 * stats.norm.sf(np.abs(z))
+        fdr = benjamini_hochberg(p_meta)
+
+        order = np.argsort(p_meta, kind="stable")[:limit]
+        results = pd.DataFrame({
+            "cpg_id": np.asarray(common)[order],
+            "beta": beta_meta[order],
+            "se": se_meta[order],
+            "z": z[order],
+            "p_value": p_meta[order],
+            "fdr": fdr[order],
+            "q": q[order],
+            "i2": i2[order],
+            "tau2": tau2[order],
+            "heterogeneity_p": heterogeneity_p[order],
+            "consistent_direction": (np.sign(betas[order]) == np.sign(betas[order, :1])).all(axis=1)
+        })
+
+        return {
+            "analysis_ids": analysis_ids,
+            "method": method,
+            "common_cpgs": len(common),
+            "fdr_significant": int((fdr < 0.05).sum()),
+            "median_i2": float(np.median(i2)),
+            "results": results.to_dict(orient="records")
+        }
+
+    def _load_columns(self, analysis_id: int) -> pd.DataFrame:
+        analysis = self.session.get(AnalysisJob, analysis_id)
+        if analysis is None:
+            return pd.DataFrame(columns=["beta", "se", "p_value"], index=pd.Index([], name="cpg_id"))
+        df = self.repository.frame(analysis, ["cpg_id", "beta", "se", "p_value"]).set_index("cpg_id")
+        return df[~df.index.duplicated()]
+
+def _correlation(x: np.ndarray, y: np.ndarray) -> Optional[float]:
+    """Pearson correlation, or None when it is undefined (fewer than two values, or either side constant)"""
+    if len(x) < 2:
+        return None
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.corrcoef(x, y)[0, 1]
+    return float(r) if np.isfinite(r) else None
+
+def _z_scores(beta: np.ndarray, se: np.ndarray, p_value: np.ndarray) -> np.ndarray:
+    """Signed z-scores, recovered from the two-sided p-value where se is missing"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = beta / se
+    missing = ~np.isfinite(z)
+    z[missing] = np.sign(beta[missing]) * stats.norm.isf(np.clip(p_value[missing], 1e-300, 1.0) / 2)
+    return z
+
+def _standard_errors(beta: np.ndarray, se: np.ndarray, p_value: np.ndarray) -> np.ndarray:
+    """Fill missing standard errors from beta and the two-sided p-value"""
+    missing = ~np.isfinite(se) | (se <= 0)
+    if missing.any():
+        z = stats.norm.isf(np.clip(p_value[missing], 1e-300, 1.0) / 2)
+        se = se.copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            se[missing] = np.abs(beta[missing]) / z
+    return se
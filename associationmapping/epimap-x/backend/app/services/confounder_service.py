@@ -0,0 +1,185 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from scipy.optimize import nnls
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.regression import design_matrix, orthonormal_basis, residualize, impute_row_means
+from app.core.options import CONFOUNDER_METHODS
+
+def chunked_randomized_svd(
+    blocks: Callable[[], Iterator[np.ndarray]],
+    n_columns: int,
+    n_components: int,
+    oversampling: int = 10,
+    power_iterations: int = 2,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Leading singular values and right singular vectors of a matrix given as row blocks.
+
+    ``blocks()`` must yield the same row blocks on every call. Only the small
+    (n_columns x n_components + oversampling) sketch is held in memory; each
+    power iteration is one pass over the blocks. Also returns the squared
+    Frobenius norm, so callers can report the share of variance captured.
+    """
+    rng = np.random.default_rng(seed)
+    width = min(n_components + oversampling, n_columns)
+    basis = rng.standard_normal((n_columns, width))
+
+    # Range finder on A^T A: each pass accumulates sum(B^T (B Q)) over the blocks
+    for _ in range(power_iterations + 1):
+        sketch = np.zeros((n_columns, width))
+        for block in blocks():
+            sketch += block.T @ (block @ basis)
+        basis, _ = np.linalg.qr(sketch)
+
+    # Project onto the basis: eigenvalues of Q^T A^T A Q are the squared singular values
+    gram = np.zeros((width, width))
+    total = 0.0
+    for block in blocks():
+        projected = block @ basis
+        gram += projected.T @ projected
+        total += float(np.sum(block * block))
+    eigenvalues, vectors = np.linalg.eigh(gram)
+    order = np.argsort(eigenvalues)[::-1][:n_components]
+    singular_values = np.sqrt(np.clip(eigenvalues[order], 0, None))
+    return singular_values, basis @ vectors[:, order], total
+
+@lru_cache(maxsize=4)
+def _load_references(files: Tuple[Tuple[str, float], ...]) -> Dict[str, pd.DataFrame]:
+    return {
+        os.path.splitext(os.path.basename(path))[0]: pd.read_csv(path, sep='\t', index_col=0).astype(np.float64)
+        for path, _ in files
+    }
+
+def get_cell_references(path: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+    """Reference profiles under ``path``: one TSV per reference, CpGs x cell types of mean beta values"""
+    path = path or settings.CELL_REFERENCE_PATH
+    files = sorted(glob.glob(os.path.join(path, "*.tsv")))
+    return _load_references(tuple((f, os.path.getmtime(f)) for f in files))
+
+class ConfounderService:
+    """Estimates unmeasured confounders from the methylation matrix, to be added as EWAS covariates.
+
+    ``sva`` takes the leading singular vectors of the methylation residuals
+    after regressing out the phenotype and known covariates (so the signal of
+    interest is not absorbed). ``cell_type`` estimates cell proportions by
+    non-negative least squares against a reference panel (Houseman-style).
+    """
+
+    def __init__(
+        self,
+        method: str = "sva",
+        n_components: Optional[int] = None,
+        reference: Optional[str] = None,
+        seed: int = 0
+    ):
+        if method not in CONFOUNDER_METHODS:
+            raise ValueError(f"Unknown confounder method: {method}")
+        self.method = method
+        self.n_components = n_components
+        self.reference = reference
+        self.seed = seed
+
+    def estimate(self, epigenome_df: pd.DataFrame, design: pd.DataFrame) -> Tuple[pd.DataFrame, Dict]:
+        """Return sample x confounder covariates (indexed like ``design``) and a report.
+
+        ``design`` holds the phenotype and known covariates of the samples the
+        model will use; ``epigenome_df`` must contain those samples as columns.
+        """
+        if self.method == "cell_type":
+            return self._cell_proportions(epigenome_df[design.index])
+        return self._surrogate_variables(epigenome_df[design.index], design)
+
+    def _surrogate_variables(self, epigenome_df: pd.DataFrame, design: pd.DataFrame) -> Tuple[pd.DataFrame, Dict]:
+        n_probes, n_samples = epigenome_df.shape
+        design_basis, rank = orthonormal_basis(design_matrix(design))
+        residual_df = n_samples - rank
+
+        max_components = min(
+            self.n_components or settings.CONFOUNDER_MAX_COMPONENTS,
+            residual_df - 2,
+            n_probes
+        )
+        if max_components < 1:
+            return pd.DataFrame(index=design.index), {"method": "sva", "n_components": 0, "samples": n_samples, "covariates": []}
+
+        chunk_size = settings.EWAS_CHUNK_SIZE
+
+        def blocks():
+            for start in range(0, n_probes, chunk_size):
+                values = epigenome_df.iloc[start:start + chunk_size].to_numpy(dtype=np.float64)
+                # Missing values take the probe mean, i.e. contribute nothing after residualizing
+                yield residualize(impute_row_means(values), design_basis)
+
+        singular_values, vectors, total = chunked_randomized_svd(
+            blocks,
+            n_samples,
+            max_components,
+            oversampling=settings.CONFOUNDER_OVERSAMPLING,
+            power_iterations=settings.CONFOUNDER_POWER_ITERATIONS,
+            seed=self.seed
+        )
+
+        if self.n_components is None:
+            # Keep components above the Marchenko-Pastur edge expected from pure noise
+            noise = total / (n_probes * residual_df)
+            edge = n_probes * noise * (1 + np.sqrt(residual_df / n_probes)) ** 2
+            n_components = int(np.sum(singular_values ** 2 > edge))
+        else:
+            n_components = max_components
+
+        names = [f"sv{i + 1}" for i in range(n_components)]
+        covariates = pd.DataFrame(vectors[:, :n_components], index=design.index, columns=names)
+        explained = (singular_values[:n_components] ** 2 / total).tolist() if total > 0 else [0.0] * n_components
+        report = {
+            "method": "sva",
+            "n_components": n_components,
+            "samples": n_samples,
+            "covariates": names,
+            "variance_explained": explained
+        }
+        return covariates, report
+
+    def _cell_proportions(self, epigenome_df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict]:
+        references = get_cell_references()
+        if not references:
+            raise ValueError(f"No cell reference panels found in {settings.CELL_REFERENCE_PATH}")
+        name = self.reference or sorted(references)[0]
+        if name not in references:
+            raise ValueError(f"Cell reference not found: {name}")
+        reference = references[name]
+
+        shared = reference.index.intersection(epigenome_df.index)
+        if len(shared) < reference.shape[1]:
+            raise ValueError(f"Only {len(shared)} CpGs shared with cell reference {name}")
+        profiles = reference.loc[shared].to_numpy()
+        values = epigenome_df.loc[shared].to_numpy(dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        if finite.size and (finite.min() < 0 or finite.max() > 1):
+            raise ValueError("cell_type estimation expects beta values; do not combine it with m_values")
+
+        proportions = np.zeros((values.shape[1], profiles.shape[1]))
+        for j in range(values.shape[1]):
+            observed = np.isfinite(values[:, j]) & np.isfinite(profiles).all(axis=1)
+            if observed.sum() >= profiles.shape[1]:
+                weights, _ = nnls(profiles[observed], values[observed, j])
+                if weights.sum() > 0:
+                    proportions[j] = weights / weights.sum()
+
+        cell_types = [str(c) for c in reference.columns]
+        proportions = pd.DataFrame(proportions, index=epigenome_df.columns, columns=cell_types)
+        # Proportions sum to one, so the most abundant cell type is left out as the baseline
+        baseline = proportions.mean().idxmax()
+        report = {
+            "method": "cell_type",
+            "reference": name,
+            "reference_cpgs": int(len(shared)),
+            "samples": int(values.shape[1]),
+            "covariates": [c for c in cell_types if c != baseline],
+            "baseline": baseline,
+            "mean_proportions": proportions.mean().to_dict()
+        }
+        return proportions.drop(columns=[baseline]), report
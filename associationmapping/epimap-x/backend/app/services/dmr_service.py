@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from sqlalchemy import insert, delete
+from sqlmodel import Session, select
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.db.models import AnalysisJob, DifferentialRegion
+from app.services.result_store import ResultRepository
+from app.utils.multiple_testing import benjamini_hochberg
+
+# Packs (chromosome code, position) into one sortable int64
+_CHROMOSOME_STRIDE = np.int64(1) << 32
+
+class DMRService:
+    """Comb-p style differentially methylated regions from per-CpG p-values.
+
+    Works on results sorted by (chromosome, position):
+    1. the autocorrelation of z = Phi^-1(1 - p) is estimated in distance bins
+       from CpG pairs up to ``max_distance`` apart;
+    2. each CpG's p-value is combined with its neighbours' within
+       ``max_distance`` (Stouffer-Liptak, correcting for that correlation);
+    3. seed CpGs (combined p < ``seed_p``) closer than ``max_distance`` are
+       merged into regions, which get their own Stouffer-Liptak p-value and a
+       Sidak correction for the number of regions of that size.
+    Window sums and the correlation terms are prefix sums over the sorted
+    arrays, so the cost is linear in CpGs times neighbours within range and
+    memory is linear in CpGs.
+    """
+
+    def __init__(
+        self,
+        max_distance: Optional[int] = None,
+        step: Optional[int] = None,
+        seed_p: Optional[float] = None,
+        min_cpgs: Optional[int] = None
+    ):
+        self.max_distance = max_distance or settings.DMR_MAX_DISTANCE
+        self.step = step or settings.DMR_ACF_STEP
+        self.seed_p = seed_p or settings.DMR_SEED_P
+        self.min_cpgs = min_cpgs or settings.DMR_MIN_CPGS
+
+    def find_regions(self, results: pd.DataFrame) -> Tuple[pd.DataFrame, List[Dict]]:
+        """Regions found in ``results`` (chromosome, position, p_value, beta) and the estimated autocorrelation"""
+        results = results[
+            results["p_value"].notna() & (results["chromosome"] != "unknown")
+        ].sort_values(["chromosome", "position"], kind="stable")
+        chromosomes, codes = np.unique(results["chromosome"].to_numpy(dtype=str), return_inverse=True)
+        positions = results["position"].to_numpy(dtype=np.int64)
+        keys = codes.astype(np.int64) * _CHROMOSOME_STRIDE + positions
+        p_values = np.clip(results["p_value"].to_numpy(dtype=np.float64), 1e-300, 1 - 1e-16)
+        z = stats.norm.isf(p_values)
+        betas = results["beta"].to_numpy(dtype=np.float64)
+
+        acf, pair_counts = self._autocorrelation(keys, z)
+
+        # Combined p-value of every CpG over its +/- max_distance window
+        low = np.searchsorted(keys, keys - self.max_distance, side="left")
+        high = np.searchsorted(keys, keys + self.max_distance, side="right") - 1
+        combined_p = stats.norm.sf(self._liptak(z, keys, acf, low, high))
+
+        regions = self._merge_seeds(keys, combined_p)
+        if not len(regions):
+            return pd.DataFrame(columns=_REGION_COLUMNS), self._describe_acf(acf, pair_counts)
+
+        first, last = regions[:, 0], regions[:, 1]
+        n_cpgs = last - first + 1
+        # Regions are disjoint, so only their own CpGs are needed: work on those, packed together
+        region_first = np.concatenate([[0], np.cumsum(n_cpgs)[:-1]])
+        members = np.repeat(first - region_first, n_cpgs) + np.arange(n_cpgs.sum())
+        region_z = self._liptak(z[members], keys[members], acf, region_first, region_first + n_cpgs - 1)
+        region_p = stats.norm.sf(region_z)
+        # Sidak correction for the number of regions of this size that could have been tested
+        region_sidak = -np.expm1(len(z) / n_cpgs * np.log1p(-np.minimum(region_p, 1 - 1e-16)))
+        beta_sums = np.concatenate([[0.0], np.cumsum(np.nan_to_num(betas))])
+
+        df = pd.DataFrame({
+            "chromosome": chromosomes[codes[first]],
+            "start": positions[first],
+            "end": positions[last],
+            "n_cpgs": n_cpgs,
+            "z_score": region_z,
+            "p_value": region_p,
+            "p_sidak": region_sidak,
+            "fdr": benjamini_hochberg(region_p),
+            "min_p_value": [p_values[f:l + 1].min() for f, l in regions],
+            "mean_beta": (beta_sums[last + 1] - beta_sums[first]) / n_cpgs
+        })
+        return df[_REGION_COLUMNS].sort_values("p_value", kind="stable").reset_index(drop=True), self._describe_acf(acf, pair_counts)
+
+    def run(self, session: Session, analysis: AnalysisJob) -> Dict:
+        """Find the regions of a completed analysis and replace its stored regions"""
+        frame = ResultRepository(session).frame(analysis, ["chromosome", "position", "p_value", "beta"])
+        regions, acf = self.find_regions(frame)
+
+        session.exec(delete(DifferentialRegion).where(DifferentialRegion.analysis_id == analysis.id))
+        if len(regions):
+            rows = regions.to_dict(orient="records")
+            for row in rows:
+                row["analysis_id"] = analysis.id
+            session.execute(insert(DifferentialRegion), rows)
+        ResultRepository(session).mark_changed(analysis)
+        session.commit()
+        return {
+            "analysis_id": analysis.id,
+            "n_regions": int(len(regions)),
+            "n_significant": int((regions["p_sidak"] < 0.05).sum()) if len(regions) else 0,
+            "parameters": {
+                "max_distance": self.max_distance,
+                "step": self.step,
+                "seed_p": self.seed_p,
+                "min_cpgs": self.min_cpgs
+            },
+            "autocorrelation": acf
+        }
+
+    def _autocorrelation(self, keys: np.ndarray, z: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Pearson correlation of z between CpG pairs, and the number of pairs, per ``step``-wide distance bin"""
+        n_bins = self.max_distance // self.step + 1
+        sums = np.zeros((6, n_bins))
+        for offset in range(1, len(keys)):
+            distance = keys[offset:] - keys[:-offset]
+            # Pairs across chromosomes are more than a stride apart
+            valid = distance <= self.max_distance
+            if not valid.any():
+                break
+            bins = distance[valid] // self.step
+            x, y = z[:-offset][valid], z[offset:][valid]
+            for i, weights in enumerate((None, x, y, x * x, y * y, x * y)):
+                sums[i] += np.bincount(bins, weights=weights, minlength=n_bins)
+
+        count, sx, sy, sxx, syy, sxy = sums
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = sxy / count - (sx / count) * (sy / count)
+            variance = np.sqrt((sxx / count - (sx / count) ** 2) * (syy / count - (sy / count) ** 2))
+            acf = covariance / variance
+        # Sparse bins carry no reliable estimate; negative correlation is treated as none
+        acf[(count < settings.DMR_MIN_PAIRS) | ~np.isfinite(acf)] = 0.0
+        return np.clip(acf, 0.0, 1.0), count.astype(np.int64)
+
+    def _liptak(self, z: np.ndarray, keys: np.ndarray, acf: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+        """Correlation-adjusted Stouffer z over the index ranges [low, high]
+
+        Each neighbour offset k adds the rho(distance) of the pairs (i, i + k)
+        inside every range, via a prefix sum that is dropped before the next
+        offset, so memory stays linear in the number of CpGs.
+        """
+        z_sums = np.concatenate([[0.0], np.cumsum(z)])
+        total = z_sums[high + 1] - z_sums[low]
+        variance = (high - low + 1).astype(np.float64)
+        for offset in range(1, len(keys)):
+            # Pairs (i, i + k) inside [low, high] have i in [low, high - k]
+            inside = np.flatnonzero(high - offset >= low)
+            if not len(inside):
+                break
+            distance = keys[offset:] - keys[:-offset]
+            valid = distance <= self.max_distance
+            if not valid.any():
+                break
+            rho = np.where(valid, acf[np.minimum(distance, self.max_distance) // self.step], 0.0)
+            prefix = np.concatenate([[0.0], np.cumsum(rho)])
+            variance[inside] += 2 * (prefix[high[inside] - offset + 1] - prefix[low[inside]])
+        return total / np.sqrt(variance)
+
+    def _merge_seeds(self, keys: np.ndarray, combined_p: np.ndarray) -> np.ndarray:
+        """(first, last) CpG indices of seed runs no more than ``max_distance`` apart"""
+        seeds = np.flatnonzero(combined_p < self.seed_p)
+        if not len(seeds):
+            return np.empty((0, 2), dtype=np.int64)
+        breaks = np.flatnonzero(np.diff(keys[seeds]) > self.max_distance) + 1
+        starts = np.concatenate([[0], breaks])
+        ends = np.concatenate([breaks - 1, [len(seeds) - 1]])
+        regions = np.column_stack([seeds[starts], seeds[ends]])
+        return regions[regions[:, 1] - regions[:, 0] + 1 >= self.min_cpgs]
+
+    def _describe_acf(self, acf: np.ndarray, pair_counts: np.ndarray) -> List[Dict]:
+        return [
+            {"distance": int(i * self.step), "correlation": float(rho), "pairs": int(n)}
+            for i, (rho, n) in enumerate(zip(acf, pair_counts))
+        ]
+
+_REGION_COLUMNS = [
+    "chromosome", "start", "end", "n_cpgs", "z_score", "p_value",
+    "p_sidak", "fdr", "min_p_value", "mean_beta"
+]
+
+def stored_regions(session: Session, analysis_id: int, max_p: Optional[float] = None, limit: int = 100, offset: int = 0) -> List[DifferentialRegion]:
+    """Stored regions of an analysis, most significant first"""
+    statement = select(DifferentialRegion).where(DifferentialRegion.analysis_id == analysis_id)
+    if max_p is not None:
+        statement = statement.where(DifferentialRegion.p_sidak <= max_p)
+    return session.exec(statement.order_by(DifferentialRegion.p_value).offset(offset).limit(limit)).all()
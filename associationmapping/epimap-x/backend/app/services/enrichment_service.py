@@ -0,0 +1,161 @@
+import numpy as np
+import os
+import glob
+import hashlib
+from functools import lru_cache
+from scipy import sparse, stats
+from typing import List, Dict, Optional, Iterable, Tuple
+from app.core.config import settings
+from app.utils.multiple_testing import benjamini_hochberg
+
+class GeneSetLibrary:
+    """Gene sets from GMT files precompiled into a sparse set x gene membership matrix"""
+
+    def __init__(self, names: List[str], descriptions: List[str], sources: List[str], genes: List[str], membership: sparse.csr_matrix):
+        self.names = names
+        self.descriptions = descriptions
+        self.sources = sources
+        self.genes = genes
+        self.gene_index = {gene: i for i, gene in enumerate(genes)}
+        self.membership = membership
+        self.version = None
+        self.set_sizes = np.asarray(membership.sum(axis=1)).ravel()
+
+    @classmethod
+    def from_gmt_files(cls, paths: Iterable[str]) -> "GeneSetLibrary":
+        names, descriptions, sources = [], [], []
+        gene_index: Dict[str, int] = {}
+        rows, cols = [], []
+
+        for path in paths:
+            source = os.path.splitext(os.path.basename(path))[0]
+            with open(path) as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) < 3:
+                        continue
+                    set_id = len(names)
+                    names.append(fields[0])
+                    descriptions.append(fields[1])
+                    sources.append(source)
+                    # Symbols are matched case-insensitively, so TP53 and tp53 are one member
+                    for gene in set(g.strip().upper() for g in fields[2:] if g.strip()):
+                        rows.append(set_id)
+                        cols.append(gene_index.setdefault(gene, len(gene_index)))
+
+        membership = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+            shape=(len(names), len(gene_index))
+        )
+        genes = [None] * len(gene_index)
+        for gene, i in gene_index.items():
+            genes[i] = gene
+        return cls(names, descriptions, sources, genes, membership)
+
+    def indicator(self, genes: Iterable[str]) -> np.ndarray:
+        """Dense 0/1 vector over the library's genes"""
+        vector = np.zeros(len(self.genes), dtype=np.float64)
+        idx = [self.gene_index[g.upper()] for g in genes if g and g.upper() in self.gene_index]
+        vector[idx] = 1.0
+        return vector
+
+    def members(self, set_idx: int, mask: np.ndarray) -> List[str]:
+        row = self.membership.indices[self.membership.indptr[set_idx]:self.membership.indptr[set_idx + 1]]
+        return [self.genes[i] for i in row if mask[i]]
+
+@lru_cache(maxsize=4)
+def _load_library(files: Tuple[Tuple[str, float], ...]) -> GeneSetLibrary:
+    library = GeneSetLibrary.from_gmt_files(path for path, _ in files)
+    # Identifies this compiled version of the files, e.g. for cache keys
+    library.version = hashlib.sha1(repr(files).encode()).hexdigest()
+    return library
+
+def get_gene_set_library(path: Optional[str] = None) -> Optional[GeneSetLibrary]:
+    """Return the compiled library for all GMT files under ``path``, recompiling only when they change"""
+    path = path or settings.GENESET_PATH
+    files = sorted(glob.glob(os.path.join(path, "*.gmt")))
+    if not files:
+        return None
+    return _load_library(tuple((f, os.path.getmtime(f)) for f in files))
+
+class EnrichmentService:
+    def __init__(self, library: Optional[GeneSetLibrary] = None):
+        self.library = library or get_gene_set_library()
+
+    def over_representation(
+        self,
+        genes: Iterable[str],
+        background: Optional[Iterable[str]] = None,
+        min_size: int = 5,
+        max_size: int = 500,
+        limit: int = 50
+    ) -> Dict[str, Dict]:
+        """Hypergeometric over-representation test of ``genes`` against every gene set at once"""
+        library = self.library
+        universe = library.indicator(background) if background is not None else np.ones(len(library.genes))
+        query = library.indicator(genes) * universe
+
+        N = universe.sum()
+        n = query.sum()
+        set_sizes = library.membership @ universe
+        overlaps = library.membership @ query
+
+        testable = (set_sizes >= min_size) & (set_sizes <= max_size) & (overlaps > 0)
+        p_values = np.ones(len(set_sizes))
+        if n > 0 and testable.any():
+            p_values[testable] = stats.hypergeom.sf(overlaps[testable] - 1, N, set_sizes[testable], n)
+
+        return self._format(p_values, testable, overlaps, set_sizes, query > 0, limit)
+
+    def rank_enrichment(
+        self,
+        gene_scores: Dict[str, float],
+        min_size: int = 5,
+        max_size: int = 500,
+        limit: int = 50
+    ) -> Dict[str, Dict]:
+        """Rank-sum (Mann-Whitney) test of higher gene scores inside each set versus outside"""
+        library = self.library
+        scored = {g.upper(): s for g, s in gene_scores.items() if g and g.upper() in library.gene_index}
+        universe = library.indicator(scored.keys())
+        idx = np.array([library.gene_index[g] for g in scored], dtype=np.int64)
+        ranks = np.zeros(len(library.genes))
+        if len(idx):
+            ranks[idx] = stats.rankdata(np.fromiter(scored.values(), dtype=np.float64, count=len(idx)))
+
+        N = universe.sum()
+        set_sizes = library.membership @ universe
+        rank_sums = library.membership @ ranks
+
+        testable = (set_sizes >= min_size) & (set_sizes <= max_size) & (set_sizes < N)
+        p_values = np.ones(len(set_sizes))
+        if testable.any():
+            K = set_sizes[testable]
+            u = rank_sums[testable] - K * (K + 1) / 2
+            z = (u - K * (N - K) / 2) / np.sqrt(K * (N - K) * (N + 1) / 12)
+            p_values[testable] = stats.norm.sf(z)
+
+        return self._format(p_values, testable, set_sizes, set_sizes, universe > 0, limit)
+
+    def _format(self, p_values, testable, overlaps, set_sizes, gene_mask, limit) -> Dict[str, Dict]:
+        library = self.library
+        fdr = np.ones(len(p_values))
+        tested = np.flatnonzero(testable)
+        if len(tested):
+            fdr[tested] = benjamini_hochberg(p_values[tested])
+
+        order = tested[np.argsort(p_values[tested], kind="stable")][:limit]
+        # Keyed by source as well: GMT files from different collections can reuse set names
+        return {
+            f"{library.sources[i]}:{library.names[i]}": {
+                "name": library.names[i],
+                "genes": library.members(i, gene_mask),
+                "p_value": float(p_values[i]),
+                "fdr": float(fdr[i]),
+                "overlap": int(overlaps[i]),
+                "set_size": int(set_sizes[i]),
+                "source": library.sources[i],
+                "description": library.descriptions[i]
+            }
+            for i in order
+        }
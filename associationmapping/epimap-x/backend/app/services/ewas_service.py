@@ -1,20 +1,59 @@
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
-from typing import List, Dict
-import io
+from typing import List, Dict, Optional, Callable, Union, BinaryIO
+from app.core.config import settings
+from app.core.metrics import stage
+from app.services.qc_service import ProbeQCService
+from app.services.confounder_service import ConfounderService
+from app.services.permutation_service import PermutationService
+from app.services.glm_service import GLMEngine
+from app.services.checkpoint_service import CheckpointStore
+from app.utils.data_parser import read_table
+
+def result_record(cpg_id: str, beta: float, se: float, p_value: float) -> Dict:
+    # Parse chromosome and position from CpG ID (assuming format like "chr1:12345")
+    if ':' in cpg_id:
+        chrom, pos = cpg_id.split(':')
+        position = int(pos)
+    else:
+        chrom = "unknown"
+        position = 0
+    
+    return {
+        'cpg_id': cpg_id,
+        'chromosome': chrom,
+        'position': position,
+        'beta': float(beta),
+        'se': float(se),
+        'p_value': float(p_value)
+    }
 
 class EWASService:
+    def __init__(self):
+        self.qc_report = None
+        self.confounder_report = None
+        self.confounders = None
+        self.model_report = None
+    
     def run_analysis(
         self,
-        epigenome_data: bytes,
-        phenotype_data: bytes,
+        epigenome_data: Union[bytes, BinaryIO, pd.DataFrame],
+        phenotype_data: Union[bytes, pd.DataFrame],
         phenotype_column: str,
-        covariates: List[str]
+        covariates: List[str],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        qc_service: Optional[ProbeQCService] = None,
+        confounder_service: Optional[ConfounderService] = None,
+        permutation_service: Optional[PermutationService] = None,
+        permutation_progress_callback: Optional[Callable[[int, int], None]] = None,
+        model_type: str = "linear_regression",
+        checkpoint: Optional[CheckpointStore] = None,
+        case_level: Optional[str] = None
     ) -> List[Dict]:
         # Load data
-        epigenome_df = pd.read_csv(io.BytesIO(epigenome_data), sep='\t', index_col=0)
-        phenotype_df = pd.read_csv(io.BytesIO(phenotype_data), index_col=0)
+        epigenome_df = read_table(epigenome_data, sep='\t', index_col=0)
+        phenotype_df = read_table(phenotype_data, index_col=0)
         
         # Align samples
         common_samples = epigenome_df.columns.intersection(phenotype_df.index)
@@ -25,64 +64,119 @@ class EWASService:
         y = phenotype_df[phenotype_column]
         X_covariates = phenotype_df[covariates] if covariates else pd.DataFrame(index=phenotype_df.index)
         
+        # Drop probes that cannot be modelled before fitting anything
+        self.qc_report = None
+        if qc_service is not None:
+            with stage("qc") as qc:
+                complete = (y.notna() & X_covariates.notna().all(axis=1)).to_numpy()
+                epigenome_df, self.qc_report = qc_service.filter(epigenome_df, complete)
+                qc.rows = len(epigenome_df)
+        
+        # Estimated confounders (surrogate variables or cell proportions) join the known covariates
+        self.confounder_report = self.confounders = None
+        if confounder_service is not None:
+            with stage("confounders", rows=len(epigenome_df)):
+                complete = y.notna() & X_covariates.notna().all(axis=1)
+                design = pd.concat([y, X_covariates], axis=1)[complete]
+                self.confounders, self.confounder_report = confounder_service.estimate(epigenome_df, design)
+                X_covariates = pd.concat([X_covariates, self.confounders.reindex(X_covariates.index)], axis=1)
+        
         results = []
         
-        # Run analysis for each CpG
-        for cpg_id in epigenome_df.index:
-            try:
-                # Get methylation values for this CpG
-                methylation = epigenome_df.loc[cpg_id]
-                
-                # Prepare design matrix
-                X = pd.concat([methylation, X_covariates], axis=1)
-                X = sm.add_constant(X)
-                
-                # Remove samples with missing data
-                complete_cases = ~(X.isna().any(axis=1) | y.isna())
-                X_clean = X[complete_cases]
-                y_clean = y[complete_cases]
-                
-                if len(X_clean) < 10:  # Skip if too few samples
-                    continue
-                
-                # Fit linear model
-                model = sm.OLS(y_clean, X_clean)
-                fitted_model = model.fit()
-                
-                # Extract results for methylation coefficient (first non-constant term)
-                beta = fitted_model.params.iloc[1]  # Methylation coefficient
-                p_value = fitted_model.pvalues.iloc[1]
-                
-                # Parse chromosome and position from CpG ID (assuming format like "chr1:12345")
-                if ':' in cpg_id:
-                    chrom, pos = cpg_id.split(':')
-                    position = int(pos)
+        # Non-linear models are fitted block-wise with batched IRLS instead of one statsmodels fit per CpG
+        engine = GLMEngine(model_type, y, X_covariates, case_level=case_level) if model_type != "linear_regression" else None
+        self.model_report = None
+        if engine is not None and engine.case_level is not None:
+            self.model_report = {"case_level": engine.case_level, "control_level": engine.control_level}
+        
+        # statsmodels needs a numeric design: dummy-code categorical covariates once, keeping missing rows missing
+        covariate_design = X_covariates
+        if len(X_covariates.columns):
+            covariate_design = pd.get_dummies(X_covariates, drop_first=True, dtype=float)
+            covariate_design.loc[X_covariates.isna().any(axis=1)] = np.nan
+        
+        # Run analysis for each CpG, chunk by chunk
+        cpg_ids = epigenome_df.index
+        total = len(cpg_ids)
+        chunk_size = settings.EWAS_CHUNK_SIZE
+        
+        # Blocks finished by an earlier attempt of this run are taken from their checkpoints
+        completed = checkpoint.begin(cpg_ids, chunk_size) if checkpoint is not None else {}
+        
+        with stage("fitting", rows=total):
+            for chunk_start in range(0, total, chunk_size):
+                block_id = chunk_start // chunk_size
+                block_start = len(results)
+                if block_id in completed:
+                    results.extend(completed[block_id])
+                elif engine is not None:
+                    block = epigenome_df.iloc[chunk_start:chunk_start + chunk_size]
+                    betas, ses, p_values, usable = engine.fit(block.to_numpy(dtype=np.float64))
+                    for i in np.flatnonzero(usable):
+                        results.append(self._result(block.index[i], betas[i], ses[i], p_values[i]))
                 else:
-                    chrom = "unknown"
-                    position = 0
+                    for cpg_id in cpg_ids[chunk_start:chunk_start + chunk_size]:
+                        try:
+                            # Get methylation values for this CpG
+                            methylation = epigenome_df.loc[cpg_id]
+                            
+                            # Prepare design matrix
+                            X = pd.concat([methylation, covariate_design], axis=1)
+                            X = sm.add_constant(X)
+                            
+                            # Remove samples with missing data
+                            complete_cases = ~(X.isna().any(axis=1) | y.isna())
+                            X_clean = X[complete_cases]
+                            y_clean = y[complete_cases]
+                            
+                            if len(X_clean) < 10:  # Skip if too few samples
+                                continue
+                            
+                            # Fit linear model
+                            model = sm.OLS(y_clean, X_clean)
+                            fitted_model = model.fit()
+                            
+                            # Extract results for methylation coefficient (first non-constant term)
+                            beta = fitted_model.params.iloc[1]  # Methylation coefficient
+                            p_value = fitted_model.pvalues.iloc[1]
+                            se = fitted_model.bse.iloc[1]
+                            
+                            results.append(self._result(cpg_id, beta, se, p_value))
+                            
+                        except Exception as e:
+                            # Skip problematic CpGs
+                            continue
                 
-                results.append({
-                    'cpg_id': cpg_id,
-                    'chromosome': chrom,
-                    'position': position,
-                    'beta': float(beta),
-                    'p_value': float(p_value)
-                })
+                if checkpoint is not None and block_id not in completed:
+                    checkpoint.save(block_id, results[block_start:])
                 
-            except Exception as e:
-                # Skip problematic CpGs
-                continue
+                if progress_callback:
+                    progress_callback(min(chunk_start + chunk_size, total), total)
+            
+        # Empirical and max-T p-values are reported beside the parametric ones. FDR stays on the
+        # parametric p-values: with B permutations no empirical p-value can fall below 1/(B+1)
+        if permutation_service is not None and results:
+            tested = epigenome_df.loc[[r['cpg_id'] for r in results]]
+            with stage("permutations", rows=len(tested)):
+                empirical = permutation_service.run(tested, y, X_covariates, permutation_progress_callback)
+            for result, p, fwer in zip(results, empirical['empirical_p'], empirical['fwer_p']):
+                result['empirical_p'] = float(p)
+                result['fwer_p'] = None if fwer is None else float(fwer)
         
         # Apply FDR correction
         if results:
-            p_values = [r['p_value'] for r in results]
-            fdr_values = self._benjamini_hochberg_correction(p_values)
-            
-            for i, result in enumerate(results):
-                result['fdr'] = fdr_values[i]
+            with stage("fdr", rows=len(results)):
+                p_values = [r['p_value'] for r in results]
+                fdr_values = self._benjamini_hochberg_correction(p_values)
+                
+                for i, result in enumerate(results):
+                    result['fdr'] = fdr_values[i]
         
         return results
     
+    def _result(self, cpg_id: str, beta: float, se: float, p_value: float) -> Dict:
+        return result_record(cpg_id, beta, se, p_value)
+    
     def _benjamini_hochberg_correction(self, p_values: List[float]) -> List[float]:
         """Apply Benjamini-Hochberg FDR correction"""
         n = len(p_values)
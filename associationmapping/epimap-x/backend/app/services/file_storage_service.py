@@ -1,30 +1,117 @@
 from fastapi import UploadFile
 from app.core.config import settings
 from app.db.models import FileType
+from app.services.storage_backends import StorageBackend, BlobReader, get_storage_backend
+from typing import Dict, Iterator, List, Optional
+import csv
+import hashlib
+import io
 import uuid
 import os
-import shutil
+
+# Cells pandas reads as missing by default
+MISSING_VALUES = {"", "NA", "N/A", "NaN", "nan", "NULL", "null", "None", "n/a", "<NA>", "#N/A", "-NaN", "-nan"}
 
 class FileStorageService:
-    def __init__(self):
-        # Create local storage directory if it doesn't exist
-        os.makedirs(settings.LOCAL_STORAGE_PATH, exist_ok=True)
+    """Content-addressed file storage: each distinct file is stored once under its SHA-256"""
+    
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend = backend or get_storage_backend()
+        # Uploads are spooled locally while they are hashed, then promoted to the backend
+        self.spool_dir = os.path.join(settings.LOCAL_STORAGE_PATH, "incoming")
+        os.makedirs(self.spool_dir, exist_ok=True)
     
     async def upload_file(self, file: UploadFile, file_type: FileType) -> str:
-        file_id = str(uuid.uuid4())
-        file_path = f"{file_type.value}/{file_id}_{file.filename}"
-        full_path = os.path.join(settings.LOCAL_STORAGE_PATH, file_path)
+        return (await self.save_upload(file, file_type, require_valid=False))["file_path"]
+    
+    async def save_upload(self, file: UploadFile, file_type: FileType, require_valid: bool = True) -> Dict:
+        """Stream an upload to a spool file, hashing and validating it on the fly.
+        
+        Invalid files are discarded (``file_path`` is None) unless ``require_valid`` is False.
+        """
+        # The validator needs pandas, which downloads and storage lookups should not load
+        from app.utils.data_parser import StreamingValidator
         
-        # Create subdirectory
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        spool_path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}.part")
+        hasher = hashlib.sha256()
+        validator = StreamingValidator(numeric=file_type != FileType.PHENOTYPE)
+        size_bytes = 0
         
-        # Save file
-        with open(full_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Save file chunk by chunk
+        try:
+            with open(spool_path, "wb") as buffer:
+                while True:
+                    chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    buffer.write(chunk)
+                    hasher.update(chunk)
+                    validator.feed(chunk)
+                    size_bytes += len(chunk)
+        except BaseException:
+            os.remove(spool_path)
+            raise
         
-        return file_path
+        sha256 = hasher.hexdigest()
+        validation = validator.finish()
+        if validation["is_valid"] or not require_valid:
+            file_path = self.store_local_file(spool_path, sha256)
+        else:
+            os.remove(spool_path)
+            file_path = None
+        
+        return {
+            "file_path": file_path,
+            "size_bytes": size_bytes,
+            "sha256": sha256,
+            "validation": validation
+        }
+    
+    def store_local_file(self, source_path: str, sha256: str) -> str:
+        """Move a fully written local file into storage, unless a blob with the same content exists"""
+        key = self.blob_key(sha256)
+        if self.backend.exists(key):
+            os.remove(source_path)
+        else:
+            self.backend.put_file(key, source_path)
+        return key
+    
+    def delete_file(self, file_path: str):
+        self.backend.delete(file_path)
     
     def download_file(self, file_path: str) -> bytes:
-        full_path = os.path.join(settings.LOCAL_STORAGE_PATH, file_path)
-        with open(full_path, "rb") as f:
-            return f.read()
\ No newline at end of file
+        return self.backend.read(file_path)
+    
+    def read_range(self, file_path: str, start: int, length: int) -> bytes:
+        return self.backend.read_range(file_path, start, length)
+    
+    def iter_file(self, file_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        return self.backend.iter_chunks(file_path, settings.UPLOAD_CHUNK_SIZE, start, end)
+    
+    def open_file(self, file_path: str) -> io.BufferedReader:
+        """Buffered, seekable reader that fetches byte ranges on demand (usable with pandas chunked readers)"""
+        return io.BufferedReader(BlobReader(self.backend, file_path), buffer_size=settings.UPLOAD_CHUNK_SIZE)
+    
+    def column_values(self, file_path: str, column: str, limit: int = 10) -> Optional[List[str]]:
+        """Distinct non-missing values of one column of a delimited table (up to ``limit``); None if there is no such column"""
+        with io.TextIOWrapper(self.open_file(file_path), encoding="utf-8", newline="") as text:
+            reader = csv.reader(text)
+            header = next(reader, [])
+            if column not in header[1:]:
+                return None
+            index = header.index(column, 1)
+            values = []
+            for row in reader:
+                value = row[index].strip() if index < len(row) else ""
+                if value not in MISSING_VALUES and value not in values:
+                    values.append(value)
+                    if len(values) >= limit:
+                        break
+            return values
+    
+    def file_size(self, file_path: str) -> int:
+        return self.backend.size(file_path)
+    
+    @staticmethod
+    def blob_key(sha256: str) -> str:
+        return f"blobs/{sha256[:2]}/{sha256}"
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from typing import Optional, Tuple
+from app.utils.regression import design_matrix, batched_irls, Binomial, Poisson, NegativeBinomial
+from app.core.options import MODEL_TYPES, resolve_case_level
+
+class GLMEngine:
+    """Fits phenotype ~ methylation + covariates as a GLM for a whole block of CpGs at once.
+
+    The phenotype is the response, so its encoding, the covariate design and
+    (for the negative binomial) the dispersion are fixed once per analysis;
+    each block only adds its methylation column and runs batched IRLS.
+    """
+
+    def __init__(self, model_type: str, y: pd.Series, covariates: pd.DataFrame, min_samples: int = 10,
+                 case_level: Optional[str] = None):
+        if model_type not in MODEL_TYPES[1:]:
+            raise ValueError(f"Unknown GLM model type: {model_type}")
+        self.model_type = model_type
+        self.min_samples = min_samples
+        self.case_level = self.control_level = None
+
+        complete = (y.notna() & covariates.notna().all(axis=1)).to_numpy()
+        self.y = np.where(complete, self._encode(y, case_level), 0.0)
+        self.base_weights = complete.astype(np.float64)
+        self.design = np.nan_to_num(design_matrix(covariates))
+
+        if model_type == "logistic_regression":
+            self.family = Binomial()
+        elif model_type == "poisson_regression":
+            self.family = Poisson()
+        else:
+            self.family = NegativeBinomial(self._estimate_alpha())
+
+    def fit(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Methylation coefficient, its SE, Wald p-value and a usable mask for each row of ``values``"""
+        observed = np.isfinite(values)
+        weights = self.base_weights * observed
+        X = np.empty((len(values), values.shape[1], self.design.shape[1] + 1))
+        X[:, :, 0] = 1.0
+        X[:, :, 1] = np.where(observed, values, 0.0)
+        X[:, :, 2:] = self.design[:, 1:]
+
+        beta, se, converged = batched_irls(X, self.y, weights, self.family)
+        beta, se = beta[:, 1], se[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p_values = 2 * stats.norm.sf(np.abs(beta / se))
+        # A probe that is constant over the used samples is collinear with the intercept
+        used = weights > 0
+        varying = np.where(used, values, -np.inf).max(axis=1) > np.where(used, values, np.inf).min(axis=1)
+        usable = converged & varying & (weights.sum(axis=1) >= self.min_samples) & np.isfinite(p_values) & (se > 0)
+        return beta, se, p_values, usable
+
+    def _estimate_alpha(self) -> float:
+        """Method-of-moments dispersion from the covariates-only Poisson fit"""
+        beta, _, _ = batched_irls(self.design[None], self.y, self.base_weights[None], Poisson())
+        mu = Poisson().mean(self.design @ beta[0])
+        used = self.base_weights > 0
+        dof = max(used.sum() - self.design.shape[1], 1)
+        alpha = np.sum(((self.y - mu) ** 2 - mu)[used] / mu[used] ** 2) / dof
+        return float(max(alpha, 1e-8))
+
+    def _encode(self, y: pd.Series, case_level: Optional[str]) -> np.ndarray:
+        if self.model_type == "logistic_regression":
+            levels = list(y.dropna().unique())
+            # The requested level, a recognised case label or the larger numeric code is modelled as 1
+            case = resolve_case_level(levels, case_level)
+            self.case_level, self.control_level = str(case), str(levels[1 - levels.index(case)])
+            return (y == case).to_numpy(dtype=np.float64)
+        values = pd.to_numeric(y, errors="coerce").to_numpy(dtype=np.float64)
+        if np.nanmin(values) < 0:
+            raise ValueError(f"{self.model_type} needs a non-negative count phenotype")
+        return values
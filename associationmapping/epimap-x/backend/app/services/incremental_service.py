@@ -0,0 +1,215 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from scipy import stats
+from typing import Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.ewas_service import result_record
+from app.services.qc_service import ProbeQCService
+from app.utils.multiple_testing import benjamini_hochberg
+from app.core.options import CROSS_SAMPLE_STEPS
+
+class SufficientStatistics:
+    """Per-CpG cross-products that linear EWAS results are solved from, and that new samples add to.
+
+    With z = [1, covariates, phenotype], each CpG keeps, over the samples
+    where it was observed, the packed upper triangle of sum(z z') (``zz``),
+    sum(x z) (``xz``) and sum(x^2) (``xx``). That is everything
+    ``y ~ 1 + x + covariates`` needs, so appending samples only adds their
+    products and the original matrix is never read again. Values are
+    shifted by the first run's means, which leaves the methylation
+    coefficient unchanged but keeps the sums well conditioned.
+    """
+
+    def __init__(self, cpg_ids: pd.Index, samples: np.ndarray, encoding: Dict,
+                 x_shift: np.ndarray, z_shift: np.ndarray, zz: np.ndarray, xz: np.ndarray, xx: np.ndarray):
+        self.cpg_ids = pd.Index(cpg_ids)
+        self.samples = np.asarray(samples, dtype=str)
+        self.encoding = encoding
+        self.x_shift = x_shift
+        self.z_shift = z_shift
+        self.zz = zz
+        self.xz = xz
+        self.xx = xx
+
+    @classmethod
+    def collect(
+        cls,
+        epigenome_df: pd.DataFrame,
+        phenotype_df: pd.DataFrame,
+        phenotype_column: str,
+        covariates: List[str],
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> "SufficientStatistics":
+        """Statistics of a first run, over the same samples a linear EWAS of this data uses"""
+        common_samples = epigenome_df.columns.intersection(phenotype_df.index)
+        epigenome_df = epigenome_df[common_samples]
+        phenotype_df = phenotype_df.loc[common_samples]
+
+        # Categorical covariates keep the levels (and dropped first level) of pd.get_dummies
+        levels = {}
+        for c in covariates:
+            if not pd.api.types.is_numeric_dtype(phenotype_df[c]):
+                levels[c] = [str(v) for v in pd.Categorical(phenotype_df[c].dropna()).categories]
+        encoding = {"phenotype_column": phenotype_column, "covariates": list(covariates), "levels": levels}
+
+        z, complete = cls._encode(encoding, phenotype_df)
+        z_shift = np.r_[0.0, z[complete, 1:].mean(axis=0)] if complete.any() else np.zeros(z.shape[1])
+        n_pairs = len(np.triu_indices(z.shape[1])[0])
+        statistics = cls(
+            epigenome_df.index, common_samples[complete].to_numpy(), encoding, np.zeros(len(epigenome_df)),
+            z_shift, np.zeros((len(epigenome_df), n_pairs)), np.zeros((len(epigenome_df), z.shape[1])), np.zeros(len(epigenome_df))
+        )
+        statistics._accumulate(epigenome_df, z[complete], complete, set_shift=True, progress_callback=progress_callback)
+        return statistics
+
+    def add(
+        self,
+        epigenome_df: pd.DataFrame,
+        phenotype_df: pd.DataFrame,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Dict:
+        """Fold in new samples; CpGs not in the first run are ignored, CpGs absent here gain nothing"""
+        common_samples = epigenome_df.columns.intersection(phenotype_df.index)
+        seen = common_samples.isin(self.samples)
+        if seen.any():
+            raise ValueError(f"{int(seen.sum())} samples are already included, e.g. {common_samples[seen][0]}")
+        z, complete = self._encode(self.encoding, phenotype_df.loc[common_samples])
+
+        rows = epigenome_df.index.get_indexer(self.cpg_ids)
+        present = rows >= 0
+        aligned = epigenome_df.iloc[rows[present]][common_samples[complete]]
+        self._accumulate(aligned, z[complete], np.ones(complete.sum(), dtype=bool), positions=np.flatnonzero(present),
+                         progress_callback=progress_callback)
+        self.samples = np.r_[self.samples, common_samples[complete].to_numpy(dtype=str)]
+        return {
+            "added_samples": int(complete.sum()),
+            "incomplete_samples": int((~complete).sum()),
+            "total_samples": len(self.samples),
+            "cpgs_not_in_update": int((~present).sum()),
+            "new_cpgs_ignored": int((~epigenome_df.index.isin(self.cpg_ids)).sum())
+        }
+
+    def results(self, qc_service: Optional[ProbeQCService] = None, min_samples: int = 10) -> Tuple[List[Dict], Optional[Dict]]:
+        """Linear EWAS results (with FDR) for the accumulated samples, and the QC report when QC is applied"""
+        n_observed = self.zz[:, 0]
+        qc_report = None
+        keep = np.ones(len(self.cpg_ids), dtype=bool)
+        if qc_service is not None:
+            # Same thresholds as a full run: observed counts and variances follow from the sums
+            sum_x = self.xz[:, 0]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                sq = np.where(n_observed > 0, self.xx - sum_x ** 2 / n_observed, 0.0)
+            variances = np.maximum(sq, 0.0) / (np.maximum(n_observed, 2) - 1)
+            keep, qc_report = qc_service.evaluate_statistics(self.cpg_ids, len(self.samples), n_observed.astype(np.int64), variances)
+
+        results = []
+        chunk_size = settings.EWAS_CHUNK_SIZE
+        for start in range(0, len(self.cpg_ids), chunk_size):
+            rows = slice(start, start + chunk_size)
+            beta, se, p_values = self._solve(rows, min_samples)
+            for i in np.flatnonzero(keep[rows] & np.isfinite(p_values)):
+                results.append(result_record(self.cpg_ids[start + i], beta[i], se[i], p_values[i]))
+
+        if results:
+            for result, fdr in zip(results, benjamini_hochberg([r["p_value"] for r in results])):
+                result["fdr"] = float(fdr)
+        return results, qc_report
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f, cpg_ids=self.cpg_ids.to_numpy(dtype=str), samples=self.samples, encoding=np.array(json.dumps(self.encoding)),
+                x_shift=self.x_shift, z_shift=self.z_shift, zz=self.zz, xz=self.xz, xx=self.xx
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SufficientStatistics":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                pd.Index(data["cpg_ids"]), data["samples"], json.loads(str(data["encoding"])),
+                data["x_shift"], data["z_shift"], data["zz"], data["xz"], data["xx"]
+            )
+
+    @staticmethod
+    def _encode(encoding: Dict, phenotype_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Design rows [1, covariates, phenotype] and which samples have all of them"""
+        columns = [np.ones(len(phenotype_df))]
+        for c in encoding["covariates"]:
+            if c not in phenotype_df.columns:
+                raise ValueError(f"Covariate '{c}' is not in the phenotype file")
+            values = phenotype_df[c]
+            if c not in encoding["levels"]:
+                columns.append(values.astype(np.float64).to_numpy())
+                continue
+            levels = encoding["levels"][c]
+            text = values.astype(str)
+            unknown = sorted(set(text[values.notna()]) - set(levels))
+            if unknown:
+                raise ValueError(f"Covariate '{c}' has levels not in the original analysis: {', '.join(unknown)}")
+            for level in levels[1:]:
+                columns.append(np.where(values.notna(), (text == level).to_numpy(dtype=np.float64), np.nan))
+        columns.append(phenotype_df[encoding["phenotype_column"]].astype(np.float64).to_numpy())
+        z = np.column_stack(columns)
+        return z, np.isfinite(z).all(axis=1)
+
+    def _accumulate(self, epigenome_df: pd.DataFrame, z: np.ndarray, sample_mask: np.ndarray,
+                    positions: Optional[np.ndarray] = None, set_shift: bool = False,
+                    progress_callback: Optional[Callable[[int, int], None]] = None):
+        z = z - self.z_shift
+        upper, lower = np.triu_indices(z.shape[1])
+        products = z[:, upper] * z[:, lower]
+        total = len(epigenome_df)
+        chunk_size = settings.EWAS_CHUNK_SIZE
+        for start in range(0, total, chunk_size):
+            values = epigenome_df.iloc[start:start + chunk_size].to_numpy(dtype=np.float64)[:, sample_mask]
+            rows = slice(start, start + len(values)) if positions is None else positions[start:start + chunk_size]
+            observed = np.isfinite(values)
+            if set_shift:
+                counts = observed.sum(axis=1)
+                sums = np.where(observed, values, 0.0).sum(axis=1)
+                self.x_shift[rows] = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+            x = np.where(observed, values - self.x_shift[rows][:, None], 0.0)
+            self.zz[rows] += observed.astype(np.float64) @ products
+            self.xz[rows] += x @ z
+            self.xx[rows] += np.einsum("ij,ij->i", x, x)
+            if progress_callback:
+                progress_callback(min(start + chunk_size, total), total)
+
+    def _solve(self, rows: slice, min_samples: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Methylation coefficient, SE and t-test p-value per CpG, by partialling out [1, covariates]"""
+        m = self.xz.shape[1]
+        upper, lower = np.triu_indices(m)
+        gram = np.empty((len(self.zz[rows]), m, m))
+        gram[:, upper, lower] = self.zz[rows]
+        gram[:, lower, upper] = self.zz[rows]
+        n = gram[:, 0, 0]
+
+        # Covariate block (intercept included) and its cross-products with methylation and phenotype
+        design = gram[:, :-1, :-1]
+        design_y = gram[:, :-1, -1]
+        design_x = self.xz[rows, :-1]
+        inverse = np.linalg.pinv(design, hermitian=True)
+        rank = np.linalg.matrix_rank(design, hermitian=True)
+        projected_x = np.einsum("pij,pj->pi", inverse, design_x)
+        sxx = self.xx[rows] - np.einsum("pi,pi->p", design_x, projected_x)
+        sxy = self.xz[rows, -1] - np.einsum("pi,pi->p", projected_x, design_y)
+        syy = gram[:, -1, -1] - np.einsum("pi,pij,pj->p", design_y, inverse, design_y)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            total_ss = self.xx[rows] - self.xz[rows, 0] ** 2 / n
+            dof = n - rank - 1
+            beta = sxy / sxx
+            rss = np.maximum(syy - beta * sxy, 0.0)
+            se = np.sqrt(rss / dof / sxx)
+            p_values = 2 * stats.t.sf(np.abs(beta / se), np.maximum(dof, 1))
+        # Too few samples, or methylation constant or collinear with the covariates
+        degenerate = (n < min_samples) | (dof <= 0) | (sxx <= 1e-10 * total_ss) | ~(total_ss > 0) | ~(se > 0)
+        return beta, se, np.where(degenerate, np.nan, p_values)
+
+def sufficient_stats_path(analysis_id: int) -> str:
+    return os.path.join(settings.SUFFICIENT_STATS_PATH, f"analysis_{analysis_id}.npz")
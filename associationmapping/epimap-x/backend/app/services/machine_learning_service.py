@@ -4,7 +4,8 @@ from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.model_selection import cross_val_score, train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, roc_auc_score, mean_squared_error, r2_score
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
+from app.utils.data_parser import read_table
 import io
 import joblib
 
@@ -15,16 +16,16 @@ class MachineLearningService:
     
     def train_methylation_predictor(
         self,
-        methylation_data: bytes,
-        phenotype_data: bytes,
+        methylation_data: Union[bytes, pd.DataFrame],
+        phenotype_data: Union[bytes, pd.DataFrame],
         phenotype_column: str,
         model_type: str = "classification"
     ) -> Dict:
         """Train ML model to predict phenotype from methylation data"""
         
         # Load data
-        meth_df = pd.read_csv(io.BytesIO(methylation_data), sep='\t', index_col=0)
-        pheno_df = pd.read_csv(io.BytesIO(phenotype_data), index_col=0)
+        meth_df = read_table(methylation_data, sep='\t', index_col=0)
+        pheno_df = read_table(phenotype_data, index_col=0)
         
         # Align samples
         common_samples = meth_df.columns.intersection(pheno_df.index)
@@ -184,7 +185,7 @@ class MachineLearningService:
         features = model_info["features"]
         
         # Load new data
-        meth_df = pd.read_csv(io.BytesIO(methylation_data), sep='\t', index_col=0)
+        meth_df = read_table(methylation_data, sep='\t', index_col=0)
         
         # Select features and align
         X_new = meth_df.loc[features].T  # Samples as rows
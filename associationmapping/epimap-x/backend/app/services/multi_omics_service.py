@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
+from app.utils.data_parser import read_table
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 import io
@@ -12,17 +13,17 @@ class MultiOmicsService:
     
     def integrate_methylation_expression(
         self,
-        methylation_data: bytes,
-        expression_data: bytes,
-        phenotype_data: bytes,
+        methylation_data: Union[bytes, pd.DataFrame],
+        expression_data: Union[bytes, pd.DataFrame],
+        phenotype_data: Union[bytes, pd.DataFrame],
         phenotype_column: str
     ) -> Dict:
         """Integrate methylation and gene expression data"""
         
         # Load data
-        meth_df = pd.read_csv(io.BytesIO(methylation_data), sep='\t', index_col=0)
-        expr_df = pd.read_csv(io.BytesIO(expression_data), sep='\t', index_col=0)
-        pheno_df = pd.read_csv(io.BytesIO(phenotype_data), index_col=0)
+        meth_df = read_table(methylation_data, sep='\t', index_col=0)
+        expr_df = read_table(expression_data, sep='\t', index_col=0)
+        pheno_df = read_table(phenotype_data, index_col=0)
         
         # Align samples
         common_samples = set(meth_df.columns) & set(expr_df.columns) & set(pheno_df.index)
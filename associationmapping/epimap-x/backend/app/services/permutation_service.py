@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Optional
+from app.core.config import settings
+from app.utils.regression import design_matrix, orthonormal_basis, residualize, impute_row_means
+
+# Slack for float32 round-off when comparing permuted and observed statistics
+_TIE_TOLERANCE = 1e-6
+
+class PermutationService:
+    """Empirical per-CpG and max-T family-wise p-values from phenotype permutations.
+
+    Methylation and phenotype are residualized on the covariates once
+    (Freedman-Lane style, permuting the phenotype residuals). With unit-norm
+    residual rows the test statistic is a correlation, so a batch of
+    permutations is one matrix product against the precomputed CpG matrix,
+    and |t| is monotone in |r| for the fixed residual degrees of freedom.
+
+    Adaptive stopping (Besag-Clifford) drops a CpG once ``stop_hits``
+    permutations have beaten it. Max-T needs every CpG in every permutation,
+    so it disables the early stopping.
+    """
+
+    def __init__(
+        self,
+        n_permutations: Optional[int] = None,
+        max_t: bool = True,
+        adaptive: bool = True,
+        batch_size: Optional[int] = None,
+        stop_hits: Optional[int] = None,
+        seed: int = 0
+    ):
+        self.n_permutations = n_permutations or settings.PERMUTATION_COUNT
+        if self.n_permutations <= 0:
+            raise ValueError("n_permutations must be positive")
+        self.max_t = max_t
+        self.adaptive = adaptive and not max_t
+        self.batch_size = batch_size or settings.PERMUTATION_BATCH_SIZE
+        self.stop_hits = stop_hits or settings.PERMUTATION_STOP_HITS
+        self.seed = seed
+
+    def run(
+        self,
+        epigenome_df: pd.DataFrame,
+        y: pd.Series,
+        covariates: pd.DataFrame,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> pd.DataFrame:
+        """Return ``empirical_p``, ``fwer_p`` (max-T, or None) and ``n_permutations`` per CpG.
+
+        Samples with a missing phenotype or covariate are dropped; missing
+        methylation values are imputed with the probe mean.
+        """
+        complete = (y.notna() & covariates.notna().all(axis=1)).to_numpy()
+        samples = y.index[complete]
+        basis, _ = orthonormal_basis(design_matrix(covariates.loc[samples]))
+
+        y_residual = residualize(y.loc[samples].to_numpy(dtype=np.float64)[None, :], basis)[0]
+        y_norm = np.linalg.norm(y_residual)
+        if y_norm == 0:
+            raise ValueError("Phenotype is constant after adjusting for covariates")
+        y_residual = (y_residual / y_norm).astype(np.float32)
+
+        residuals = self._residual_matrix(epigenome_df[samples], basis)
+        observed = np.abs(residuals @ y_residual) - _TIE_TOLERANCE
+
+        n_cpgs, n_samples = residuals.shape
+        hits = np.zeros(n_cpgs, dtype=np.int64)
+        done = np.zeros(n_cpgs, dtype=np.int64)
+        maxima = []
+        active = np.arange(n_cpgs)
+        rng = np.random.default_rng(self.seed)
+        chunk_size = settings.EWAS_CHUNK_SIZE
+
+        for batch_start in range(0, self.n_permutations, self.batch_size):
+            batch = min(self.batch_size, self.n_permutations - batch_start)
+            permuted = np.stack([y_residual[rng.permutation(n_samples)] for _ in range(batch)], axis=1)
+            batch_max = np.zeros(batch, dtype=np.float32)
+
+            for start in range(0, len(active), chunk_size):
+                rows = active[start:start + chunk_size]
+                statistics = np.abs(residuals[rows] @ permuted)
+                hits[rows] += (statistics >= observed[rows, None]).sum(axis=1)
+                if self.max_t:
+                    np.maximum(batch_max, statistics.max(axis=0), out=batch_max)
+            done[active] += batch
+            maxima.append(batch_max)
+
+            if self.adaptive:
+                active = active[hits[active] < self.stop_hits]
+            if progress_callback:
+                progress_callback(batch_start + batch, self.n_permutations)
+            if not len(active):
+                break
+
+        result = pd.DataFrame({
+            "empirical_p": (hits + 1) / (done + 1),
+            "fwer_p": None,
+            "n_permutations": done
+        }, index=epigenome_df.index)
+        if self.max_t:
+            maxima = np.sort(np.concatenate(maxima))
+            exceed = len(maxima) - np.searchsorted(maxima, observed, side="left")
+            result["fwer_p"] = (exceed + 1) / (len(maxima) + 1)
+        return result
+
+    def _residual_matrix(self, epigenome_df: pd.DataFrame, basis: np.ndarray) -> np.ndarray:
+        """Covariate-residualized, unit-norm methylation rows, kept as float32 to halve memory"""
+        n_cpgs, n_samples = epigenome_df.shape
+        residuals = np.empty((n_cpgs, n_samples), dtype=np.float32)
+        chunk_size = settings.EWAS_CHUNK_SIZE
+        for start in range(0, n_cpgs, chunk_size):
+            values = residualize(impute_row_means(epigenome_df.iloc[start:start + chunk_size].to_numpy(dtype=np.float64)), basis)
+            norms = np.linalg.norm(values, axis=1)
+            # Constant probes get a zero row: their statistic is 0 in every permutation
+            residuals[start:start + chunk_size] = values / np.where(norms > 0, norms, 1.0)[:, None]
+        return residuals
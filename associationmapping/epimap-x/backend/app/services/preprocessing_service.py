@@ -0,0 +1,276 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import stage
+from app.utils.data_parser import read_table
+from app.core.options import PREPROCESSING_STEPS
+
+class PreprocessingStep:
+    """One transformation of the (CpG x sample methylation, sample x phenotype) pair"""
+    name = ""
+    # Whether a pipeline also caches this step's output when later steps follow it
+    cache_intermediate = False
+
+    def signature(self) -> str:
+        """Identifies the step and its parameters in artifact cache keys"""
+        return self.name
+
+    def apply(self, methylation: pd.DataFrame, phenotype: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        raise NotImplementedError
+
+class AlignSamples(PreprocessingStep):
+    """Keep samples present in both tables, in the same order"""
+    name = "align"
+
+    def apply(self, methylation, phenotype):
+        common_samples = methylation.columns.intersection(phenotype.index)
+        if len(common_samples) == 0:
+            raise ValueError("No samples shared between methylation and phenotype data")
+        return methylation[common_samples], phenotype.loc[common_samples]
+
+class BetaToMValues(PreprocessingStep):
+    """M = log2(beta / (1 - beta)), with beta clipped away from 0 and 1"""
+    name = "m_values"
+
+    def __init__(self, offset: Optional[float] = None):
+        self.offset = settings.PREPROCESSING_BETA_OFFSET if offset is None else offset
+
+    def signature(self) -> str:
+        return f"{self.name}(offset={self.offset})"
+
+    def apply(self, methylation, phenotype):
+        values = methylation.to_numpy(dtype=np.float64, copy=True)
+        chunk_size = settings.EWAS_CHUNK_SIZE
+        for start in range(0, len(values), chunk_size):
+            # Transform in place, one block of probes at a time, to avoid full-size temporaries
+            chunk = values[start:start + chunk_size]
+            finite = chunk[np.isfinite(chunk)]
+            if finite.size and (finite.min() < 0 or finite.max() > 1):
+                raise ValueError("m_values expects beta values in [0, 1]")
+            np.clip(chunk, self.offset, 1 - self.offset, out=chunk)
+            np.log2(chunk / (1 - chunk), out=chunk)
+        return pd.DataFrame(values, index=methylation.index, columns=methylation.columns), phenotype
+
+class QuantileNormalize(PreprocessingStep):
+    """Give every sample the same distribution: the mean of the samples' sorted values"""
+    name = "quantile"
+    cache_intermediate = True
+
+    def apply(self, methylation, phenotype):
+        values = methylation.to_numpy(dtype=np.float64)
+        n_probes, n_samples = values.shape
+        if n_probes == 0:
+            return methylation, phenotype
+        grid = np.linspace(0, 1, n_probes)
+
+        # Sorted finite values of each sample, resampled to a common length so missing values are allowed
+        orders = []
+        reference = np.zeros(n_probes)
+        for j in range(n_samples):
+            column = values[:, j]
+            finite = np.flatnonzero(np.isfinite(column))
+            order = finite[np.argsort(column[finite], kind="stable")]
+            orders.append(order)
+            if len(order):
+                reference += np.interp(grid, np.linspace(0, 1, len(order)), column[order])
+        reference /= n_samples
+
+        normalized = np.full_like(values, np.nan)
+        for j, order in enumerate(orders):
+            if len(order):
+                normalized[order, j] = np.interp(np.linspace(0, 1, len(order)), grid, reference)
+        return pd.DataFrame(normalized, index=methylation.index, columns=methylation.columns), phenotype
+
+class StandardizeCovariates(PreprocessingStep):
+    """Z-score numeric covariate columns (population standard deviation, like StandardScaler)"""
+    name = "standardize_covariates"
+
+    def __init__(self, columns: List[str]):
+        self.columns = sorted(columns)
+
+    def signature(self) -> str:
+        return f"{self.name}({','.join(self.columns)})"
+
+    def apply(self, methylation, phenotype):
+        phenotype = phenotype.copy()
+        for column in self.columns:
+            if column in phenotype and pd.api.types.is_numeric_dtype(phenotype[column]):
+                std = phenotype[column].std(ddof=0)
+                if std > 0:
+                    phenotype[column] = (phenotype[column] - phenotype[column].mean()) / std
+        return methylation, phenotype
+
+class PreprocessingPipeline:
+    """Sample alignment followed by optional steps, with results cached on disk.
+
+    Artifacts are keyed by the input files' hashes plus the signatures of the
+    steps applied so far, so jobs sharing inputs and a step prefix (EWAS, ML,
+    multi-omics) reuse the same derived matrices instead of recomputing them.
+    Each artifact is a full copy of the matrix, so only the final output of
+    a pipeline with real steps is stored, plus the output of expensive steps
+    (``cache_intermediate``) that later steps build on. The cache directory
+    is kept under PREPROCESSING_CACHE_MAX_BYTES by evicting the least
+    recently used artifacts.
+    """
+
+    def __init__(self, steps: List[PreprocessingStep], cache_path: Optional[str] = None):
+        self.steps = [AlignSamples()] + [s for s in steps if not isinstance(s, AlignSamples)]
+        self.cache_path = cache_path or settings.PREPROCESSING_CACHE_PATH
+
+    @classmethod
+    def from_names(cls, names: List[str], covariates: Optional[List[str]] = None, **kwargs) -> "PreprocessingPipeline":
+        unknown = [n for n in names if n not in PREPROCESSING_STEPS and n != "align"]
+        if unknown:
+            raise ValueError(f"Unknown preprocessing steps: {', '.join(unknown)}")
+        factories = {
+            "m_values": lambda: BetaToMValues(),
+            "quantile": lambda: QuantileNormalize(),
+            "standardize_covariates": lambda: StandardizeCovariates(covariates or [])
+        }
+        return cls([factories[n]() for n in names if n != "align"], **kwargs)
+
+    def run(
+        self,
+        input_key: str,
+        load: Callable[[], Tuple[pd.DataFrame, pd.DataFrame]]
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, Dict]:
+        keys = []
+        key = input_key
+        for step in self.steps:
+            key = hashlib.sha256(f"{key}|{step.signature()}".encode()).hexdigest()
+            keys.append(key)
+
+        # Resume from the longest prefix of steps that is already cached
+        start = 0
+        methylation = phenotype = None
+        with stage("cache_lookup"):
+            for i in range(len(keys) - 1, -1, -1):
+                cached = self._load(keys[i])
+                if cached is not None:
+                    methylation, phenotype = cached
+                    start = i + 1
+                    break
+        if methylation is None:
+            methylation, phenotype = load()
+
+        last = len(self.steps) - 1
+        for i in range(start, len(self.steps)):
+            with stage(self.steps[i].name) as step:
+                methylation, phenotype = self.steps[i].apply(methylation, phenotype)
+                step.rows = len(methylation)
+            # Alignment alone is not worth a copy of the matrix
+            if (i == last and i > 0) or (i < last and self.steps[i].cache_intermediate):
+                with stage("cache_store"):
+                    self._store(keys[i], methylation, phenotype)
+
+        info = {
+            "steps": [step.signature() for step in self.steps],
+            "cached_steps": start,
+            "artifact": keys[-1]
+        }
+        return methylation, phenotype, info
+
+    def run_files(self, epigenome_file, phenotype_file, storage_service) -> Tuple[pd.DataFrame, pd.DataFrame, Dict]:
+        """Run on two stored DataFiles, reading the methylation matrix through ranged reads on a cache miss"""
+        def load():
+            with stage("download"):
+                phenotype_data = storage_service.download_file(phenotype_file.file_path)
+                epigenome_stream = storage_service.open_file(epigenome_file.file_path)
+            # The matrix is read from storage while it is parsed, so this includes its transfer
+            with stage("parse") as parse:
+                methylation = read_table(epigenome_stream, sep='\t', index_col=0)
+                phenotype = read_table(phenotype_data, index_col=0)
+                parse.rows = len(methylation)
+            return methylation, phenotype
+        return self.run(f"{_file_key(epigenome_file)}|{_file_key(phenotype_file)}", load)
+
+    def _load(self, key: str) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+        directory = os.path.join(self.cache_path, key)
+        if not os.path.isdir(directory):
+            return None
+        try:
+            cached = (
+                pd.read_parquet(os.path.join(directory, "methylation.parquet")),
+                pd.read_parquet(os.path.join(directory, "phenotype.parquet"))
+            )
+            # The directory's mtime is its last use for eviction
+            os.utime(directory)
+            return cached
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key: str, methylation: pd.DataFrame, phenotype: pd.DataFrame):
+        max_bytes = settings.PREPROCESSING_CACHE_MAX_BYTES
+        if max_bytes <= 0 or methylation.memory_usage(index=False).sum() > max_bytes:
+            return
+        directory = os.path.join(self.cache_path, key)
+        if _is_artifact(directory):
+            return
+        os.makedirs(self.cache_path, exist_ok=True)
+        with _store_lock(os.path.join(self.cache_path, f".{key}.lock")) as locked:
+            # Another job is writing the same artifact, or finished it since the check above
+            if not locked or _is_artifact(directory):
+                return
+            # Written to a scratch directory and renamed, so concurrent jobs never read half an artifact
+            temp_directory = os.path.join(self.cache_path, f".{key}.{uuid.uuid4().hex}")
+            os.makedirs(temp_directory)
+            try:
+                methylation.to_parquet(os.path.join(temp_directory, "methylation.parquet"))
+                phenotype.to_parquet(os.path.join(temp_directory, "phenotype.parquet"))
+                # Left by an older version that stored pickles
+                shutil.rmtree(directory, ignore_errors=True)
+                os.rename(temp_directory, directory)
+            except (OSError, ValueError, TypeError):
+                # Tables Parquet cannot hold (duplicate column names, mixed-type columns) are not cached
+                shutil.rmtree(temp_directory, ignore_errors=True)
+                return
+        self._evict(max_bytes, keep=key)
+
+    def _evict(self, max_bytes: int, keep: str):
+        """Delete least recently used artifacts until the cache fits in ``max_bytes``"""
+        artifacts = []
+        for entry in os.scandir(self.cache_path):
+            # Scratch directories of stores in progress start with a dot
+            if entry.name.startswith(".") or entry.name == keep or not entry.is_dir():
+                continue
+            try:
+                artifacts.append((entry.stat().st_mtime, _directory_size(entry.path), entry.path))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in artifacts) + _directory_size(os.path.join(self.cache_path, keep))
+        for _, size, path in sorted(artifacts):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+def _is_artifact(directory: str) -> bool:
+    return os.path.isfile(os.path.join(directory, "phenotype.parquet"))
+
+@contextmanager
+def _store_lock(path: str) -> Iterator[bool]:
+    """Take an exclusive lock on ``path`` without waiting; yields whether it was taken"""
+    # The lock belongs to this open file, so it is released on close, and by the OS if the job dies
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+def _directory_size(path: str) -> int:
+    try:
+        return sum(f.stat().st_size for f in os.scandir(path) if f.is_file())
+    except OSError:
+        return 0
+
+def _file_key(data_file) -> str:
+    return data_file.sha256 or f"{data_file.file_path}:{data_file.size_bytes}"
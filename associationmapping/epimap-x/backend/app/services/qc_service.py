@@ -0,0 +1,145 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from typing import Dict, FrozenSet, Optional, Tuple
+from app.core.config import settings
+
+@lru_cache(maxsize=4)
+def _load_blacklist(files: Tuple[Tuple[str, float], ...]) -> Dict[str, FrozenSet[str]]:
+    lists = {}
+    for path, _ in files:
+        with open(path) as f:
+            probes = (line.split()[0] for line in f if line.strip() and not line.startswith("#"))
+            lists[os.path.splitext(os.path.basename(path))[0]] = frozenset(probes)
+    return lists
+
+def get_probe_blacklists(path: Optional[str] = None) -> Dict[str, FrozenSet[str]]:
+    """Probe lists (e.g. cross_reactive.txt, snp_probes.txt) under ``path``, one probe ID per line"""
+    path = path or settings.QC_BLACKLIST_PATH
+    files = sorted(glob.glob(os.path.join(path, "*.txt")))
+    return _load_blacklist(tuple((f, os.path.getmtime(f)) for f in files))
+
+class ProbeQCService:
+    """Vectorized probe-level QC that drops uninformative CpGs before any model is fitted"""
+
+    def __init__(
+        self,
+        max_missing_rate: Optional[float] = None,
+        min_variance: Optional[float] = None,
+        min_samples: Optional[int] = None,
+        max_detection_failure_rate: Optional[float] = None,
+        detection_p_threshold: Optional[float] = None,
+        blacklists: Optional[Dict[str, FrozenSet[str]]] = None
+    ):
+        self.max_missing_rate = settings.QC_MAX_MISSING_RATE if max_missing_rate is None else max_missing_rate
+        self.min_variance = settings.QC_MIN_VARIANCE if min_variance is None else min_variance
+        self.min_samples = settings.QC_MIN_SAMPLES if min_samples is None else min_samples
+        self.max_detection_failure_rate = (
+            settings.QC_MAX_DETECTION_FAILURE_RATE if max_detection_failure_rate is None else max_detection_failure_rate
+        )
+        self.detection_p_threshold = settings.QC_DETECTION_P_THRESHOLD if detection_p_threshold is None else detection_p_threshold
+        self.blacklists = get_probe_blacklists() if blacklists is None else blacklists
+
+    def filter(
+        self,
+        epigenome_df: pd.DataFrame,
+        sample_mask: Optional[np.ndarray] = None,
+        detection_p: Optional[pd.DataFrame] = None
+    ) -> Tuple[pd.DataFrame, Dict]:
+        """Return the probes that pass QC and a report of what was removed and why.
+
+        ``sample_mask`` marks the samples the model will actually use (complete
+        phenotype and covariates); missingness and variance are judged on those.
+        """
+        keep, report = self.evaluate(epigenome_df, sample_mask, detection_p)
+        return epigenome_df[keep], report
+
+    def evaluate(
+        self,
+        epigenome_df: pd.DataFrame,
+        sample_mask: Optional[np.ndarray] = None,
+        detection_p: Optional[pd.DataFrame] = None
+    ) -> Tuple[np.ndarray, Dict]:
+        """Like ``filter``, but return a mask of the passing probes instead of copying them"""
+        n_probes = len(epigenome_df)
+        if sample_mask is None:
+            sample_mask = np.ones(epigenome_df.shape[1], dtype=bool)
+        n_samples = int(sample_mask.sum())
+
+        n_observed = np.zeros(n_probes, dtype=np.int64)
+        variances = np.zeros(n_probes)
+        detection = np.zeros(n_probes, dtype=bool)
+
+        chunk_size = settings.EWAS_CHUNK_SIZE
+        for start in range(0, n_probes, chunk_size):
+            rows = slice(start, start + chunk_size)
+            values = epigenome_df.iloc[rows].to_numpy(dtype=np.float64)[:, sample_mask]
+            observed = np.isfinite(values)
+            n_observed[rows] = observed.sum(axis=1)
+
+            if detection_p is not None:
+                det = detection_p.reindex(index=epigenome_df.index[rows], columns=epigenome_df.columns).to_numpy(dtype=np.float64)[:, sample_mask]
+                failed = ~(det <= self.detection_p_threshold)
+                detection[rows] = failed.mean(axis=1) > self.max_detection_failure_rate
+
+            # Variance over observed values without materializing a masked copy
+            filled = np.where(observed, values, 0.0)
+            n = np.maximum(n_observed[rows], 2)
+            mean = filled.sum(axis=1) / np.maximum(n_observed[rows], 1)
+            sq = np.where(observed, (values - mean[:, None]) ** 2, 0.0).sum(axis=1)
+            variances[rows] = sq / (n - 1)
+
+        return self.evaluate_statistics(epigenome_df.index, n_samples, n_observed, variances, detection)
+
+    def evaluate_statistics(
+        self,
+        cpg_ids: pd.Index,
+        n_samples: int,
+        n_observed: np.ndarray,
+        variances: np.ndarray,
+        detection: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, Dict]:
+        """Like ``evaluate``, from per-probe observed counts and variances already summarized elsewhere"""
+        n_probes = len(cpg_ids)
+        reasons = {}
+        blacklisted = np.zeros(n_probes, dtype=bool)
+        for name, probes in self.blacklists.items():
+            hit = cpg_ids.isin(probes)
+            reasons[name] = hit & ~blacklisted
+            blacklisted |= hit
+
+        if detection is None:
+            detection = np.zeros(n_probes, dtype=bool)
+        missing_rates = 1 - n_observed / max(n_samples, 1)
+        missing = missing_rates > self.max_missing_rate
+        too_few = n_observed < self.min_samples
+        low_variance = variances <= self.min_variance
+
+        # Each probe is reported under the first reason that removed it
+        removed = blacklisted.copy()
+        for name, mask in (("detection", detection), ("missingness", missing), ("too_few_samples", too_few), ("low_variance", low_variance)):
+            reasons[name] = mask & ~removed
+            removed |= mask
+
+        report = {
+            "total_probes": n_probes,
+            "kept_probes": int((~removed).sum()),
+            "removed_probes": int(removed.sum()),
+            "samples": n_samples,
+            "removed": {name: int(mask.sum()) for name, mask in reasons.items()},
+            "examples": {
+                name: cpg_ids[mask][:settings.QC_REPORT_EXAMPLES].tolist()
+                for name, mask in reasons.items() if mask.any()
+            },
+            "median_missing_rate": float(np.median(missing_rates)) if n_probes else 0.0,
+            "thresholds": {
+                "max_missing_rate": self.max_missing_rate,
+                "min_variance": self.min_variance,
+                "min_samples": self.min_samples,
+                "max_detection_failure_rate": self.max_detection_failure_rate,
+                "detection_p_threshold": self.detection_p_threshold
+            }
+        }
+        return ~removed, report
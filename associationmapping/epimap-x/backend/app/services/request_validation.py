@@ -0,0 +1,41 @@
+from sqlmodel import Session
+from app.db.models import DataFile
+from app.schemas.analysis import AnalysisRequest
+from app.core.options import (
+    MODEL_TYPES, PREPROCESSING_STEPS, CROSS_SAMPLE_STEPS, CONFOUNDER_METHODS, check_sample_filter, resolve_case_level
+)
+
+def validate_analysis_request(session: Session, request: AnalysisRequest):
+    """Raise ValueError when an EWAS request (single or batch member) cannot be run as submitted"""
+    if any(step not in PREPROCESSING_STEPS for step in request.preprocessing):
+        raise ValueError(f"preprocessing steps must be among: {', '.join(PREPROCESSING_STEPS)}")
+    if request.confounders and request.confounders.method not in CONFOUNDER_METHODS:
+        raise ValueError(f"confounder method must be one of: {', '.join(CONFOUNDER_METHODS)}")
+    if request.model_type not in MODEL_TYPES:
+        raise ValueError(f"model_type must be one of: {', '.join(MODEL_TYPES)}")
+    if request.permutation and request.model_type != "linear_regression":
+        raise ValueError("Permutation testing is only available for linear_regression")
+    check_sample_filter(request.sample_filter)
+    if request.incremental:
+        if request.model_type != "linear_regression" or request.confounders or request.permutation:
+            raise ValueError("Incremental analyses support linear_regression without confounders or permutations")
+        if any(step in CROSS_SAMPLE_STEPS for step in request.preprocessing):
+            raise ValueError(f"Incremental analyses cannot use {', '.join(CROSS_SAMPLE_STEPS)} preprocessing")
+    check_case_level(session, request)
+
+def check_case_level(session: Session, request: AnalysisRequest):
+    """A logistic request's phenotype must have two values, and it must be clear which one is the case"""
+    if request.model_type != "logistic_regression":
+        if request.case_level is not None:
+            raise ValueError("case_level only applies to logistic_regression")
+        return
+    # Missing files are reported by the job itself
+    phenotype_file = session.get(DataFile, request.phenotype_file_id)
+    if phenotype_file is None:
+        return
+    from app.services.file_storage_service import FileStorageService
+
+    levels = FileStorageService().column_values(phenotype_file.file_path, request.phenotype_column, limit=3)
+    if levels is None:
+        raise ValueError(f"Phenotype column '{request.phenotype_column}' not found")
+    resolve_case_level(levels, request.case_level)
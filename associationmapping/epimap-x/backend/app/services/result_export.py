@@ -0,0 +1,80 @@
+import io
+import zlib
+from typing import Iterator, List
+from sqlmodel import Session
+from app.core.config import settings
+from app.db.models import AnalysisJob
+from app.db.session import engine
+from app.services.result_store import ResultRepository, RESULT_COLUMNS, arrow_schema
+from app.core.options import EXPORT_FORMATS
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are drained after every write, for streaming writers"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer.extend(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+class ResultExporter:
+    """Streams the full result set of an analysis as CSV, gzipped TSV or Parquet in constant memory"""
+
+    def __init__(self, analysis_id: int, columns: List[str] = None, batch_size: int = None):
+        self.analysis_id = analysis_id
+        self.columns = columns or RESULT_COLUMNS
+        self.batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+
+    def stream(self, export_format: str) -> Iterator[bytes]:
+        writer = {
+            "csv": self._csv,
+            "tsv.gz": self._tsv_gz,
+            "parquet": self._parquet
+        }[export_format]
+        # Own session: the response body is produced after the request handler has returned
+        with Session(engine) as session:
+            analysis = session.get(AnalysisJob, self.analysis_id)
+            batches = ResultRepository(session).iter_batches(analysis, self.columns, self.batch_size)
+            yield from writer(batches)
+
+    def _csv(self, batches) -> Iterator[bytes]:
+        yield (",".join(self.columns) + "\n").encode()
+        for batch in batches:
+            yield batch.to_csv(index=False, header=False).encode()
+
+    def _tsv_gz(self, batches) -> Iterator[bytes]:
+        # wbits=31 produces a gzip container
+        compressor = zlib.compressobj(settings.EXPORT_COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+        yield compressor.compress(("\t".join(self.columns) + "\n").encode())
+        for batch in batches:
+            data = compressor.compress(batch.to_csv(sep="\t", index=False, header=False).encode())
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def _parquet(self, batches) -> Iterator[bytes]:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = arrow_schema(self.columns)
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression=settings.RESULT_STORE_COMPRESSION)
+        for batch in batches:
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
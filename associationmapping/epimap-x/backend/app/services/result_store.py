@@ -0,0 +1,337 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from scipy import stats
+from sqlalchemy import insert
+from sqlmodel import Session, select, func
+from typing import List, Dict, Optional, Iterator
+from app.core.config import settings
+from app.db.models import AnalysisJob, AnalysisResult
+
+RESULT_COLUMNS = [
+    "cpg_id", "chromosome", "position", "beta", "se", "p_value", "fdr",
+    "empirical_p", "fwer_p", "gene_symbol", "feature_type"
+]
+ANNOTATION_COLUMNS = ["gene_symbol", "feature_type"]
+
+# Median of a 1-df chi-square, used for the genomic inflation factor
+_CHI2_MEDIAN = stats.chi2.ppf(0.5, 1)
+
+def results_frame(results: List[Dict]) -> pd.DataFrame:
+    """Normalize a list of per-CpG result dicts to the stored column layout"""
+    df = pd.DataFrame(results)
+    for column in RESULT_COLUMNS:
+        if column not in df:
+            df[column] = None
+    df = df[RESULT_COLUMNS]
+    for column in ("beta", "se", "p_value", "fdr", "empirical_p", "fwer_p"):
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    df["position"] = df["position"].astype("int64")
+    for column in ("cpg_id", "chromosome", "gene_symbol", "feature_type"):
+        df[column] = df[column].astype(object)
+    return df
+
+def summarize(df: pd.DataFrame) -> Dict:
+    """Summary statistics kept in SQL for every analysis, whichever store holds the rows"""
+    p_values = df["p_value"].to_numpy(dtype=float)
+    p_values = p_values[np.isfinite(p_values)]
+    fdr = df["fdr"].to_numpy(dtype=float)
+    if len(p_values):
+        chi2 = stats.chi2.isf(np.clip(p_values, 1e-300, 1.0), 1)
+        lambda_gc = float(np.median(chi2) / _CHI2_MEDIAN)
+        min_p = float(p_values.min())
+    else:
+        lambda_gc = min_p = None
+    return {
+        "n_tests": int(len(df)),
+        "n_significant": int(np.sum(fdr < 0.05)),
+        "min_p_value": min_p,
+        "lambda_gc": lambda_gc
+    }
+
+def arrow_schema(columns: Optional[List[str]] = None):
+    """Arrow schema of the stored result columns (requires pyarrow)"""
+    import pyarrow as pa
+    types = {
+        "cpg_id": pa.string(),
+        "chromosome": pa.string(),
+        "position": pa.int64(),
+        "beta": pa.float64(),
+        "se": pa.float64(),
+        "p_value": pa.float64(),
+        "fdr": pa.float64(),
+        "empirical_p": pa.float64(),
+        "fwer_p": pa.float64(),
+        "gene_symbol": pa.string(),
+        "feature_type": pa.string()
+    }
+    return pa.schema([(c, types[c]) for c in columns or RESULT_COLUMNS])
+
+class ParquetResultStore:
+    """One compressed Parquet file per analysis, sorted by genomic position.
+
+    Sorting makes the row-group min/max statistics on chromosome and position
+    selective, so region queries only read the row groups they overlap.
+    Annotation writes each finished chunk to a sidecar directory next to the
+    file; reads merge it in until it is folded into the file.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("pyarrow is required for RESULT_STORE=parquet")
+        self.root = root or settings.RESULT_STORE_PATH
+        os.makedirs(self.root, exist_ok=True)
+
+    def write(self, analysis_id: int, df: pd.DataFrame) -> str:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.root, f"analysis_{analysis_id}.parquet")
+        df = df.sort_values(["chromosome", "position"], kind="stable").reset_index(drop=True)
+        table = pa.Table.from_pandas(df[RESULT_COLUMNS], schema=arrow_schema(), preserve_index=False)
+
+        # Write next to the target and rename, so readers never see a partial file
+        temp_path = f"{path}.tmp"
+        pq.write_table(
+            table,
+            temp_path,
+            compression=settings.RESULT_STORE_COMPRESSION,
+            row_group_size=settings.RESULT_STORE_ROW_GROUP_SIZE
+        )
+        # The best rows again in (p_value, row) order, so result table pages need no sort of the whole file
+        order = np.argsort(df["p_value"].fillna(np.inf).to_numpy(dtype=float), kind="stable")[:settings.RESULT_STORE_TOP_ROWS]
+        pq.write_table(table.take(order), f"{top_path(path)}.tmp", compression=settings.RESULT_STORE_COMPRESSION)
+        os.replace(f"{top_path(path)}.tmp", top_path(path))
+        os.replace(temp_path, path)
+        # Annotations written since the previous version are either in the new file or stale
+        shutil.rmtree(annotations_path(path), ignore_errors=True)
+        return path
+
+    def read(self, path: str, columns: Optional[List[str]] = None, filters: Optional[List] = None) -> pd.DataFrame:
+        import pyarrow.parquet as pq
+        columns = columns or RESULT_COLUMNS
+        annotated = [c for c in ANNOTATION_COLUMNS if c in columns]
+        if not annotated or not os.path.isdir(annotations_path(path)):
+            return pq.read_table(path, columns=columns, filters=filters or None).to_pandas()
+
+        read_columns = columns if "cpg_id" in columns else columns + ["cpg_id"]
+        df = pq.read_table(path, columns=read_columns, filters=filters or None).to_pandas()
+        annotations = self.read_annotations(path)
+        return _merge_annotations(df, annotations, annotated)[columns]
+
+    def top(self, path: str, limit: int, offset: int = 0, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Rows ``offset:offset + limit`` in (p_value, row) order.
+
+        Pages within the head file written with the results are sliced from
+        it. Deeper pages read the p-value column alone, partially sort it and
+        read only the row groups that hold the page.
+        """
+        import pyarrow.parquet as pq
+        columns = columns or RESULT_COLUMNS
+        annotated = [c for c in ANNOTATION_COLUMNS if c in columns]
+        merge = bool(annotated) and os.path.isdir(annotations_path(path))
+        read_columns = columns if not merge or "cpg_id" in columns else columns + ["cpg_id"]
+        parquet_file = pq.ParquetFile(path)
+
+        head_rows = pq.ParquetFile(top_path(path)).metadata.num_rows if os.path.exists(top_path(path)) else 0
+        if offset + limit <= head_rows or (head_rows and head_rows == parquet_file.metadata.num_rows):
+            table = pq.read_table(top_path(path), columns=read_columns).slice(offset, limit)
+        else:
+            table = self._top_rows(parquet_file, limit, offset, read_columns)
+
+        df = table.to_pandas()
+        if merge:
+            df = _merge_annotations(df, self.read_annotations(path), annotated)
+        return df[columns]
+
+    def _top_rows(self, parquet_file, limit: int, offset: int, columns: List[str]):
+        p_values = parquet_file.read(columns=["p_value"]).column(0).to_numpy(zero_copy_only=False).astype(float)
+        p_values[np.isnan(p_values)] = np.inf
+        end = min(offset + limit, len(p_values))
+        if offset >= end:
+            return parquet_file.schema_arrow.empty_table().select(columns)
+
+        # Every row below the end-th smallest p-value, then ties in row order
+        kth = np.partition(p_values, end - 1)[end - 1]
+        below = np.flatnonzero(p_values < kth)
+        ties = np.flatnonzero(p_values == kth)[:end - len(below)]
+        rows = np.concatenate([below, ties])
+        rows = rows[np.lexsort((rows, p_values[rows]))][offset:end]
+
+        sizes = np.array([parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)])
+        group_starts = np.cumsum(sizes) - sizes
+        row_groups = np.searchsorted(np.cumsum(sizes), rows, side="right")
+        groups = np.unique(row_groups)
+        table = parquet_file.read_row_groups(groups.tolist(), columns=columns)
+        # Where each page row sits in the concatenation of the groups read
+        read_starts = np.cumsum(sizes[groups]) - sizes[groups]
+        return table.take(rows - group_starts[row_groups] + read_starts[np.searchsorted(groups, row_groups)])
+
+    def iter_batches(self, path: str, columns: Optional[List[str]] = None, batch_size: int = 50_000) -> Iterator[pd.DataFrame]:
+        import pyarrow.parquet as pq
+        columns = columns or RESULT_COLUMNS
+        annotated = [c for c in ANNOTATION_COLUMNS if c in columns]
+        annotations = self.read_annotations(path) if annotated and os.path.isdir(annotations_path(path)) else None
+        read_columns = columns if annotations is None or "cpg_id" in columns else columns + ["cpg_id"]
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=read_columns):
+            df = batch.to_pandas()
+            if annotations is not None:
+                df = _merge_annotations(df, annotations, annotated)
+            yield df[columns]
+
+    def write_annotations(self, path: str, df: pd.DataFrame):
+        """Persist one annotated chunk (cpg_id, gene_symbol, feature_type) without rewriting the result file"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        directory = annotations_path(path)
+        os.makedirs(directory, exist_ok=True)
+        chunks = [f for f in os.listdir(directory) if f.endswith(".parquet")]
+        target = os.path.join(directory, f"chunk_{len(chunks):06d}.parquet")
+        table = pa.Table.from_pandas(df[["cpg_id"] + ANNOTATION_COLUMNS], schema=arrow_schema(["cpg_id"] + ANNOTATION_COLUMNS), preserve_index=False)
+        pq.write_table(table, f"{target}.tmp")
+        os.replace(f"{target}.tmp", target)
+
+    def read_annotations(self, path: str) -> pd.DataFrame:
+        """Annotations from the sidecar chunks, indexed by cpg_id"""
+        import pyarrow.parquet as pq
+        directory = annotations_path(path)
+        files = sorted(f for f in os.listdir(directory) if f.endswith(".parquet"))
+        if not files:
+            return pd.DataFrame(columns=ANNOTATION_COLUMNS, index=pd.Index([], name="cpg_id"))
+        df = pd.concat([pq.read_table(os.path.join(directory, f)).to_pandas() for f in files], ignore_index=True)
+        return df.drop_duplicates("cpg_id", keep="last").set_index("cpg_id")
+
+def annotations_path(path: str) -> str:
+    return f"{path}.annotations"
+
+def top_path(path: str) -> str:
+    return f"{path}.top"
+
+def _merge_annotations(df: pd.DataFrame, annotations: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    for column in columns:
+        df[column] = df[column].where(df[column].notna(), df["cpg_id"].map(annotations[column]))
+    return df
+
+class ResultRepository:
+    """Reads and writes an analysis's per-CpG results in Parquet (when it has a result file) or SQL"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def save(self, analysis: AnalysisJob, results: List[Dict]) -> Dict:
+        """Persist results in the configured store and record their summary on the job"""
+        df = results_frame(results)
+        if settings.RESULT_STORE == "parquet":
+            analysis.result_path = ParquetResultStore().write(analysis.id, df)
+        elif len(df):
+            rows = to_records(df)
+            for row in rows:
+                row["analysis_id"] = analysis.id
+            self.session.execute(insert(AnalysisResult), rows)
+
+        summary = summarize(df)
+        for key, value in summary.items():
+            setattr(analysis, key, value)
+        self.mark_changed(analysis)
+        return summary
+
+    def replace(self, analysis: AnalysisJob, df: pd.DataFrame):
+        """Rewrite the Parquet file of an analysis, e.g. to fold in its annotations"""
+        analysis.result_path = ParquetResultStore(os.path.dirname(analysis.result_path)).write(analysis.id, df)
+        self.mark_changed(analysis)
+
+    def save_annotations(self, analysis: AnalysisJob, df: pd.DataFrame):
+        """Make one annotated chunk of a Parquet result set visible to readers"""
+        ParquetResultStore(os.path.dirname(analysis.result_path)).write_annotations(analysis.result_path, df)
+        self.mark_changed(analysis)
+
+    def mark_changed(self, analysis: AnalysisJob):
+        """Invalidate cached responses built from the previous results"""
+        from app.core.cache import response_cache
+        analysis.results_version = (analysis.results_version or 0) + 1
+        response_cache.invalidate(analysis.id)
+
+    def frame(
+        self,
+        analysis: AnalysisJob,
+        columns: Optional[List[str]] = None,
+        chromosome: Optional[str] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        max_p: Optional[float] = None
+    ) -> pd.DataFrame:
+        """Load selected columns, filtering by region and p-value inside the store"""
+        columns = columns or RESULT_COLUMNS
+        if analysis.result_path:
+            filters = []
+            if chromosome is not None:
+                filters.append(("chromosome", "=", chromosome))
+            if start is not None:
+                filters.append(("position", ">=", start))
+            if end is not None:
+                filters.append(("position", "<=", end))
+            if max_p is not None:
+                filters.append(("p_value", "<=", max_p))
+            return ParquetResultStore(os.path.dirname(analysis.result_path)).read(analysis.result_path, columns, filters)
+
+        statement = select(*[getattr(AnalysisResult, c) for c in columns]).where(AnalysisResult.analysis_id == analysis.id)
+        if chromosome is not None:
+            statement = statement.where(AnalysisResult.chromosome == chromosome)
+        if start is not None:
+            statement = statement.where(AnalysisResult.position >= start)
+        if end is not None:
+            statement = statement.where(AnalysisResult.position <= end)
+        if max_p is not None:
+            statement = statement.where(AnalysisResult.p_value <= max_p)
+        df = pd.read_sql(statement, self.session.connection())
+        df.columns = columns
+        return df
+
+    def top(self, analysis: AnalysisJob, limit: int = 100, offset: int = 0) -> pd.DataFrame:
+        """Results ordered by p-value"""
+        if analysis.result_path:
+            return ParquetResultStore(os.path.dirname(analysis.result_path)).top(analysis.result_path, limit, offset)
+
+        statement = (
+            select(*[getattr(AnalysisResult, c) for c in RESULT_COLUMNS])
+            .where(AnalysisResult.analysis_id == analysis.id)
+            .order_by(AnalysisResult.p_value)
+            .offset(offset)
+            .limit(limit)
+        )
+        df = pd.read_sql(statement, self.session.connection())
+        df.columns = RESULT_COLUMNS
+        return df
+
+    def iter_batches(self, analysis: AnalysisJob, columns: Optional[List[str]] = None, batch_size: int = 50_000) -> Iterator[pd.DataFrame]:
+        """Stream all results in fixed-size batches without materializing the full result set"""
+        columns = columns or RESULT_COLUMNS
+        if analysis.result_path:
+            store = ParquetResultStore(os.path.dirname(analysis.result_path))
+            yield from store.iter_batches(analysis.result_path, columns, batch_size)
+            return
+
+        statement = (
+            select(*[getattr(AnalysisResult, c) for c in columns])
+            .where(AnalysisResult.analysis_id == analysis.id)
+            .order_by(AnalysisResult.id)
+        )
+        # Server-side cursor: rows are fetched from the database one batch at a time
+        result = self.session.connection().execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for rows in result.partitions(batch_size):
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+    def count(self, analysis: AnalysisJob) -> int:
+        if analysis.n_tests is not None:
+            return analysis.n_tests
+        return self.session.exec(
+            select(func.count()).select_from(AnalysisResult).where(AnalysisResult.analysis_id == analysis.id)
+        ).one()
+
+def to_records(df: pd.DataFrame) -> List[Dict]:
+    """JSON-safe records (NaN becomes None)"""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
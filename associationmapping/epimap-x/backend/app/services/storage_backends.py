@@ -0,0 +1,216 @@
+import io
+import os
+import shutil
+from typing import Iterator, Optional
+from app.core.config import settings
+
+class StorageBackend:
+    """Minimal object storage interface: whole-object writes, ranged reads"""
+
+    def put_file(self, key: str, source_path: str):
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def read(self, key: str) -> bytes:
+        return self.read_range(key, 0, self.size(key))
+
+    def iter_chunks(self, key: str, chunk_size: int, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        end = self.size(key) if end is None else end
+        while start < end:
+            length = min(chunk_size, end - start)
+            yield self.read_range(key, start, length)
+            start += length
+
+class LocalStorageBackend(StorageBackend):
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put_file(self, key: str, source_path: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(source_path, path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self._path(key))
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    def read(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key: str):
+        if self.exists(key):
+            os.remove(self._path(key))
+
+class S3StorageBackend(StorageBackend):
+    """S3-compatible backend (MinIO, AWS) on top of a boto3-style client"""
+
+    def __init__(self, client, bucket: str):
+        self.client = client
+        self.bucket = bucket
+
+    def put_file(self, key: str, source_path: str):
+        self.client.upload_file(source_path, self.bucket, key)
+        os.remove(source_path)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception as e:
+            if _is_not_found(e):
+                return False
+            raise
+
+    def size(self, key: str) -> int:
+        return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        if length <= 0:
+            return b""
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{start + length - 1}")
+        return response["Body"].read()
+
+    def read(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+class ObjectNotFound(Exception):
+    """Raised by LocalObjectStore; carries the S3 error code like botocore's ClientError"""
+
+    def __init__(self, key: str):
+        super().__init__(f"NoSuchKey: {key}")
+        self.response = {"Error": {"Code": "404"}}
+
+class LocalObjectStore:
+    """Directory-backed stand-in for an S3 client, implementing the calls S3StorageBackend makes"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, key)
+
+    def create_bucket(self, Bucket: str):
+        os.makedirs(os.path.join(self.root, Bucket), exist_ok=True)
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(Filename, path)
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise ObjectNotFound(Key)
+        return {"ContentLength": os.path.getsize(path)}
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None) -> dict:
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise ObjectNotFound(Key)
+        with open(path, "rb") as f:
+            if Range:
+                start, end = Range.replace("bytes=", "").split("-")
+                f.seek(int(start))
+                data = f.read(int(end) - int(start) + 1)
+            else:
+                data = f.read()
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+    def delete_object(self, Bucket: str, Key: str):
+        path = self._path(Bucket, Key)
+        if os.path.exists(path):
+            os.remove(path)
+
+def _is_not_found(error: Exception) -> bool:
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+class BlobReader(io.RawIOBase):
+    """Seekable file object that fetches byte ranges lazily, so large objects can be parsed without downloading them"""
+
+    def __init__(self, backend: StorageBackend, key: str):
+        self.backend = backend
+        self.key = key
+        self.length = backend.size(key)
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.length + offset
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.length - self.position)
+        if length <= 0:
+            return 0
+        data = self.backend.read_range(self.key, self.position, length)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+_backend: Optional[StorageBackend] = None
+
+def get_storage_backend() -> StorageBackend:
+    """Backend selected by STORAGE_BACKEND: local, s3 (MinIO/AWS via boto3) or s3-local (stand-in)"""
+    global _backend
+    if _backend is None:
+        if settings.STORAGE_BACKEND == "s3":
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("boto3 is required for STORAGE_BACKEND=s3")
+            scheme = "https" if settings.MINIO_SECURE else "http"
+            client = boto3.client(
+                "s3",
+                endpoint_url=f"{scheme}://{settings.MINIO_ENDPOINT}",
+                aws_access_key_id=settings.MINIO_ACCESS_KEY,
+                aws_secret_access_key=settings.MINIO_SECRET_KEY
+            )
+            _backend = S3StorageBackend(client, settings.MINIO_BUCKET_NAME)
+        elif settings.STORAGE_BACKEND == "s3-local":
+            client = LocalObjectStore(os.path.join(settings.LOCAL_STORAGE_PATH, "objectstore"))
+            client.create_bucket(Bucket=settings.MINIO_BUCKET_NAME)
+            _backend = S3StorageBackend(client, settings.MINIO_BUCKET_NAME)
+        else:
+            _backend = LocalStorageBackend(settings.LOCAL_STORAGE_PATH)
+    return _backend
@@ -0,0 +1,213 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy import stats
+from typing import Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import stage
+from app.core.options import check_sample_filter
+from app.services.qc_service import ProbeQCService
+from app.services.ewas_service import result_record
+from app.utils.multiple_testing import benjamini_hochberg
+from app.utils.regression import extend_basis, orthonormal_basis
+
+def sample_mask(phenotype_df: pd.DataFrame, sample_filter: Optional[Dict]) -> np.ndarray:
+    """Samples matching every condition of a filter.
+
+    A condition maps a phenotype column to a value, a list of allowed values or
+    a {"min": ..., "max": ...} range, e.g. {"sex": "F", "age": {"min": 50}}.
+    """
+    mask = np.ones(len(phenotype_df), dtype=bool)
+    for column, condition in (sample_filter or {}).items():
+        if column not in phenotype_df.columns:
+            raise ValueError(f"Sample filter column '{column}' is not in the phenotype file")
+        values = phenotype_df[column]
+        if isinstance(condition, dict):
+            numeric = pd.to_numeric(values, errors="coerce")
+            if condition.get("min") is not None:
+                mask &= (numeric >= condition["min"]).to_numpy()
+            if condition.get("max") is not None:
+                mask &= (numeric <= condition["max"]).to_numpy()
+        else:
+            allowed = condition if isinstance(condition, list) else [condition]
+            # Compared as text too, so "1" selects a numeric 1 and vice versa
+            mask &= (values.isin(allowed) | values.astype(str).isin([str(v) for v in allowed])).to_numpy()
+    return mask
+
+class SweepVariant:
+    def __init__(self, covariates: List[str], sample_filter: Optional[Dict] = None, name: Optional[str] = None):
+        self.covariates = list(covariates)
+        self.sample_filter = sample_filter or {}
+        self.name = name
+
+class SweepService:
+    """Linear EWAS of one phenotype under several sample subsets and covariate sets, over one loaded matrix.
+
+    By Frisch-Waugh-Lovell, the methylation coefficient of
+    ``y ~ 1 + methylation + covariates`` only needs the residuals of
+    methylation and ``y`` after projecting out the covariate design. Designs
+    are factorized once per (samples, covariate set); a covariate set that
+    adds to one already factorized on the same samples only orthogonalizes
+    its extra columns, and each block's residuals are derived from the
+    smaller design's residuals the same way. CpGs with missing values in a
+    variant's samples are fitted on their own observed samples.
+    """
+
+    def __init__(self, min_samples: int = 10, chunk_size: Optional[int] = None):
+        self.min_samples = min_samples
+        self.chunk_size = chunk_size or settings.EWAS_CHUNK_SIZE
+
+    def run(
+        self,
+        epigenome_df: pd.DataFrame,
+        phenotype_df: pd.DataFrame,
+        phenotype_column: str,
+        variants: List[SweepVariant],
+        qc_service: Optional[ProbeQCService] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> List[Tuple[List[Dict], Dict]]:
+        """Results and a report (samples, QC, shared factorization) for each variant, in order"""
+        common_samples = epigenome_df.columns.intersection(phenotype_df.index)
+        epigenome_df = epigenome_df[common_samples]
+        phenotype_df = phenotype_df.loc[common_samples]
+        y = phenotype_df[phenotype_column].astype(np.float64).to_numpy()
+
+        covariates = sorted({c for variant in variants for c in variant.covariates})
+        missing = [c for c in covariates if c not in phenotype_df.columns]
+        if missing:
+            raise ValueError(f"Covariates not in the phenotype file: {', '.join(missing)}")
+        # Categorical covariates are dummy-coded once on all samples; levels absent from a subset add nothing
+        encoded = {c: pd.get_dummies(phenotype_df[[c]], drop_first=True, dtype=float).to_numpy() for c in covariates}
+
+        self._factors: Dict[Tuple, Dict] = {}
+        plans = []
+        for variant in variants:
+            mask = sample_mask(phenotype_df, variant.sample_filter) & np.isfinite(y)
+            for c in variant.covariates:
+                mask &= phenotype_df[c].notna().to_numpy()
+            report = {"samples": int(mask.sum()), "sample_filter": variant.sample_filter, "covariates": variant.covariates}
+            plan = {"variant": variant, "mask": mask, "report": report}
+            plans.append(plan)
+            if mask.sum() < self.min_samples:
+                report["skipped"] = f"fewer than {self.min_samples} samples"
+                continue
+
+            if qc_service is not None:
+                with stage("qc") as qc:
+                    plan["keep"], report["qc"] = qc_service.evaluate(epigenome_df, mask)
+                    qc.rows = len(epigenome_df)
+            else:
+                plan["keep"] = np.ones(len(epigenome_df), dtype=bool)
+            plan["results"] = []
+
+        # Smaller covariate sets first, so larger ones on the same samples extend their factorization
+        active = sorted((plan for plan in plans if "keep" in plan), key=lambda plan: len(plan["variant"].covariates))
+        for plan in active:
+            mask, report = plan["mask"], plan["report"]
+            plan["key"] = self._factorize(mask, plan["variant"].covariates, encoded)
+            factor = self._factors[plan["key"]]
+            report["design_rank"] = factor["basis"].shape[1]
+            report["extends"] = list(factor["parent"][1]) if factor["parent"] else None
+            plan["design"] = np.column_stack([np.ones(int(mask.sum()))] + [encoded[c][mask] for c in plan["variant"].covariates])
+            plan["y"] = y[mask]
+            plan["y_residual"] = plan["y"] - factor["basis"] @ (factor["basis"].T @ plan["y"])
+
+        total = len(epigenome_df)
+        with stage("fitting", rows=total * len(active)):
+            for start in range(0, total, self.chunk_size):
+                block = epigenome_df.iloc[start:start + self.chunk_size]
+                self._fit_block(block, start, active)
+                if progress_callback:
+                    progress_callback(min(start + self.chunk_size, total), total)
+
+        outputs = []
+        with stage("fdr"):
+            for plan in plans:
+                results = plan.get("results", [])
+                if results:
+                    for result, fdr in zip(results, benjamini_hochberg([r["p_value"] for r in results])):
+                        result["fdr"] = float(fdr)
+                plan["report"]["n_tests"] = len(results)
+                outputs.append((results, plan["report"]))
+        return outputs
+
+    def _factorize(self, mask: np.ndarray, covariates: List[str], encoded: Dict[str, np.ndarray]) -> Tuple:
+        """Key of the design's orthonormal basis, extending the largest factorized sub-design on the same samples"""
+        mask_key = hashlib.sha1(np.packbits(mask).tobytes()).hexdigest()
+        key = (mask_key, tuple(sorted(set(covariates))))
+        if key in self._factors:
+            return key
+
+        root = (mask_key, ())
+        if root not in self._factors:
+            n = int(mask.sum())
+            self._factors[root] = {"parent": None, "mask": mask, "added": None, "basis": np.full((n, 1), 1 / np.sqrt(n))}
+        candidates = [k for k in self._factors if k[0] == mask_key and set(k[1]) <= set(key[1])]
+        parent = max(candidates, key=lambda k: len(k[1]))
+        if parent == key:
+            return key
+
+        extra = [c for c in key[1] if c not in parent[1]]
+        parent_basis = self._factors[parent]["basis"]
+        added = extend_basis(parent_basis, np.column_stack([encoded[c][mask] for c in extra]))
+        self._factors[key] = {"parent": parent, "mask": mask, "added": added, "basis": np.hstack([parent_basis, added])}
+        return key
+
+    def _fit_block(self, block: pd.DataFrame, start: int, plans: List[Dict]):
+        values = block.to_numpy(dtype=np.float64)
+        finite = np.isfinite(values)
+        filled = np.where(finite, values, 0.0)
+
+        # Residuals for every factorized design, parents first (dict order), each from its parent's
+        residuals = {}
+        for key, factor in self._factors.items():
+            if factor["parent"] is None:
+                sub = filled[:, factor["mask"]]
+                residuals[key] = sub - sub.mean(axis=1, keepdims=True)
+            else:
+                parent = residuals[factor["parent"]]
+                added = factor["added"]
+                residuals[key] = parent - (parent @ added) @ added.T if added.shape[1] else parent
+
+        for plan in plans:
+            key = plan["key"]
+            rank = self._factors[key]["basis"].shape[1]
+            centered = residuals[(key[0], ())]
+            beta, se, p_values = self._statistics(
+                residuals[key], plan["y_residual"], len(plan["y"]) - rank - 1, np.einsum("ij,ij->i", centered, centered)
+            )
+            complete = finite[:, plan["mask"]].all(axis=1)
+            for i in np.flatnonzero(plan["keep"][start:start + len(block)]):
+                if complete[i]:
+                    if np.isfinite(p_values[i]):
+                        plan["results"].append(result_record(block.index[i], beta[i], se[i], p_values[i]))
+                    continue
+                fitted = self._fit_incomplete(values[i, plan["mask"]], plan)
+                if fitted is not None:
+                    plan["results"].append(result_record(block.index[i], *fitted))
+
+    def _statistics(self, rx: np.ndarray, ry: np.ndarray, dof: int, total_ss: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Methylation coefficient, SE and t-test p-value from residualized methylation rows and phenotype"""
+        sxx = np.einsum("ij,ij->i", rx, rx)
+        sxy = rx @ ry
+        with np.errstate(divide="ignore", invalid="ignore"):
+            beta = sxy / sxx
+            rss = np.maximum(ry @ ry - beta * sxy, 0.0)
+            se = np.sqrt(rss / dof / sxx)
+            p_values = 2 * stats.t.sf(np.abs(beta / se), dof) if dof > 0 else np.full(len(rx), np.nan)
+        # Methylation constant, or collinear with the covariates, within the variant's samples
+        degenerate = (sxx <= 1e-10 * total_ss) | (total_ss <= 0) | ~(se > 0)
+        return beta, se, np.where(degenerate, np.nan, p_values)
+
+    def _fit_incomplete(self, x: np.ndarray, plan: Dict) -> Optional[Tuple[float, float, float]]:
+        observed = np.isfinite(x)
+        if observed.sum() < self.min_samples:
+            return None
+        basis, rank = orthonormal_basis(plan["design"][observed])
+        x, y = x[observed], plan["y"][observed]
+        rx = (x - basis @ (basis.T @ x))[None, :]
+        ry = y - basis @ (basis.T @ y)
+        beta, se, p_values = self._statistics(rx, ry, int(observed.sum()) - rank - 1, np.array([np.sum((x - x.mean()) ** 2)]))
+        if not np.isfinite(p_values[0]):
+            return None
+        return beta[0], se[0], p_values[0]
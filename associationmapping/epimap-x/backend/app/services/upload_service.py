@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.db.models import DataFile, FileType, UploadSession
+from app.services.file_storage_service import FileStorageService
+from app.utils.data_parser import StreamingValidator
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, expected: int):
+        super().__init__(f"Upload offset mismatch, expected {expected}")
+        self.expected = expected
+
+class _UploadState:
+    """Running hash and validator of a partially uploaded file"""
+
+    def __init__(self, file_type: FileType):
+        self.hasher = hashlib.sha256()
+        self.validator = StreamingValidator(numeric=file_type != FileType.PHENOTYPE)
+        self.lock = asyncio.Lock()
+
+    def feed(self, chunk: bytes):
+        self.hasher.update(chunk)
+        self.validator.feed(chunk)
+
+# Hash/validator state per active upload; rebuilt from the partial file after a restart
+_states: Dict[str, _UploadState] = {}
+
+def register_upload(
+    session: Session,
+    filename: str,
+    file_type: FileType,
+    summary: Dict,
+    owner_id: int = 1
+) -> Tuple[DataFile, bool]:
+    """Create the DataFile for a stored upload, or return the existing one with the same content"""
+    existing = session.exec(
+        select(DataFile)
+        .where(DataFile.sha256 == summary["sha256"])
+        .where(DataFile.type == file_type)
+        .where(DataFile.owner_id == owner_id)
+    ).first()
+    if existing:
+        # Blobs are content-addressed, so the stored bytes are already shared with ``existing``
+        return existing, True
+
+    validation = summary["validation"]
+    db_file = DataFile(
+        filename=filename,
+        file_path=summary["file_path"],
+        size_bytes=summary["size_bytes"],
+        type=file_type,
+        owner_id=owner_id,
+        sha256=summary["sha256"],
+        row_count=validation["row_count"],
+        column_count=validation["column_count"],
+        validation=json.dumps(validation)
+    )
+    session.add(db_file)
+    session.commit()
+    session.refresh(db_file)
+    return db_file, False
+
+class ResumableUploadService:
+    """Chunked uploads that are written, hashed and validated incrementally"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.upload_dir = os.path.join(settings.LOCAL_STORAGE_PATH, "incoming")
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    def create(self, filename: str, file_type: FileType, total_size: Optional[int] = None, owner_id: int = 1) -> UploadSession:
+        upload_id = uuid.uuid4().hex
+        temp_path = os.path.join(self.upload_dir, f"{upload_id}.part")
+        open(temp_path, "wb").close()
+
+        upload = UploadSession(
+            id=upload_id,
+            filename=os.path.basename(filename),
+            type=file_type,
+            temp_path=temp_path,
+            total_size=total_size,
+            owner_id=owner_id
+        )
+        self.session.add(upload)
+        self.session.commit()
+        self.session.refresh(upload)
+        _states[upload_id] = _UploadState(file_type)
+        return upload
+
+    async def append(self, upload: UploadSession, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        """Append a chunk at ``offset``; clients resume by asking for the current offset"""
+        state = self._get_state(upload)
+        async with state.lock:
+            if offset != upload.offset:
+                raise UploadOffsetMismatch(upload.offset)
+
+            written = 0
+            with open(upload.temp_path, "r+b") as f:
+                f.seek(upload.offset)
+                try:
+                    async for chunk in chunks:
+                        if not chunk:
+                            continue
+                        if upload.total_size is not None and upload.offset + written + len(chunk) > upload.total_size:
+                            raise ValueError("Chunk exceeds declared total size")
+                        f.write(chunk)
+                        state.feed(chunk)
+                        written += len(chunk)
+                except BaseException:
+                    # Drop the partial chunk so the client can retry it from the same offset
+                    f.truncate(upload.offset)
+                    _states.pop(upload.id, None)
+                    raise
+                f.truncate()
+
+            upload.offset += written
+            upload.updated_at = datetime.utcnow()
+            self.session.commit()
+            self.session.refresh(upload)
+        return upload
+
+    def validation(self, upload: UploadSession) -> Dict:
+        return self._get_state(upload).validator.summary()
+
+    def complete(self, upload: UploadSession) -> Tuple[Optional[DataFile], bool, Dict]:
+        """Finish an upload; returns (data_file, duplicate, validation)"""
+        if upload.total_size is not None and upload.offset != upload.total_size:
+            raise ValueError(f"Upload incomplete: {upload.offset} of {upload.total_size} bytes received")
+
+        state = self._get_state(upload)
+        validation = state.validator.finish()
+        _states.pop(upload.id, None)
+
+        if not validation["is_valid"]:
+            os.remove(upload.temp_path)
+            upload.status = "failed"
+            self.session.commit()
+            return None, False, validation
+
+        sha256 = state.hasher.hexdigest()
+        summary = {
+            "file_path": FileStorageService().store_local_file(upload.temp_path, sha256),
+            "size_bytes": upload.offset,
+            "sha256": sha256,
+            "validation": validation
+        }
+        db_file, duplicate = register_upload(self.session, upload.filename, upload.type, summary, upload.owner_id)
+
+        upload.status = "completed"
+        upload.data_file_id = db_file.id
+        upload.updated_at = datetime.utcnow()
+        self.session.commit()
+        return db_file, duplicate, validation
+
+    def _get_state(self, upload: UploadSession) -> _UploadState:
+        state = _states.get(upload.id)
+        if state is None:
+            # Process restarted mid-upload: re-read what is already on disk
+            state = _UploadState(upload.type)
+            with open(upload.temp_path, "rb") as f:
+                remaining = upload.offset
+                while remaining > 0:
+                    chunk = f.read(min(settings.UPLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    state.feed(chunk)
+                    remaining -= len(chunk)
+            _states[upload.id] = state
+        return state
@@ -0,0 +1,79 @@
+from sqlmodel import Session
+from app.db.session import engine
+from app.db.models import AnalysisJob, DataFile, AnalysisStatus
+from app.services.advanced_ewas_service import AdvancedEWASService
+from app.services.file_storage_service import FileStorageService
+from app.services.result_store import ResultRepository
+from app.services.qc_service import ProbeQCService
+from app.services.preprocessing_service import PreprocessingPipeline
+from app.core.config import settings
+from app.core.progress import progress_broker, ProgressReporter
+from app.tasks.watchdog import claim_jobs, JobHeartbeat
+import json
+from datetime import datetime
+
+def run_advanced_ewas_analysis(analysis_id: int, random_effects: list = None):
+    """Run advanced EWAS analysis with mixed models"""
+    with Session(engine) as session, JobHeartbeat([analysis_id]):
+        try:
+            # Mark the job RUNNING with a fresh heartbeat, unless another worker claimed it
+            if not claim_jobs(session, [analysis_id]):
+                return
+            analysis = session.get(AnalysisJob, analysis_id)
+            analysis.progress = 10
+            session.commit()
+            progress_broker.start(analysis_id, stage="loading")
+            
+            # Get files
+            epigenome_file = session.get(DataFile, analysis.epigenome_file_id)
+            phenotype_file = session.get(DataFile, analysis.phenotype_file_id)
+            
+            if not epigenome_file or not phenotype_file:
+                analysis.status = AnalysisStatus.FAILED
+                analysis.error_message = "Required files not found"
+                session.commit()
+                progress_broker.finish(analysis_id, AnalysisStatus.FAILED, analysis.progress)
+                return
+            
+            # Load, align and preprocess data, reusing cached artifacts from earlier jobs
+            covariates = json.loads(analysis.covariates)
+            progress_broker.update(analysis_id, stage="preprocessing")
+            pipeline = PreprocessingPipeline.from_names(json.loads(analysis.preprocessing or "[]"), covariates)
+            epigenome_df, phenotype_df, _ = pipeline.run_files(epigenome_file, phenotype_file, FileStorageService())
+            
+            analysis.progress = 30
+            session.commit()
+            
+            # Run advanced analysis
+            ewas_service = AdvancedEWASService()
+            
+            results = ewas_service.run_mixed_model_analysis(
+                epigenome_data=epigenome_df,
+                phenotype_data=phenotype_df,
+                phenotype_column=analysis.phenotype_column,
+                covariates=covariates,
+                random_effects=random_effects,
+                progress_callback=ProgressReporter(session, analysis, "fitting", start=30, end=80),
+                qc_service=ProbeQCService() if settings.QC_ENABLED else None
+            )
+            if ewas_service.qc_report:
+                analysis.qc_report = json.dumps(ewas_service.qc_report)
+            
+            analysis.progress = 80
+            session.commit()
+            progress_broker.update(analysis_id, stage="saving", total=len(results), progress=80)
+            
+            # Save results to the configured result store; summary statistics stay in SQL
+            ResultRepository(session).save(analysis, results)
+            
+            analysis.status = AnalysisStatus.COMPLETED
+            analysis.completed_at = datetime.utcnow()
+            analysis.progress = 100
+            session.commit()
+            progress_broker.finish(analysis_id, AnalysisStatus.COMPLETED)
+            
+        except Exception as e:
+            analysis.status = AnalysisStatus.FAILED
+            analysis.error_message = str(e)
+            session.commit()
+            progress_broker.finish(analysis_id, AnalysisStatus.FAILED, analysis.progress)
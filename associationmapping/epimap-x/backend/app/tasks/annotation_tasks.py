@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import numpy as np
+from sqlmodel import Session, select, func
+from sqlalchemy import tuple_, update
+from app.db.session import engine
+from app.db.models import AnalysisJob, AnalysisResult, AnalysisStatus
+from app.services.annotation_service import AnnotationService
+from app.services.result_store import ResultRepository
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def run_annotation(analysis_id: int, source: str = "auto"):
+    """Annotate analysis results in p-value order, committing each chunk as it completes"""
+    # The annotation client is asynchronous; this worker thread runs it on a loop of its own
+    asyncio.run(annotate_analysis_results(analysis_id, source))
+
+async def annotate_analysis_results(analysis_id: int, source: str = "auto"):
+    annotation_service = AnnotationService()
+
+    with Session(engine) as session:
+        analysis = session.get(AnalysisJob, analysis_id)
+        if not analysis:
+            return
+
+        try:
+            analysis.annotation_status = AnalysisStatus.RUNNING
+            session.commit()
+
+            if analysis.result_path:
+                await _annotate_result_file(session, analysis, annotation_service, source)
+                return
+
+            results_filter = AnalysisResult.analysis_id == analysis_id
+            total = session.exec(select(func.count()).select_from(AnalysisResult).where(results_filter)).one()
+            remaining = session.exec(
+                select(func.count()).select_from(AnalysisResult)
+                .where(results_filter)
+                .where(AnalysisResult.gene_symbol == None)
+            ).one()
+            done = total - remaining
+
+            # Rows already annotated drop out of this query, so a re-run resumes where it stopped;
+            # each chunk starts after the last (p_value, id) seen instead of skipping the annotated rows again
+            pending = (
+                select(AnalysisResult.id, AnalysisResult.cpg_id, AnalysisResult.p_value)
+                .where(results_filter)
+                .where(AnalysisResult.gene_symbol == None)
+                .order_by(AnalysisResult.p_value, AnalysisResult.id)
+                .limit(settings.ANNOTATION_CHUNK_SIZE)
+            )
+            last = None
+
+            while True:
+                statement = pending if last is None else pending.where(tuple_(AnalysisResult.p_value, AnalysisResult.id) > last)
+                chunk = session.exec(statement).all()
+                if not chunk:
+                    break
+                last = (chunk[-1].p_value, chunk[-1].id)
+
+                annotations = await annotation_service.annotate_chunk(
+                    session, [cpg_id for _, cpg_id, _ in chunk], source
+                )
+                session.execute(
+                    update(AnalysisResult),
+                    [
+                        {
+                            "id": result_id,
+                            "gene_symbol": annotations[cpg_id].get("gene") or "unknown",
+                            "feature_type": annotations[cpg_id].get("feature") or "unknown"
+                        }
+                        for result_id, cpg_id, _ in chunk
+                    ]
+                )
+
+                done += len(chunk)
+                analysis.annotation_progress = int(done * 100 / total) if total else 100
+                session.commit()
+
+            analysis.annotation_status = AnalysisStatus.COMPLETED
+            analysis.annotation_progress = 100
+            ResultRepository(session).mark_changed(analysis)
+            session.commit()
+
+        except Exception:
+            # error_message describes the EWAS job itself, so the annotation failure is only logged
+            logger.exception("Annotation of analysis %s failed", analysis_id)
+            session.rollback()
+            analysis.annotation_status = AnalysisStatus.FAILED
+            # Chunks committed before the failure still changed the results
+            ResultRepository(session).mark_changed(analysis)
+            session.commit()
+
+async def _annotate_result_file(session: Session, analysis: AnalysisJob, annotation_service, source: str):
+    """Annotate a Parquet result set, persisting each chunk next to the file and folding them in at the end"""
+    repository = ResultRepository(session)
+    results = repository.frame(analysis, ["cpg_id", "p_value", "gene_symbol"])
+    # Chunks persisted by an earlier run are merged in already, so a re-run resumes after them
+    pending = results.index[results["gene_symbol"].isna()]
+    pending = pending[np.argsort(results.loc[pending, "p_value"].to_numpy(dtype=float), kind="stable")]
+    done = len(results) - len(pending)
+
+    for i in range(0, len(pending), settings.ANNOTATION_CHUNK_SIZE):
+        chunk = results.loc[pending[i:i + settings.ANNOTATION_CHUNK_SIZE], ["cpg_id"]]
+        cpg_ids = chunk["cpg_id"].tolist()
+        annotations = await annotation_service.annotate_chunk(session, cpg_ids, source)
+        chunk = chunk.assign(
+            gene_symbol=[annotations[c].get("gene") or "unknown" for c in cpg_ids],
+            feature_type=[annotations[c].get("feature") or "unknown" for c in cpg_ids]
+        )
+        repository.save_annotations(analysis, chunk)
+
+        done += len(chunk)
+        analysis.annotation_progress = int(done * 100 / len(results)) if len(results) else 100
+        session.commit()
+
+    # One rewrite folds the chunks into the result file
+    repository.replace(analysis, repository.frame(analysis))
+    analysis.annotation_status = AnalysisStatus.COMPLETED
+    analysis.annotation_progress = 100
+    session.commit()
@@ -1,27 +1,35 @@
-from sqlmodel import Session, create_engine
-from app.core.config import settings
-from app.db.models import AnalysisJob, AnalysisResult, DataFile, AnalysisStatus
+from sqlmodel import Session
+from app.db.session import engine
+from app.db.models import AnalysisJob, DataFile, AnalysisStatus
 from app.services.file_storage_service import FileStorageService
 from app.services.ewas_service import EWASService
+from app.services.result_store import ResultRepository
+from app.services.qc_service import ProbeQCService
+from app.services.preprocessing_service import PreprocessingPipeline
+from app.services.confounder_service import ConfounderService
+from app.services.permutation_service import PermutationService
+from app.services.checkpoint_service import CheckpointStore
+from app.services.sweep_service import sample_mask
+from app.services.incremental_service import SufficientStatistics, sufficient_stats_path
+from app.core.config import settings
+from app.core.progress import progress_broker, ProgressReporter
+from app.core.metrics import JobMetrics, stage
+from app.tasks.watchdog import claim_jobs, JobHeartbeat
 import json
 from datetime import datetime
 
-engine = create_engine(settings.DATABASE_URL)
-
 def run_ewas_analysis(analysis_id: int):
     """Run EWAS analysis synchronously (without Celery for now)"""
-    with Session(engine) as session:
+    metrics = JobMetrics(analysis_id)
+    with Session(engine) as session, metrics.activate(), JobHeartbeat([analysis_id]):
         try:
-            # Get analysis job
+            # Mark the job RUNNING, unless it is gone or another worker claimed it
+            if not claim_jobs(session, [analysis_id]):
+                return {"error": "Analysis job not found or already claimed"}
             analysis = session.get(AnalysisJob, analysis_id)
-            if not analysis:
-                return {"error": "Analysis job not found"}
-            
-            # Update status to RUNNING
-            analysis.status = AnalysisStatus.RUNNING
-            analysis.started_at = datetime.utcnow()
             analysis.progress = 10
             session.commit()
+            progress_broker.start(analysis_id, stage="loading")
             
             # Get file information
             epigenome_file = session.get(DataFile, analysis.epigenome_file_id)
@@ -31,53 +39,100 @@ def run_ewas_analysis(analysis_id: int):
                 analysis.status = AnalysisStatus.FAILED
                 analysis.error_message = "Required files not found"
                 session.commit()
+                progress_broker.finish(analysis_id, AnalysisStatus.FAILED, analysis.progress)
                 return {"error": "Required files not found"}
             
             # Download files from storage
-            storage_service = FileStorageService()
-            epigenome_data = storage_service.download_file(epigenome_file.file_path)
-            phenotype_data = storage_service.download_file(phenotype_file.file_path)
+            covariates = json.loads(analysis.covariates)
+            
+            # Align and preprocess, reusing cached artifacts from earlier jobs on the same files
+            progress_broker.update(analysis_id, stage="preprocessing")
+            pipeline = PreprocessingPipeline.from_names(json.loads(analysis.preprocessing or "[]"), covariates)
+            epigenome_df, phenotype_df, preprocessing_info = pipeline.run_files(epigenome_file, phenotype_file, FileStorageService())
+            if analysis.sample_filter:
+                phenotype_df = phenotype_df[sample_mask(phenotype_df, json.loads(analysis.sample_filter))]
             
             analysis.progress = 30
             session.commit()
             
             # Run EWAS analysis
             ewas_service = EWASService()
-            covariates = json.loads(analysis.covariates)
+            confounder_service = ConfounderService(**json.loads(analysis.confounders)) if analysis.confounders else None
+            permutation_service = PermutationService(**json.loads(analysis.permutation)) if analysis.permutation else None
+            fitting_end = 60 if permutation_service else 80
+            checkpoint = None
+            if settings.CHECKPOINT_ENABLED:
+                run_key = json.dumps([
+                    preprocessing_info["artifact"], analysis.phenotype_column, covariates,
+                    analysis.model_type, analysis.case_level, analysis.confounders, analysis.sample_filter, settings.QC_ENABLED
+                ])
+                checkpoint = CheckpointStore(session, analysis, run_key)
             
             results = ewas_service.run_analysis(
-                epigenome_data=epigenome_data,
-                phenotype_data=phenotype_data,
+                epigenome_data=epigenome_df,
+                phenotype_data=phenotype_df,
                 phenotype_column=analysis.phenotype_column,
-                covariates=covariates
+                covariates=covariates,
+                progress_callback=ProgressReporter(session, analysis, "fitting", start=30, end=fitting_end),
+                qc_service=ProbeQCService() if settings.QC_ENABLED else None,
+                confounder_service=confounder_service,
+                permutation_service=permutation_service,
+                permutation_progress_callback=ProgressReporter(session, analysis, "permutations", start=60, end=80, lazy=True),
+                model_type=analysis.model_type,
+                checkpoint=checkpoint,
+                case_level=analysis.case_level
             )
+            if ewas_service.qc_report:
+                analysis.qc_report = json.dumps(ewas_service.qc_report)
+            if ewas_service.confounder_report:
+                report = dict(ewas_service.confounder_report)
+                report["values"] = ewas_service.confounders.round(6).to_dict(orient="index")
+                analysis.confounder_report = json.dumps(report)
+            if ewas_service.model_report and analysis.case_level is None:
+                analysis.case_level = ewas_service.model_report["case_level"]
             
             analysis.progress = 80
             session.commit()
+            progress_broker.update(analysis_id, stage="saving", total=len(results), progress=80)
+            
+            # Save results to the configured result store; summary statistics stay in SQL
+            with stage("persist", rows=len(results)):
+                ResultRepository(session).save(analysis, results)
             
-            # Save results to database
-            for result in results:
-                db_result = AnalysisResult(
-                    cpg_id=result['cpg_id'],
-                    chromosome=result['chromosome'],
-                    position=result['position'],
-                    beta=result['beta'],
-                    p_value=result['p_value'],
-                    fdr=result.get('fdr'),
-                    analysis_id=analysis_id
-                )
-                session.add(db_result)
+            # Cross-products of this run's samples, so later samples can be added without rereading them
+            if analysis.incremental:
+                with stage("sufficient_stats", rows=len(epigenome_df)):
+                    statistics = SufficientStatistics.collect(epigenome_df, phenotype_df, analysis.phenotype_column, covariates)
+                    analysis.sufficient_stats_path = sufficient_stats_path(analysis.id)
+                    statistics.save(analysis.sufficient_stats_path)
             
             # Update analysis status
+            analysis.metrics = _metrics_json(metrics, AnalysisStatus.COMPLETED, ewas_service.model_report)
             analysis.status = AnalysisStatus.COMPLETED
             analysis.completed_at = datetime.utcnow()
             analysis.progress = 100
             session.commit()
+            progress_broker.finish(analysis_id, AnalysisStatus.COMPLETED)
+            
+            # Only dropped once the results are committed, so a crash while saving still resumes
+            if checkpoint is not None:
+                checkpoint.clear()
             
             return {"status": "completed", "results_count": len(results)}
             
         except Exception as e:
+            analysis.metrics = _metrics_json(metrics, AnalysisStatus.FAILED)
             analysis.status = AnalysisStatus.FAILED
             analysis.error_message = str(e)
             session.commit()
-            return {"error": str(e)}
\ No newline at end of file
+            progress_broker.finish(analysis_id, AnalysisStatus.FAILED, analysis.progress)
+            return {"error": str(e)}
+
+def _metrics_json(metrics: JobMetrics, status: AnalysisStatus, model=None):
+    report = metrics.report(status.value)
+    if report is None:
+        return None
+    # Which phenotype level a logistic model coded as the case
+    if model is not None:
+        report = dict(report, model=model)
+    return json.dumps(report)
@@ -0,0 +1,98 @@
+from sqlmodel import Session
+from app.db.session import engine
+from app.db.models import AnalysisJob, DataFile, AnalysisStatus
+from app.services.file_storage_service import FileStorageService
+from app.services.result_store import ResultRepository
+from app.services.qc_service import ProbeQCService
+from app.services.preprocessing_service import PreprocessingPipeline
+from app.services.incremental_service import SufficientStatistics, sufficient_stats_path
+from app.services.sweep_service import sample_mask
+from app.core.config import settings
+from app.core.progress import progress_broker, ProgressReporter
+from app.core.metrics import JobMetrics, stage
+from app.tasks.watchdog import claim_jobs, JobHeartbeat
+import json
+from datetime import datetime
+
+def run_incremental_update(analysis_id: int):
+    """Add the job's samples to its base analysis' sufficient statistics and solve the updated EWAS"""
+    metrics = JobMetrics(analysis_id)
+    with Session(engine) as session, metrics.activate(), JobHeartbeat([analysis_id]):
+        try:
+            if not claim_jobs(session, [analysis_id]):
+                return {"error": "Analysis job not found or already claimed"}
+            analysis = session.get(AnalysisJob, analysis_id)
+            analysis.progress = 10
+            session.commit()
+            progress_broker.start(analysis_id, stage="loading")
+
+            base = session.get(AnalysisJob, analysis.base_analysis_id)
+            if base is None or not base.sufficient_stats_path:
+                raise ValueError("Base analysis has no sufficient statistics")
+            epigenome_file = session.get(DataFile, analysis.epigenome_file_id)
+            phenotype_file = session.get(DataFile, analysis.phenotype_file_id)
+            if not epigenome_file or not phenotype_file:
+                raise ValueError("Required files not found")
+
+            with stage("load_statistics"):
+                statistics = SufficientStatistics.load(base.sufficient_stats_path)
+
+            # Only per-sample preprocessing is allowed, so the new samples are transformed like the original ones
+            progress_broker.update(analysis_id, stage="preprocessing")
+            covariates = json.loads(analysis.covariates)
+            pipeline = PreprocessingPipeline.from_names(json.loads(analysis.preprocessing or "[]"), covariates)
+            epigenome_df, phenotype_df, _ = pipeline.run_files(epigenome_file, phenotype_file, FileStorageService())
+            if analysis.sample_filter:
+                phenotype_df = phenotype_df[sample_mask(phenotype_df, json.loads(analysis.sample_filter))]
+
+            analysis.progress = 30
+            session.commit()
+
+            with stage("accumulate", rows=len(epigenome_df)):
+                summary = statistics.add(
+                    epigenome_df, phenotype_df,
+                    progress_callback=ProgressReporter(session, analysis, "accumulating", start=30, end=60)
+                )
+            del epigenome_df
+
+            with stage("solve", rows=len(statistics.cpg_ids)):
+                results, qc_report = statistics.results(ProbeQCService() if settings.QC_ENABLED else None)
+            if qc_report:
+                analysis.qc_report = json.dumps(qc_report)
+
+            # Saved under this job, so the next batch of samples can be added on top of it
+            with stage("sufficient_stats", rows=len(statistics.cpg_ids)):
+                analysis.sufficient_stats_path = sufficient_stats_path(analysis.id)
+                statistics.save(analysis.sufficient_stats_path)
+
+            analysis.progress = 80
+            session.commit()
+            progress_broker.update(analysis_id, stage="saving", total=len(results), progress=80)
+
+            with stage("persist", rows=len(results)):
+                ResultRepository(session).save(analysis, results)
+
+            analysis.metrics = _metrics_json(metrics, AnalysisStatus.COMPLETED, summary)
+            analysis.status = AnalysisStatus.COMPLETED
+            analysis.completed_at = datetime.utcnow()
+            analysis.progress = 100
+            session.commit()
+            progress_broker.finish(analysis_id, AnalysisStatus.COMPLETED)
+
+            return {"status": "completed", "results_count": len(results), **summary}
+
+        except Exception as e:
+            analysis.metrics = _metrics_json(metrics, AnalysisStatus.FAILED)
+            analysis.status = AnalysisStatus.FAILED
+            analysis.error_message = str(e)
+            session.commit()
+            progress_broker.finish(analysis_id, AnalysisStatus.FAILED, analysis.progress)
+            return {"error": str(e)}
+
+def _metrics_json(metrics: JobMetrics, status: AnalysisStatus, summary=None):
+    report = metrics.report(status.value)
+    if report is None:
+        return None
+    if summary is not None:
+        report = dict(report, incremental=summary)
+    return json.dumps(report)
@@ -0,0 +1,182 @@
+import asyncio
+import importlib
+import inspect
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Worker tasks by "module:function" name: the modules (and the scientific stack behind them)
+# are imported by the worker thread when a job starts, never by the API on startup
+EWAS_TASK = "app.tasks.ewas_tasks:run_ewas_analysis"
+SWEEP_TASK = "app.tasks.sweep_tasks:run_sweep_analysis"
+INCREMENTAL_TASK = "app.tasks.incremental_tasks:run_incremental_update"
+ADVANCED_TASK = "app.tasks.advanced_tasks:run_advanced_ewas_analysis"
+ANNOTATION_TASK = "app.tasks.annotation_tasks:run_annotation"
+
+def estimate_job_memory(analysis, epigenome_file) -> int:
+    """Peak bytes of an analysis, from the matrix shape recorded at upload (CpGs x samples x float64)"""
+    if epigenome_file is not None and epigenome_file.row_count and epigenome_file.column_count:
+        matrix = epigenome_file.row_count * epigenome_file.column_count * 8
+    else:
+        # Shape unknown: a text matrix parses to roughly its own size
+        matrix = (epigenome_file.size_bytes if epigenome_file is not None else 0)
+    # Parsed frame, aligned/preprocessed copies and per-block temporaries
+    estimate = matrix * settings.SCHEDULER_MEMORY_FACTOR
+    if analysis.permutation:
+        # Residualized float32 copy held by the permutation engine
+        estimate += matrix / 2
+    return int(estimate + settings.SCHEDULER_JOB_BASE_MEMORY)
+
+def _default_memory_budget() -> int:
+    try:
+        physical = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        physical = 8 * 1024 ** 3
+    return int(physical * settings.SCHEDULER_MEMORY_FRACTION)
+
+def _run_task(task: str, *args):
+    module, name = task.split(":")
+    return getattr(importlib.import_module(module), name)(*args)
+
+class QueuedJob:
+    def __init__(self, analysis_id: int, owner_id: int, priority: int, memory: int, run: Union[Callable, str], args: tuple, sequence: int):
+        self.analysis_id = analysis_id
+        self.owner_id = owner_id
+        self.priority = priority
+        self.memory = memory
+        self.run = run
+        self.args = args
+        self.sequence = sequence
+        self.submitted_at = time.time()
+
+class JobScheduler:
+    """Starts queued analyses only when their estimated memory and a CPU slot are free.
+
+    Among queued jobs the highest priority wins; within a priority the owner
+    with the fewest running jobs goes first (fair share), then submission
+    order. The chosen job waits for resources instead of being overtaken, so
+    large jobs cannot starve. A job larger than the whole budget runs alone.
+    The event loop changes the queue; the lock lets other threads (e.g. the
+    /metrics route) read it consistently.
+    """
+
+    def __init__(self, memory_budget: Optional[int] = None, cpu_slots: Optional[int] = None):
+        self.memory_budget = memory_budget or settings.SCHEDULER_MEMORY_BUDGET or _default_memory_budget()
+        self.cpu_slots = cpu_slots or settings.SCHEDULER_CPU_SLOTS or os.cpu_count() or 1
+        self._queue: List[QueuedJob] = []
+        self._running: Dict[int, QueuedJob] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=self.cpu_slots, thread_name_prefix="analysis")
+
+    def submit(self, analysis_id: int, owner_id: int, run: Union[Callable, str], *args, priority: int = 0, memory: int = 0):
+        """Queue ``run(analysis_id, *args)``; must be called from the event loop.
+
+        ``run`` is a function or the "module:function" name of a synchronous one;
+        either way it runs on a worker thread, coroutine functions in a loop of their own.
+        """
+        with self._lock:
+            if analysis_id in self._running or any(job.analysis_id == analysis_id for job in self._queue):
+                return
+            self._queue.append(QueuedJob(analysis_id, owner_id, priority, memory, run, args, next(self._sequence)))
+            self._dispatch()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "memory_budget": self.memory_budget,
+                "memory_reserved": self._reserved_memory(),
+                "cpu_slots": self.cpu_slots,
+                "running": [self._describe(job) for job in self._running.values()],
+                "queued": [self._describe(job) for job in self._ordered()]
+            }
+
+    def running_ids(self) -> List[int]:
+        with self._lock:
+            return list(self._running)
+
+    def position(self, analysis_id: int) -> Optional[int]:
+        """0-based place of a queued job in admission order"""
+        with self._lock:
+            for i, job in enumerate(self._ordered()):
+                if job.analysis_id == analysis_id:
+                    return i
+        return None
+
+    def _ordered(self) -> List[QueuedJob]:
+        running_per_owner: Dict[int, int] = {}
+        for job in self._running.values():
+            running_per_owner[job.owner_id] = running_per_owner.get(job.owner_id, 0) + 1
+        return sorted(
+            self._queue,
+            key=lambda job: (-job.priority, running_per_owner.get(job.owner_id, 0), job.sequence)
+        )
+
+    def _reserved_memory(self) -> int:
+        return sum(job.memory for job in self._running.values())
+
+    def _dispatch(self):
+        # Callers hold the lock
+        while self._queue and len(self._running) < self.cpu_slots:
+            job = self._ordered()[0]
+            memory = min(job.memory, self.memory_budget)
+            if self._running and self._reserved_memory() + memory > self.memory_budget:
+                break
+            self._queue.remove(job)
+            self._running[job.analysis_id] = job
+            self._start(job)
+
+    def _start(self, job: QueuedJob):
+        loop = asyncio.get_running_loop()
+        if isinstance(job.run, str):
+            future = loop.run_in_executor(self._executor, _run_task, job.run, job.analysis_id, *job.args)
+        elif inspect.iscoroutinefunction(job.run):
+            # Jobs are CPU-bound and hold a CPU slot: even a coroutine gets a worker thread (and its own loop)
+            future = loop.run_in_executor(self._executor, asyncio.run, job.run(job.analysis_id, *job.args))
+        else:
+            future = loop.run_in_executor(self._executor, job.run, job.analysis_id, *job.args)
+        future.add_done_callback(lambda f, job=job: self._finished(job, f))
+
+    def _finished(self, job: QueuedJob, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Analysis %s crashed: %s", job.analysis_id, future.exception())
+        with self._lock:
+            self._running.pop(job.analysis_id, None)
+            self._dispatch()
+
+    def _describe(self, job: QueuedJob) -> Dict:
+        return {
+            "analysis_id": job.analysis_id,
+            "owner_id": job.owner_id,
+            "priority": job.priority,
+            "memory": job.memory,
+            "waiting_seconds": round(time.time() - job.submitted_at, 1)
+        }
+
+_scheduler: Optional[JobScheduler] = None
+
+def get_scheduler() -> JobScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = JobScheduler()
+    return _scheduler
+
+def schedule_analysis(session, analysis, run: Union[Callable, str], *args):
+    """Queue an analysis job with its priority and estimated memory"""
+    from app.db.models import DataFile
+    epigenome_file = session.get(DataFile, analysis.epigenome_file_id)
+    get_scheduler().submit(
+        analysis.id,
+        analysis.owner_id,
+        run,
+        *args,
+        priority=analysis.priority,
+        memory=estimate_job_memory(analysis, epigenome_file)
+    )
@@ -0,0 +1,114 @@
+from sqlmodel import Session, select
+from typing import List
+from app.db.session import engine
+from app.db.models import AnalysisJob, DataFile, AnalysisStatus
+from app.services.file_storage_service import FileStorageService
+from app.services.result_store import ResultRepository
+from app.services.qc_service import ProbeQCService
+from app.services.preprocessing_service import PreprocessingPipeline
+from app.services.sweep_service import SweepService, SweepVariant
+from app.core.config import settings
+from app.core.progress import progress_broker, ProgressReporter
+from app.core.metrics import JobMetrics, stage
+from app.tasks.watchdog import claim_jobs, JobHeartbeat
+import json
+from datetime import datetime
+
+def run_sweep_analysis(analysis_id: int, analysis_ids: List[int]):
+    """Run every analysis of a sweep over one load of its shared files"""
+    metrics = JobMetrics(analysis_id)
+    analyses = []
+    with Session(engine) as session, metrics.activate(), JobHeartbeat(analysis_ids):
+        try:
+            # Only PENDING variants are claimed: those finished before a restart keep their results
+            claimed = claim_jobs(session, analysis_ids)
+            analyses = session.exec(
+                select(AnalysisJob).where(AnalysisJob.id.in_(claimed)).order_by(AnalysisJob.id)
+            ).all()
+            if not analyses:
+                return {"error": "Analysis jobs not found or already claimed"}
+            lead = analyses[0]
+
+            for analysis in analyses:
+                analysis.progress = 10
+            session.commit()
+            for analysis in analyses:
+                progress_broker.start(analysis.id, stage="loading")
+
+            epigenome_file = session.get(DataFile, lead.epigenome_file_id)
+            phenotype_file = session.get(DataFile, lead.phenotype_file_id)
+            if not epigenome_file or not phenotype_file:
+                raise ValueError("Required files not found")
+
+            # One load and preprocessing run for all variants; residualization keeps every covariate used
+            variants = [
+                SweepVariant(json.loads(a.covariates), json.loads(a.sample_filter) if a.sample_filter else None, a.name)
+                for a in analyses
+            ]
+            covariates = sorted({c for variant in variants for c in variant.covariates})
+            for analysis in analyses:
+                progress_broker.update(analysis.id, stage="preprocessing")
+            pipeline = PreprocessingPipeline.from_names(json.loads(lead.preprocessing or "[]"), covariates)
+            epigenome_df, phenotype_df, _ = pipeline.run_files(epigenome_file, phenotype_file, FileStorageService())
+
+            for analysis in analyses:
+                analysis.progress = 30
+            session.commit()
+
+            reporters = [ProgressReporter(session, analysis, "fitting", start=30, end=80) for analysis in analyses]
+            def report_progress(done: int, total: int):
+                for reporter in reporters:
+                    reporter(done, total)
+
+            outputs = SweepService().run(
+                epigenome_df,
+                phenotype_df,
+                lead.phenotype_column,
+                variants,
+                qc_service=ProbeQCService() if settings.QC_ENABLED else None,
+                progress_callback=report_progress
+            )
+
+            total_results = 0
+            for analysis, (results, report) in zip(analyses, outputs):
+                analysis.progress = 80
+                session.commit()
+                progress_broker.update(analysis.id, stage="saving", total=len(results), progress=80)
+
+                with stage("persist", rows=len(results)):
+                    ResultRepository(session).save(analysis, results)
+                if report.get("qc"):
+                    analysis.qc_report = json.dumps(report["qc"])
+
+                analysis.status = AnalysisStatus.COMPLETED
+                analysis.completed_at = datetime.utcnow()
+                analysis.progress = 100
+                session.commit()
+                progress_broker.finish(analysis.id, AnalysisStatus.COMPLETED)
+                total_results += len(results)
+
+            _store_metrics(session, analyses, metrics, AnalysisStatus.COMPLETED, outputs)
+            return {"status": "completed", "analyses": len(analyses), "results_count": total_results}
+
+        except Exception as e:
+            failed = [a for a in analyses if a.status != AnalysisStatus.COMPLETED]
+            for analysis in failed:
+                analysis.status = AnalysisStatus.FAILED
+                analysis.error_message = str(e)
+            session.commit()
+            _store_metrics(session, analyses, metrics, AnalysisStatus.FAILED)
+            for analysis in failed:
+                progress_broker.finish(analysis.id, AnalysisStatus.FAILED, analysis.progress)
+            return {"error": str(e)}
+
+def _store_metrics(session: Session, analyses: List[AnalysisJob], metrics: JobMetrics, status: AnalysisStatus, outputs=None):
+    """Every job of the sweep shares the run's stage metrics, plus its own variant report"""
+    report = metrics.report(status.value)
+    if report is None:
+        return
+    for i, analysis in enumerate(analyses):
+        job_report = dict(report)
+        if outputs is not None:
+            job_report["sweep"] = {k: v for k, v in outputs[i][1].items() if k != "qc"}
+        analysis.metrics = json.dumps(job_report)
+    session.commit()
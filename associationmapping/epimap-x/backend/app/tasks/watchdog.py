@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Collection, List
+from sqlalchemy import update
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.db.session import engine
+from app.db.models import AnalysisJob, AnalysisStatus
+
+logger = logging.getLogger(__name__)
+
+def find_orphaned_jobs(session: Session, now: datetime = None, running_here: Collection[int] = ()) -> List[AnalysisJob]:
+    """RUNNING jobs whose worker has not sent a heartbeat within the timeout, except those this process runs"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=settings.JOB_HEARTBEAT_TIMEOUT)
+    running = session.exec(select(AnalysisJob).where(AnalysisJob.status == AnalysisStatus.RUNNING)).all()
+    return [
+        job for job in running
+        if job.id not in running_here and (job.heartbeat_at or job.started_at or job.created_at) < cutoff
+    ]
+
+def requeue_orphaned_jobs(running_here: Collection[int] = ()) -> List[int]:
+    """Reset orphaned jobs to PENDING (or FAILED after too many attempts) and return those to rerun"""
+    requeued = []
+    with Session(engine) as session:
+        for job in find_orphaned_jobs(session, running_here=running_here):
+            job.attempts += 1
+            if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+                job.status = AnalysisStatus.FAILED
+                job.error_message = f"Worker lost {job.attempts} times; giving up"
+            else:
+                job.status = AnalysisStatus.PENDING
+                requeued.append(job.id)
+            logger.warning("Orphaned analysis %s (attempt %s) -> %s", job.id, job.attempts, job.status.value)
+        session.commit()
+    return requeued
+
+def claim_jobs(session: Session, analysis_ids: Collection[int]) -> List[int]:
+    """Move PENDING jobs to RUNNING and return the ones this worker won.
+
+    The status check and update are one statement, so when several worker
+    processes queued the same job only one of them runs it.
+    """
+    now = datetime.utcnow()
+    claimed = []
+    for analysis_id in analysis_ids:
+        result = session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == analysis_id, AnalysisJob.status == AnalysisStatus.PENDING)
+            .values(status=AnalysisStatus.RUNNING, started_at=now, heartbeat_at=now)
+        )
+        if result.rowcount:
+            claimed.append(analysis_id)
+    session.commit()
+    return claimed
+
+class JobHeartbeat:
+    """Refreshes the heartbeat of running jobs from a timer thread while the block runs.
+
+    Progress flushes and checkpoints also refresh it, but long stages without
+    either (parsing, confounder estimation, persisting) would otherwise look
+    orphaned to the watchdog.
+    """
+
+    def __init__(self, analysis_ids: Collection[int], interval: float = None):
+        self.analysis_ids = list(analysis_ids)
+        self.interval = interval or settings.JOB_HEARTBEAT_INTERVAL
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with Session(engine) as session:
+                    session.execute(
+                        update(AnalysisJob)
+                        .where(AnalysisJob.id.in_(self.analysis_ids), AnalysisJob.status == AnalysisStatus.RUNNING)
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+                    session.commit()
+            except Exception as e:
+                logger.warning("Heartbeat for analyses %s failed: %s", self.analysis_ids, e)
+
+def dispatch_analysis(analysis_id: int):
+    """Queue a job again with the options it was submitted with; EWAS jobs resume from their checkpointed blocks.
+
+    Every worker process queues the PENDING jobs it finds, so tasks start by
+    claiming their job; a job queued by several processes runs once.
+    """
+    from app.core.options import MODEL_TYPES
+    from app.tasks.scheduler import schedule_analysis, EWAS_TASK, INCREMENTAL_TASK, ADVANCED_TASK
+
+    with Session(engine) as session:
+        job = session.get(AnalysisJob, analysis_id)
+        if job is None:
+            return
+        if job.base_analysis_id is not None:
+            schedule_analysis(session, job, INCREMENTAL_TASK)
+        elif job.model_type == "mixed_model":
+            random_effects = json.loads(job.random_effects) if job.random_effects else None
+            schedule_analysis(session, job, ADVANCED_TASK, random_effects)
+        elif job.model_type in MODEL_TYPES:
+            schedule_analysis(session, job, EWAS_TASK)
+        else:
+            # ML and multi-omics jobs are not resumable
+            job.status = AnalysisStatus.FAILED
+            job.error_message = "Interrupted by a restart"
+            session.commit()
+
+def pending_jobs() -> List[int]:
+    """Jobs still waiting to run; the in-memory queue does not survive a restart"""
+    with Session(engine) as session:
+        return list(session.exec(
+            select(AnalysisJob.id).where(AnalysisJob.status == AnalysisStatus.PENDING).order_by(AnalysisJob.id)
+        ).all())
+
+async def job_watchdog():
+    """Periodically requeue jobs orphaned by a crashed or restarted worker"""
+    from app.tasks.scheduler import get_scheduler
+    
+    try:
+        for analysis_id in await asyncio.to_thread(pending_jobs):
+            dispatch_analysis(analysis_id)
+    except Exception as e:
+        logger.warning("Could not requeue pending jobs: %s", e)
+    while True:
+        try:
+            # Read on the loop, which owns the scheduler state; these jobs are alive whatever their heartbeat says
+            running_here = get_scheduler().running_ids()
+            for analysis_id in await asyncio.to_thread(requeue_orphaned_jobs, running_here):
+                dispatch_analysis(analysis_id)
+        except Exception as e:
+            logger.warning("Job watchdog pass failed: %s", e)
+        await asyncio.sleep(settings.JOB_WATCHDOG_INTERVAL)
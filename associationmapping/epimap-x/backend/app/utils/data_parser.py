@@ -1,16 +1,27 @@
 import pandas as pd
 import numpy as np
-from typing import Tuple, List
+from typing import Tuple, List, Dict, BinaryIO, Union
+import csv
 import io
 
+def as_buffer(file_data: Union[bytes, BinaryIO]) -> BinaryIO:
+    """Accept raw bytes or an already open (e.g. range-reading) binary file object"""
+    return io.BytesIO(file_data) if isinstance(file_data, (bytes, bytearray)) else file_data
+
+def read_table(data: Union[bytes, BinaryIO, pd.DataFrame], **kwargs) -> pd.DataFrame:
+    """Parse delimited data; already prepared DataFrames (e.g. from the preprocessing pipeline) pass through"""
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.read_csv(as_buffer(data), **kwargs)
+
 class DataParser:
     @staticmethod
-    def parse_epigenome_file(file_data: bytes, file_format: str = "tsv") -> pd.DataFrame:
+    def parse_epigenome_file(file_data: Union[bytes, BinaryIO], file_format: str = "tsv") -> pd.DataFrame:
         """Parse epigenome data file (TSV/CSV format)"""
         if file_format.lower() == "tsv":
-            df = pd.read_csv(io.BytesIO(file_data), sep='\t', index_col=0)
+            df = pd.read_csv(as_buffer(file_data), sep='\t', index_col=0)
         else:
-            df = pd.read_csv(io.BytesIO(file_data), index_col=0)
+            df = pd.read_csv(as_buffer(file_data), index_col=0)
         
         # Validate data format
         if df.empty:
@@ -27,9 +38,9 @@ class DataParser:
     def parse_phenotype_file(file_data: bytes, file_format: str = "csv") -> pd.DataFrame:
         """Parse phenotype data file (CSV/TSV format)"""
         if file_format.lower() == "tsv":
-            df = pd.read_csv(io.BytesIO(file_data), sep='\t', index_col=0)
+            df = pd.read_csv(as_buffer(file_data), sep='\t', index_col=0)
         else:
-            df = pd.read_csv(io.BytesIO(file_data), index_col=0)
+            df = pd.read_csv(as_buffer(file_data), index_col=0)
         
         # Validate data format
         if df.empty:
@@ -48,4 +59,106 @@ class DataParser:
         if len(common_samples) < 10:
             raise ValueError(f"Insufficient sample overlap: {len(common_samples)} samples")
         
-        return list(common_samples), len(common_samples)
\ No newline at end of file
+        return list(common_samples), len(common_samples)
+
+NA_TOKENS = {"", "NA", "NaN", "nan", "N/A", "NULL", "null", "."}
+CANDIDATE_DELIMITERS = ("\t", ",", ";")
+
+class StreamingValidator:
+    """Validates a delimited data file incrementally while it is being uploaded"""
+    
+    def __init__(self, numeric: bool = True, max_errors: int = 20):
+        self.numeric = numeric
+        self.max_errors = max_errors
+        self.delimiter = None
+        self.header: List[str] = []
+        self.row_count = 0
+        self.missing_values = 0
+        self.non_numeric_values = 0
+        self.ragged_rows = 0
+        self.duplicate_ids = 0
+        self.errors: List[str] = []
+        self._seen_ids = set()
+        self._pending = b""
+        self._line_number = 0
+    
+    def feed(self, data: bytes):
+        """Consume the next block of bytes; incomplete trailing lines are buffered"""
+        data = self._pending + data
+        last_newline = data.rfind(b"\n")
+        if last_newline == -1:
+            self._pending = data
+            return
+        self._pending = data[last_newline + 1:]
+        self._process_lines(data[:last_newline].decode("utf-8", errors="replace").splitlines())
+    
+    def finish(self) -> Dict:
+        if self._pending:
+            self._process_lines(self._pending.decode("utf-8", errors="replace").splitlines())
+            self._pending = b""
+        if not self.header:
+            self._error("File is empty")
+        elif self.row_count == 0:
+            self._error("File has a header but no data rows")
+        return self.summary()
+    
+    def summary(self) -> Dict:
+        return {
+            "delimiter": self.delimiter,
+            "columns": self.header,
+            "column_count": len(self.header),
+            "row_count": self.row_count,
+            "missing_values": self.missing_values,
+            "non_numeric_values": self.non_numeric_values,
+            "ragged_rows": self.ragged_rows,
+            "duplicate_ids": self.duplicate_ids,
+            "errors": self.errors,
+            "is_valid": not self.errors
+        }
+    
+    def _process_lines(self, lines: List[str]):
+        if not lines:
+            return
+        
+        if self.delimiter is None:
+            first = lines[0]
+            self.delimiter = max(CANDIDATE_DELIMITERS, key=first.count)
+            self.header = next(csv.reader([first], delimiter=self.delimiter))
+            self._line_number = 1
+            lines = lines[1:]
+            if len(self.header) < 2:
+                self._error("Header must contain an ID column and at least one sample column")
+        
+        rows = [row for row in csv.reader(lines, delimiter=self.delimiter) if row]
+        if not rows:
+            self._line_number += len(lines)
+            return
+        
+        width = len(self.header)
+        for offset, row in enumerate(rows):
+            if len(row) != width:
+                self.ragged_rows += 1
+                self._error(f"Line {self._line_number + offset + 1}: expected {width} fields, found {len(row)}")
+            row_id = row[0]
+            if row_id in self._seen_ids:
+                self.duplicate_ids += 1
+                self._error(f"Line {self._line_number + offset + 1}: duplicate ID '{row_id}'")
+            self._seen_ids.add(row_id)
+        
+        values = pd.Series([value for row in rows for value in row[1:]], dtype=object)
+        missing = values.isin(NA_TOKENS)
+        self.missing_values += int(missing.sum())
+        
+        if self.numeric:
+            non_numeric = pd.to_numeric(values, errors="coerce").isna() & ~missing
+            count = int(non_numeric.sum())
+            if count:
+                self.non_numeric_values += count
+                self._error(f"{count} non-numeric value(s) near line {self._line_number + 1}, e.g. '{values[non_numeric].iloc[0]}'")
+        
+        self.row_count += len(rows)
+        self._line_number += len(lines)
+    
+    def _error(self, message: str):
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
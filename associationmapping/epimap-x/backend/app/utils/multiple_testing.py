@@ -0,0 +1,14 @@
+import numpy as np
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """Vectorized Benjamini-Hochberg adjusted p-values"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    n = len(p_values)
+    if n == 0:
+        return p_values
+    order = np.argsort(p_values)
+    adjusted = p_values[order] * n / np.arange(1, n + 1)
+    adjusted = np.minimum.accumulate(adjusted[::-1])[::-1]
+    result = np.empty(n)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+from typing import Tuple
+
+def design_matrix(frame: pd.DataFrame) -> np.ndarray:
+    """Intercept plus the frame's columns, with categorical columns dummy-coded"""
+    encoded = pd.get_dummies(frame, drop_first=True, dtype=float).to_numpy(dtype=np.float64)
+    return np.column_stack([np.ones(len(frame)), encoded])
+
+def orthonormal_basis(design: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Orthonormal basis of the design's column space and its rank"""
+    rank = int(np.linalg.matrix_rank(design))
+    basis, _ = np.linalg.qr(design)
+    if rank < design.shape[1]:
+        # Rank-deficient design (e.g. collinear covariates): keep the basis of the actual span
+        u, _, _ = np.linalg.svd(design, full_matrices=False)
+        basis = u[:, :rank]
+    return basis, rank
+
+def extend_basis(basis: np.ndarray, columns: np.ndarray, tol: float = 1e-10) -> np.ndarray:
+    """Orthonormal vectors that extend ``basis`` to also span ``columns``.
+
+    Only the new columns are orthogonalized, so a design that adds covariates
+    to an already factorized one reuses that factorization. Columns already in
+    the span (e.g. a covariate constant within a subset) add nothing.
+    """
+    if not columns.shape[1]:
+        return np.empty((len(basis), 0))
+    residual = columns - basis @ (basis.T @ columns)
+    u, singular, _ = np.linalg.svd(residual, full_matrices=False)
+    scale = max(float(np.abs(columns).max()), 1.0) * max(residual.shape)
+    added = u[:, singular > tol * scale]
+    # A second pass keeps the combined basis orthonormal to working precision
+    added = added - basis @ (basis.T @ added)
+    added, _ = np.linalg.qr(added)
+    return added
+
+def residualize(values: np.ndarray, basis: np.ndarray) -> np.ndarray:
+    """Residuals of each row of ``values`` (features x samples) after projecting out ``basis``"""
+    return values - (values @ basis) @ basis.T
+
+def impute_row_means(values: np.ndarray) -> np.ndarray:
+    """Replace missing values by the mean of their row"""
+    observed = np.isfinite(values)
+    if observed.all():
+        return values
+    means = np.where(observed, values, 0.0).sum(axis=1) / np.maximum(observed.sum(axis=1), 1)
+    return np.where(observed, values, means[:, None])
+
+class GLMFamily:
+    """Distribution and link of a generalized linear model, as needed by IRLS"""
+    name = ""
+
+    def link(self, mu: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def mean(self, eta: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def mean_derivative(self, mu: np.ndarray) -> np.ndarray:
+        """d mu / d eta, expressed in mu"""
+        raise NotImplementedError
+
+    def variance(self, mu: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def initial_mean(self, y: np.ndarray) -> np.ndarray:
+        return (y + y.mean()) / 2
+
+class Binomial(GLMFamily):
+    """Bernoulli outcome with logit link"""
+    name = "binomial"
+
+    def link(self, mu):
+        return np.log(mu / (1 - mu))
+
+    def mean(self, eta):
+        return np.clip(1 / (1 + np.exp(-np.clip(eta, -30, 30))), 1e-10, 1 - 1e-10)
+
+    def mean_derivative(self, mu):
+        return mu * (1 - mu)
+
+    def variance(self, mu):
+        return mu * (1 - mu)
+
+    def initial_mean(self, y):
+        return (y + 0.5) / 2
+
+class Poisson(GLMFamily):
+    """Count outcome with log link"""
+    name = "poisson"
+
+    def link(self, mu):
+        return np.log(mu)
+
+    def mean(self, eta):
+        return np.exp(np.clip(eta, -30, 30))
+
+    def mean_derivative(self, mu):
+        return mu
+
+    def variance(self, mu):
+        return mu
+
+class NegativeBinomial(Poisson):
+    """Overdispersed counts with log link: Var = mu + alpha * mu^2, alpha held fixed"""
+    name = "negative_binomial"
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+
+    def variance(self, mu):
+        return mu + self.alpha * mu * mu
+
+def batched_irls(
+    X: np.ndarray,
+    y: np.ndarray,
+    weights: np.ndarray,
+    family: GLMFamily,
+    max_iter: int = 25,
+    tol: float = 1e-8
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fit one GLM per leading index of ``X`` (models x samples x params) by IRLS, all at once.
+
+    ``weights`` (models x samples) are 0 for samples a model excludes; those
+    samples must still hold finite (e.g. zero-filled) values. Each
+    iteration solves the stacked p x p normal equations of the models that
+    have not yet converged. Returns coefficients, standard errors (from the
+    Fisher information, dispersion 1) and a convergence mask.
+    """
+    n_models, _, n_params = X.shape
+    beta = np.zeros((n_models, n_params))
+    mu = np.broadcast_to(family.initial_mean(y), weights.shape).copy()
+    eta = family.link(mu)
+    converged = np.zeros(n_models, dtype=bool)
+    active = np.arange(n_models)
+
+    for _ in range(max_iter):
+        derivative = family.mean_derivative(mu[active])
+        working_weights = weights[active] * derivative ** 2 / family.variance(mu[active])
+        working_response = eta[active] + (y - mu[active]) / derivative
+
+        Xa = X[active]
+        weighted = np.swapaxes(Xa * working_weights[..., None], 1, 2)
+        information = weighted @ Xa
+        score = (weighted @ working_response[..., None])[..., 0]
+        try:
+            new_beta = np.linalg.solve(information, score[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            new_beta = np.einsum("mij,mj->mi", np.linalg.pinv(information), score)
+
+        step = np.abs(new_beta - beta[active]).max(axis=1)
+        beta[active] = new_beta
+        eta[active] = (Xa @ new_beta[..., None])[..., 0]
+        mu[active] = family.mean(eta[active])
+
+        done = step <= tol * (np.abs(new_beta).max(axis=1) + tol)
+        converged[active[done]] = True
+        active = active[~done]
+        if not len(active):
+            break
+
+    derivative = family.mean_derivative(mu)
+    working_weights = weights * derivative ** 2 / family.variance(mu)
+    information = np.swapaxes(X * working_weights[..., None], 1, 2) @ X
+    with np.errstate(invalid="ignore"):
+        covariance = np.linalg.pinv(information)
+        se = np.sqrt(np.diagonal(covariance, axis1=1, axis2=2))
+    return beta, se, converged & np.isfinite(beta).all(axis=1)
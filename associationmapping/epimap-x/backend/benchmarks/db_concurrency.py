@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress benchmark: N parallel jobs writing progress updates and results.
+
+Usage (from backend/):
+    python benchmarks/db_concurrency.py --jobs 16 --updates 50 --results 5000
+    python benchmarks/db_concurrency.py --jobs 16 --per-job-engine   # old behaviour
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=16, help="number of parallel jobs")
+    parser.add_argument("--updates", type=int, default=50, help="progress commits per job")
+    parser.add_argument("--results", type=int, default=5000, help="result rows written per job")
+    parser.add_argument("--batch-size", type=int, default=1000, help="result rows per commit")
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--per-job-engine", action="store_true",
+                        help="build a plain engine per job, as the tasks used to")
+    return parser.parse_args()
+
+def run_job(engine, job_index, args, errors):
+    from sqlmodel import Session
+    from app.db.models import AnalysisJob, AnalysisResult, AnalysisStatus
+    
+    try:
+        with Session(engine) as session:
+            job = AnalysisJob(
+                name=f"bench_{job_index}",
+                epigenome_file_id=1,
+                phenotype_file_id=1,
+                phenotype_column="phenotype",
+                covariates="[]",
+                model_type="linear_regression",
+                status=AnalysisStatus.RUNNING,
+                owner_id=1
+            )
+            session.add(job)
+            session.commit()
+            
+            for step in range(args.updates):
+                job.progress = int(step * 100 / args.updates)
+                session.commit()
+            
+            for start in range(0, args.results, args.batch_size):
+                session.add_all([
+                    AnalysisResult(
+                        cpg_id=f"cg{i:08d}",
+                        chromosome="chr1",
+                        position=i,
+                        beta=0.01,
+                        p_value=0.5,
+                        analysis_id=job.id
+                    )
+                    for i in range(start, min(start + args.batch_size, args.results))
+                ])
+                session.commit()
+            
+            job.status = AnalysisStatus.COMPLETED
+            job.progress = 100
+            session.commit()
+    except Exception as e:
+        errors.append(f"job {job_index}: {e.__class__.__name__}: {str(e).splitlines()[0]}")
+
+def main():
+    args = parse_args()
+    tmpdir = None
+    if args.database_url is None:
+        tmpdir = tempfile.mkdtemp(prefix="epimap_bench_")
+        args.database_url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.database_url
+    
+    from sqlmodel import SQLModel, create_engine
+    from app.db import models  # noqa: F401 - registers the tables
+    from app.db.session import engine as shared_engine
+    
+    SQLModel.metadata.create_all(shared_engine)
+    
+    errors = []
+    threads = []
+    start = time.perf_counter()
+    for i in range(args.jobs):
+        engine = create_engine(args.database_url) if args.per_job_engine else shared_engine
+        threads.append(threading.Thread(target=run_job, args=(engine, i, args, errors)))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    
+    total_commits = args.jobs * (args.updates + -(-args.results // args.batch_size) + 2)
+    report = {
+        "database_url": args.database_url,
+        "mode": "per_job_engine" if args.per_job_engine else "shared_engine",
+        "jobs": args.jobs,
+        "updates_per_job": args.updates,
+        "results_per_job": args.results,
+        "elapsed_seconds": round(elapsed, 3),
+        "commits_per_second": round(total_commits / elapsed, 1),
+        "rows_per_second": round(args.jobs * args.results / elapsed, 1),
+        "failed_jobs": len(errors),
+        "errors": errors[:10]
+    }
+    print(json.dumps(report, indent=2))
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
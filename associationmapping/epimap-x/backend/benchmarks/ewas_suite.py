@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+End-to-end EWAS benchmark on a synthetic dataset, run in-process against a temporary database.
+
+Times ingest (resumable upload), each EWAS engine, result persistence in the
+SQL and Parquet stores, the Manhattan/QQ/table/region/export reads (cold and
+cached) and the comparison endpoints, and checks recovery of the planted
+CpGs. The JSON report can be compared with an earlier one to flag
+regressions.
+
+Usage (from backend/):
+    python benchmarks/ewas_suite.py --cpgs 100000 --samples 500 --report bench.json
+    python benchmarks/ewas_suite.py --cpgs 850000 --samples 2000 --data-dir /tmp/ewas_850k --report bench.json
+    python benchmarks/ewas_suite.py --report new.json --baseline old.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import add_dataset_arguments, dataset_parameters, generate_dataset
+
+# Engine -> phenotype column of the synthetic dataset it is fitted on
+ENGINE_OUTCOMES = {
+    "linear_regression": "trait",
+    "logistic_regression": "case",
+    "poisson_regression": "count",
+    "negative_binomial": "count"
+}
+COVARIATES = ["age", "sex"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_dataset_arguments(parser)
+    parser.add_argument("--data-dir", default=None, help="reuse/keep the generated dataset here (default: temporary)")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINE_OUTCOMES), choices=list(ENGINE_OUTCOMES))
+    parser.add_argument("--permutations", type=int, default=0, help="also run a max-T permutation EWAS with this many permutations")
+    parser.add_argument("--result-store", choices=["sql", "parquet"], default="parquet", help="store used by the EWAS jobs")
+    parser.add_argument("--upload-chunk-mb", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=6 * 3600, help="seconds to wait for a single analysis")
+    parser.add_argument("--report", default=None, help="write the JSON report here (always printed)")
+    parser.add_argument("--baseline", default=None, help="earlier report to compare stage timings against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage counts as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore stages faster than this in the baseline")
+    return parser.parse_args()
+
+class Benchmark:
+    def __init__(self, client, data_dir: str, manifest: dict, args):
+        self.client = client
+        self.data_dir = data_dir
+        self.manifest = manifest
+        self.args = args
+        self.stages = {}
+        self.analyses = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Record the wall time of a block; details added to the yielded dict land in the report"""
+        details = {}
+        start = time.perf_counter()
+        try:
+            yield details
+        finally:
+            details["seconds"] = round(time.perf_counter() - start, 4)
+            self.stages[name] = details
+
+    def ingest(self):
+        epigenome_path = os.path.join(self.data_dir, self.manifest["files"]["epigenome.tsv"])
+        with self.stage("ingest_epigenome") as details:
+            details["bytes"] = os.path.getsize(epigenome_path)
+            self.epigenome_file_id = self._resumable_upload(epigenome_path, "epigenome")
+            details["megabytes_per_second"] = round(details["bytes"] / 1e6 / max(time.perf_counter() - self._upload_started, 1e-9), 1)
+
+        phenotype_path = os.path.join(self.data_dir, self.manifest["files"]["phenotype.csv"])
+        with self.stage("ingest_phenotype"):
+            with open(phenotype_path, "rb") as f:
+                response = self.client.post("/api/v1/files/upload/phenotype", files={"file": ("phenotype.csv", f, "text/csv")})
+            self.phenotype_file_id = self._json(response)["file_id"]
+
+    def _resumable_upload(self, path: str, file_type: str) -> int:
+        self._upload_started = time.perf_counter()
+        upload = self._json(self.client.post("/api/v1/files/uploads", json={
+            "filename": os.path.basename(path), "file_type": file_type, "total_size": os.path.getsize(path)
+        }))
+        chunk_size = self.args.upload_chunk_mb * 1024 * 1024
+        offset = 0
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                self._json(self.client.put(f"/api/v1/files/uploads/{upload['upload_id']}", params={"offset": offset}, content=chunk))
+                offset += len(chunk)
+        return self._json(self.client.post(f"/api/v1/files/uploads/{upload['upload_id']}/complete"))["file_id"]
+
+    def run_engines(self):
+        for engine in self.args.engines:
+            self._run_analysis(f"ewas_{engine}", {"model_type": engine, "phenotype_column": ENGINE_OUTCOMES[engine]})
+        if self.args.permutations:
+            self._run_analysis("ewas_linear_permutation", {
+                "model_type": "linear_regression",
+                "phenotype_column": "trait",
+                "permutation": {"n_permutations": self.args.permutations, "max_t": True}
+            })
+
+    def _run_analysis(self, name: str, options: dict):
+        request = {
+            "epigenome_file_id": self.epigenome_file_id,
+            "phenotype_file_id": self.phenotype_file_id,
+            "covariates": COVARIATES,
+            **options
+        }
+        with self.stage(name) as details:
+            analysis_id = self._json(self.client.post("/api/v1/analysis/ewas", json=request))["analysis_id"]
+            status = self._wait(analysis_id)
+            details.update(analysis_id=analysis_id, status=status["status"])
+        if status["status"] != "COMPLETED":
+            details["error"] = status.get("error_message")
+            return
+        self.analyses[name] = analysis_id
+        summary = self._json(self.client.get(f"/api/v1/results/{analysis_id}/summary"))
+        details.update(
+            n_tests=summary["n_tests"],
+            n_significant=summary["n_significant"],
+            lambda_gc=summary["lambda_gc"],
+            cpgs_per_second=round(summary["n_tests"] / details["seconds"], 1) if summary["n_tests"] else None,
+            recovery=self._recovery(analysis_id)
+        )
+
+    def _wait(self, analysis_id: int) -> dict:
+        deadline = time.perf_counter() + self.args.timeout
+        while time.perf_counter() < deadline:
+            status = self._json(self.client.get(f"/api/v1/analysis/{analysis_id}/status"))
+            if status["status"] in ("COMPLETED", "FAILED"):
+                return status
+            time.sleep(0.2)
+        return {"status": "TIMEOUT"}
+
+    def _recovery(self, analysis_id: int, fdr: float = 0.05) -> dict:
+        """Planted CpGs found at the FDR threshold, and non-planted CpGs called significant"""
+        import pandas as pd
+        from sqlmodel import Session
+        from app.db.session import engine
+        from app.db.models import AnalysisJob
+        from app.services.result_store import ResultRepository
+
+        truth = set(pd.read_csv(os.path.join(self.data_dir, self.manifest["files"]["truth.csv"]))["cpg_id"])
+        with Session(engine) as session:
+            results = ResultRepository(session).frame(session.get(AnalysisJob, analysis_id), ["cpg_id", "fdr"])
+        significant = set(results.loc[results["fdr"] < fdr, "cpg_id"])
+        return {
+            "fdr_threshold": fdr,
+            "true_positives": len(significant & truth),
+            "false_positives": len(significant - truth),
+            "recall": round(len(significant & truth) / len(truth), 4) if truth else None
+        }
+
+    def persistence(self):
+        """Write one engine's results again into a fresh job, once per result store"""
+        if not self.analyses:
+            return
+        from sqlmodel import Session
+        from app.core.config import settings
+        from app.db.session import engine
+        from app.db.models import AnalysisJob, AnalysisStatus
+        from app.services.result_store import ResultRepository
+
+        source_id = next(iter(self.analyses.values()))
+        with Session(engine) as session:
+            source = session.get(AnalysisJob, source_id)
+            results = ResultRepository(session).frame(source).to_dict(orient="records")
+            configured = settings.RESULT_STORE
+            try:
+                for store in ("sql", "parquet"):
+                    settings.RESULT_STORE = store
+                    target = AnalysisJob(
+                        name=f"persistence_{store}",
+                        epigenome_file_id=source.epigenome_file_id,
+                        phenotype_file_id=source.phenotype_file_id,
+                        phenotype_column=source.phenotype_column,
+                        covariates=source.covariates,
+                        model_type=source.model_type,
+                        status=AnalysisStatus.COMPLETED,
+                        owner_id=1
+                    )
+                    session.add(target)
+                    session.commit()
+                    with self.stage(f"persist_{store}") as details:
+                        ResultRepository(session).save(target, results)
+                        session.commit()
+                        details["rows"] = len(results)
+                    details["rows_per_second"] = round(len(results) / details["seconds"], 1)
+            finally:
+                settings.RESULT_STORE = configured
+
+    def reads(self):
+        if not self.analyses:
+            return
+        analysis_id = next(iter(self.analyses.values()))
+        first_chromosome = "chr1"
+        endpoints = {
+            "manhattan": f"/api/v1/results/{analysis_id}/manhattan",
+            "qqplot": f"/api/v1/results/{analysis_id}/qqplot_data",
+            "table_first_page": f"/api/v1/results/{analysis_id}/table?limit=100",
+            "table_deep_page": f"/api/v1/results/{analysis_id}/table?limit=100&offset={self.args.cpgs // 2}",
+            "region": f"/api/v1/results/{analysis_id}/region?chromosome={first_chromosome}&start=0&end=5000000"
+        }
+        for name, url in endpoints.items():
+            for attempt in ("cold", "cached"):
+                with self.stage(f"read_{name}_{attempt}") as details:
+                    response = self.client.get(url)
+                    self._json(response)
+                    details["bytes"] = len(response.content)
+        with self.stage("read_export_csv") as details:
+            size = 0
+            with self.client.stream("GET", f"/api/v1/results/{analysis_id}/export?format=csv") as response:
+                for chunk in response.iter_bytes():
+                    size += len(chunk)
+            details["bytes"] = size
+
+    def comparisons(self):
+        analysis_ids = list(self.analyses.values())
+        if len(analysis_ids) < 2:
+            return
+        with self.stage("compare_pair") as details:
+            response = self.client.get(f"/api/v1/results/compare/{analysis_ids[0]}/{analysis_ids[1]}")
+            details["status_code"] = response.status_code
+        with self.stage("meta_analysis") as details:
+            response = self.client.post("/api/v1/batch/meta-analysis", json={"analysis_ids": analysis_ids, "method": "random"})
+            details.update(status_code=response.status_code, analyses=len(analysis_ids))
+
+    @staticmethod
+    def _json(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text[:500]}")
+        return response.json()
+
+def environment() -> dict:
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__
+    }
+
+def compare_reports(report: dict, baseline: dict, tolerance: float, min_seconds: float) -> list:
+    """Stages that got slower than the baseline by more than ``tolerance``"""
+    regressions = []
+    for name, stage in report["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous or previous["seconds"] < min_seconds:
+            continue
+        ratio = stage["seconds"] / previous["seconds"]
+        if ratio > 1 + tolerance:
+            regressions.append({"stage": name, "baseline_seconds": previous["seconds"], "seconds": stage["seconds"], "ratio": round(ratio, 2)})
+    return regressions
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="epimap_ewas_bench_")
+    data_dir = args.data_dir or os.path.join(workdir, "data")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "STORAGE_BACKEND": "local",
+        "LOCAL_STORAGE_PATH": os.path.join(workdir, "uploads"),
+        "RESULT_STORE": args.result_store,
+        "RESULT_STORE_PATH": os.path.join(workdir, "results"),
+        "PREPROCESSING_CACHE_PATH": os.path.join(workdir, "preprocessed"),
+        "CHECKPOINT_PATH": os.path.join(workdir, "checkpoints"),
+        "ANNOTATION_CACHE_PATH": os.path.join(workdir, "annotation_cache.db"),
+        "RESPONSE_CACHE_REDIS": "false"
+    })
+
+    started = time.perf_counter()
+    generate_started = time.perf_counter()
+    manifest = generate_dataset(data_dir, **dataset_parameters(args))
+    generate_seconds = round(time.perf_counter() - generate_started, 4)
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        benchmark = Benchmark(client, data_dir, manifest, args)
+        benchmark.stages["generate_dataset"] = {"seconds": generate_seconds, "bytes": manifest["epigenome_bytes"]}
+        benchmark.ingest()
+        benchmark.run_engines()
+        benchmark.persistence()
+        benchmark.reads()
+        benchmark.comparisons()
+
+    report = {
+        "benchmark": "ewas_suite",
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "environment": environment(),
+        "dataset": manifest["parameters"],
+        "options": {"engines": args.engines, "permutations": args.permutations, "result_store": args.result_store},
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "stages": benchmark.stages
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["baseline"] = {"path": args.baseline, "git_commit": baseline.get("environment", {}).get("git_commit")}
+        report["regressions"] = compare_reports(report, baseline, args.tolerance, args.min_seconds)
+        if baseline.get("dataset") != report["dataset"]:
+            report["baseline"]["warning"] = "baseline was run on a different dataset"
+        exit_code = 1 if report["regressions"] else 0
+    if any(stage.get("status") not in (None, "COMPLETED") for stage in benchmark.stages.values()):
+        exit_code = 1
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark: how long a fresh interpreter takes to import the API (and, for comparison,
+a worker task module), how much memory it holds afterwards and which heavy libraries it pulled in.
+
+Each target is imported in new processes under ``python -X importtime``; the
+report gives the median wall time and RSS over ``--repeat`` runs and the
+slowest imports by cumulative time. API startup is expected to stay free of
+the scientific stack, so a target listed in ``--lean`` fails the run if it
+loads any of HEAVY_MODULES. Reports can be compared with a baseline like
+ewas_suite.py's.
+
+Usage (from backend/):
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --targets app.main app.tasks.ewas_tasks --repeat 10 --report imports.json
+    python benchmarks/import_time.py --report new.json --baseline old.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ewas_suite import compare_reports, environment
+
+HEAVY_MODULES = ("numpy", "pandas", "scipy", "statsmodels", "sklearn", "joblib", "aiohttp", "pyarrow", "redis", "boto3")
+
+# Runs in the child: import the target, then report time, memory and what got loaded
+PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+import {target}
+seconds = time.perf_counter() - started
+with open("/proc/self/statm") as f:
+    rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": seconds, "rss_bytes": rss, "modules": len(sys.modules), "heavy_modules": loaded}}))
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=["app.main", "app.tasks.ewas_tasks"], help="modules to import")
+    parser.add_argument("--lean", nargs="*", default=["app.main"], help="targets that must not import HEAVY_MODULES")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per target")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list per target")
+    parser.add_argument("--report", default=None, help="write the JSON report here (always printed)")
+    parser.add_argument("--baseline", default=None, help="earlier report to compare import times against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a target counts as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore targets faster than this in the baseline")
+    return parser.parse_args()
+
+def import_once(target: str, env: dict) -> tuple:
+    """One fresh interpreter importing ``target``: the probe's measurements and the -X importtime table"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(target=target, heavy=HEAVY_MODULES)],
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+def slowest_imports(importtime: str, top: int) -> list:
+    """Modules with the largest cumulative import time, from ``-X importtime`` output"""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        rows.append({"module": name, "cumulative_ms": round(int(cumulative_us) / 1000, 1), "self_ms": round(int(self_us) / 1000, 1)})
+    return sorted(rows, key=lambda row: -row["cumulative_ms"])[:top]
+
+def measure(target: str, repeat: int, top: int, env: dict) -> dict:
+    # One discarded run so bytecode compilation is not timed
+    import_once(target, env)
+    runs = []
+    importtime = ""
+    for _ in range(repeat):
+        run, importtime = import_once(target, env)
+        runs.append(run)
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "seconds": round(statistics.median(seconds), 4),
+        "min_seconds": round(min(seconds), 4),
+        "max_seconds": round(max(seconds), 4),
+        "rss_mb": round(statistics.median(run["rss_bytes"] for run in runs) / 1024 ** 2, 1),
+        "modules": runs[-1]["modules"],
+        "heavy_modules": runs[-1]["heavy_modules"],
+        "slowest_imports": slowest_imports(importtime, top)
+    }
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="epimap_import_bench_")
+    # Importing must not touch real data; point every path setting at a scratch directory
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LOCAL_STORAGE_PATH": os.path.join(workdir, "uploads"),
+        "RESULT_STORE_PATH": os.path.join(workdir, "results"),
+        "PREPROCESSING_CACHE_PATH": os.path.join(workdir, "preprocessed"),
+        "CHECKPOINT_PATH": os.path.join(workdir, "checkpoints"),
+        "SUFFICIENT_STATS_PATH": os.path.join(workdir, "sufficient_stats"),
+        "ANNOTATION_CACHE_PATH": os.path.join(workdir, "annotation_cache.db"),
+    })
+
+    started = time.perf_counter()
+    stages = {f"import {target}": measure(target, args.repeat, args.top, env) for target in args.targets}
+    report = {
+        "benchmark": "import_time",
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "environment": environment(),
+        "options": {"repeat": args.repeat, "lean": args.lean},
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "stages": stages
+    }
+
+    exit_code = 0
+    heavy = {target: stages[f"import {target}"]["heavy_modules"] for target in args.lean if f"import {target}" in stages}
+    report["lean_violations"] = {target: modules for target, modules in heavy.items() if modules}
+    if report["lean_violations"]:
+        exit_code = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["baseline"] = {"path": args.baseline, "git_commit": baseline.get("environment", {}).get("git_commit")}
+        report["regressions"] = compare_reports(report, baseline, args.tolerance, args.min_seconds)
+        if report["regressions"]:
+            exit_code = 1
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic EWAS dataset: a methylation matrix, a phenotype table and the planted truth.
+
+Every sample shares a latent trait; ``--causal`` CpGs (in runs of
+``--region-size`` neighbours) shift their methylation with it by
+``--effect-size``, and all CpGs drift slightly with age. The phenotype file
+derives a continuous (``trait``), binary (``case``) and count (``count``)
+outcome from the same latent trait, so every EWAS engine has signal to find.
+The same arguments always produce byte-identical files.
+
+Usage (from backend/):
+    python benchmarks/synthetic_data.py --cpgs 850000 --samples 2000 --output /tmp/ewas_850k
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Rows generated and written per block; part of the output definition, do not change
+BLOCK_ROWS = 10_000
+N_CHROMOSOMES = 22
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_dataset_arguments(parser)
+    parser.add_argument("--output", required=True, help="directory for the generated files")
+    return parser.parse_args()
+
+def add_dataset_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--cpgs", type=int, default=100_000, help="number of CpGs (rows)")
+    parser.add_argument("--samples", type=int, default=500, help="number of samples (columns)")
+    parser.add_argument("--missing-rate", type=float, default=0.01, help="fraction of methylation values set to NA")
+    parser.add_argument("--causal", type=int, default=200, help="number of CpGs associated with the trait")
+    parser.add_argument("--region-size", type=int, default=5, help="neighbouring causal CpGs per planted region")
+    parser.add_argument("--effect-size", type=float, default=0.05, help="methylation shift per SD of the trait (beta scale)")
+    parser.add_argument("--seed", type=int, default=42)
+
+def dataset_parameters(args) -> dict:
+    return {
+        "cpgs": args.cpgs,
+        "samples": args.samples,
+        "missing_rate": args.missing_rate,
+        "causal": args.causal,
+        "region_size": args.region_size,
+        "effect_size": args.effect_size,
+        "seed": args.seed
+    }
+
+def generate_phenotypes(n_samples: int, seed: int) -> pd.DataFrame:
+    """Latent trait plus the outcomes and covariates derived from it"""
+    rng = np.random.default_rng([seed, 0])
+    latent = rng.standard_normal(n_samples)
+    age = np.round(rng.normal(55, 10, n_samples), 1)
+    sex = rng.choice(np.array(["F", "M"]), n_samples)
+    case = (latent + rng.logistic(size=n_samples) * 0.5 > 0).astype(int)
+    count = rng.poisson(np.exp(1 + 0.5 * latent))
+    return pd.DataFrame(
+        {"trait": np.round(latent, 6), "case": case, "count": count, "age": age, "sex": sex, "latent": latent},
+        index=pd.Index([f"S{i + 1:05d}" for i in range(n_samples)], name="Sample_ID")
+    )
+
+def cpg_layout(n_cpgs: int, seed: int) -> pd.DataFrame:
+    """Sorted positions spread over the autosomes, with CpG-island-like spacing"""
+    rng = np.random.default_rng([seed, 1])
+    chromosome = np.minimum(np.arange(n_cpgs) * N_CHROMOSOMES // max(n_cpgs, 1) + 1, N_CHROMOSOMES)
+    gaps = np.where(rng.random(n_cpgs) < 0.8, rng.integers(20, 400, n_cpgs), rng.integers(1_000, 50_000, n_cpgs))
+    starts = np.r_[0, np.flatnonzero(np.diff(chromosome)) + 1]
+    position = np.cumsum(gaps)
+    position -= np.repeat(position[starts] - gaps[starts], np.diff(np.r_[starts, n_cpgs]))
+    position += 10_000
+    return pd.DataFrame({
+        "cpg_id": [f"chr{c}:{p}" for c, p in zip(chromosome, position)],
+        "chromosome": [f"chr{c}" for c in chromosome],
+        "position": position
+    })
+
+def plant_effects(n_cpgs: int, n_causal: int, region_size: int, seed: int) -> np.ndarray:
+    """Indices of the causal CpGs, in non-overlapping runs of ``region_size``"""
+    rng = np.random.default_rng([seed, 2])
+    region_size = max(1, min(region_size, n_causal or 1))
+    n_regions = -(-n_causal // region_size) if n_causal else 0
+    slots = rng.choice(n_cpgs // region_size, size=min(n_regions, n_cpgs // region_size), replace=False)
+    causal = (slots[:, None] * region_size + np.arange(region_size)).ravel()
+    return np.sort(causal[:n_causal])
+
+def generate_dataset(directory: str, cpgs: int, samples: int, missing_rate: float, causal: int,
+                     region_size: int, effect_size: float, seed: int, progress: bool = False) -> dict:
+    """Write epigenome.tsv, phenotype.csv, truth.csv and manifest.json; reuses an identical existing dataset"""
+    parameters = {
+        "cpgs": cpgs, "samples": samples, "missing_rate": missing_rate, "causal": min(causal, cpgs),
+        "region_size": region_size, "effect_size": effect_size, "seed": seed
+    }
+    paths = {name: os.path.join(directory, name) for name in ("epigenome.tsv", "phenotype.csv", "truth.csv")}
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["parameters"] == parameters and all(os.path.exists(p) for p in paths.values()):
+            return manifest
+    os.makedirs(directory, exist_ok=True)
+
+    phenotypes = generate_phenotypes(samples, seed)
+    phenotypes.drop(columns=["latent"]).to_csv(paths["phenotype.csv"])
+    trait = phenotypes["latent"].to_numpy()
+    trait = (trait - trait.mean()) / trait.std()
+    age = (phenotypes["age"].to_numpy() - 55) / 10
+
+    layout = cpg_layout(cpgs, seed)
+    causal_index = plant_effects(cpgs, parameters["causal"], region_size, seed)
+    effects = np.zeros(cpgs)
+    signs = np.random.default_rng([seed, 3]).choice([-1.0, 1.0], len(causal_index))
+    effects[causal_index] = signs * effect_size
+    truth = layout.iloc[causal_index].assign(effect=effects[causal_index])
+    truth.to_csv(paths["truth.csv"], index=False)
+
+    # Values are written with 4 decimals through a lookup table: formatting floats dominates otherwise
+    tokens = np.array([f"{i / 10_000:.4f}" for i in range(10_001)] + ["NA"], dtype=object)
+    digest = hashlib.sha256()
+    with open(paths["epigenome.tsv"], "w", newline="\n") as f:
+        header = "\t".join(["CpG_ID", *phenotypes.index]) + "\n"
+        f.write(header)
+        digest.update(header.encode())
+        for block, start in enumerate(range(0, cpgs, BLOCK_ROWS)):
+            stop = min(start + BLOCK_ROWS, cpgs)
+            rng = np.random.default_rng([seed, 100, block])
+            n = stop - start
+            # Bimodal baseline like real arrays: most CpGs near 0 or 1, some intermediate
+            baseline = np.where(rng.random(n) < 0.45, rng.beta(3, 15, n), np.where(rng.random(n) < 0.8, rng.beta(15, 3, n), rng.beta(5, 5, n)))
+            spread = rng.uniform(0.01, 0.06, n)
+            values = (
+                baseline[:, None]
+                + spread[:, None] * rng.standard_normal((n, samples))
+                + effects[start:stop, None] * trait[None, :]
+                + 0.004 * age[None, :]
+            )
+            codes = np.rint(np.clip(values, 0.0001, 0.9999) * 10_000).astype(np.int64)
+            codes[rng.random((n, samples)) < missing_rate] = 10_001
+            text = "".join(
+                f"{cpg_id}\t" + "\t".join(row) + "\n"
+                for cpg_id, row in zip(layout["cpg_id"].iloc[start:stop], tokens[codes])
+            )
+            f.write(text)
+            digest.update(text.encode())
+            if progress:
+                print(f"\r{stop}/{cpgs} CpGs", end="", file=sys.stderr, flush=True)
+    if progress:
+        print(file=sys.stderr)
+
+    manifest = {
+        "parameters": parameters,
+        "files": {name: os.path.basename(path) for name, path in paths.items()},
+        "epigenome_sha256": digest.hexdigest(),
+        "epigenome_bytes": os.path.getsize(paths["epigenome.tsv"]),
+        "phenotype_columns": {"continuous": "trait", "binary": "case", "count": "count", "covariates": ["age", "sex"]}
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main():
+    args = parse_args()
+    manifest = generate_dataset(args.output, **dataset_parameters(args), progress=True)
+    print(json.dumps(manifest, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""AnnotationClient against a stub Ensembl server (run from backend/: python -m pytest tests)"""
+import asyncio
+import gc
+import threading
+import time
+import warnings
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.services.annotation_client import AnnotationClient
+
+GENES = [{"start": 100, "end": 500, "external_name": "GENE1", "id": "ENSG1", "biotype": "protein_coding"}]
+
+def stub_app(hits: list, throttle: int = 0) -> web.Application:
+    """Overlap endpoint answering the first ``throttle`` requests with 429 + Retry-After"""
+    async def overlap(request):
+        hits.append(time.monotonic())
+        if len(hits) <= throttle:
+            return web.json_response({"error": "rate limited"}, status=429, headers={"Retry-After": "0.2"})
+        return web.json_response(GENES)
+
+    app = web.Application()
+    app.router.add_get("/overlap/region/human/{region}", overlap)
+    return app
+
+def make_client(server: TestServer, cache_path: str) -> AnnotationClient:
+    return AnnotationClient(
+        base_url=str(server.make_url("")), cache_path=cache_path,
+        requests_per_second=0, max_retries=2, window_size=1000
+    )
+
+def test_retries_after_429_honouring_retry_after(tmp_path):
+    hits = []
+
+    async def run():
+        async with TestServer(stub_app(hits, throttle=1)) as server:
+            async with make_client(server, str(tmp_path / "cache.db")) as client:
+                return await client.annotate_positions({"cg1": ("chr1", 200), "cg2": ("chr1", 800)})
+
+    annotations = asyncio.run(run())
+    assert annotations["cg1"]["gene"] == "GENE1"
+    assert annotations["cg2"] == {"gene": "intergenic", "feature": "intergenic"}
+    assert len(hits) == 2
+    assert hits[1] - hits[0] >= 0.2
+
+def test_gives_up_after_max_retries(tmp_path):
+    hits = []
+
+    async def run():
+        async with TestServer(stub_app(hits, throttle=10)) as server:
+            async with make_client(server, str(tmp_path / "cache.db")) as client:
+                return await client.annotate_positions({"cg1": ("chr1", 200)})
+
+    assert asyncio.run(run()) == {"cg1": {"gene": "unknown", "feature": "unknown"}}
+    assert len(hits) == 3
+
+def test_cached_windows_are_not_requested_again(tmp_path):
+    hits = []
+    cache_path = str(tmp_path / "cache.db")
+
+    async def run():
+        async with TestServer(stub_app(hits)) as server:
+            async with make_client(server, cache_path) as client:
+                first = await client.annotate_positions({"cg1": ("chr1", 200)})
+                # Same window, another CpG
+                second = await client.annotate_positions({"cg2": ("chr1", 300)})
+            # The cache is on disk, so a new client reuses it too
+            async with make_client(server, cache_path) as client:
+                third = await client.annotate_positions({"cg3": ("chr1", 400)})
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first["cg1"]["gene"] == second["cg2"]["gene"] == third["cg3"]["gene"] == "GENE1"
+    assert len(hits) == 1
+
+def test_session_is_released_when_the_event_loop_changes(tmp_path):
+    hits = []
+    # The server gets its own loop in a thread, so the client can switch loops under it
+    server_loop = asyncio.new_event_loop()
+    server = TestServer(stub_app(hits), loop=server_loop)
+    server_loop.run_until_complete(server.start_server())
+    thread = threading.Thread(target=server_loop.run_forever, daemon=True)
+    thread.start()
+    client = make_client(server, str(tmp_path / "cache.db"))
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        for start in (100, 2100):
+            # Each asyncio.run is a new loop, as in a worker thread
+            asyncio.run(client.get_genes_in_window("1", start))
+        asyncio.run(client.close())
+        gc.collect()
+
+    asyncio.run_coroutine_threadsafe(server.close(), server_loop).result()
+    server_loop.call_soon_threadsafe(server_loop.stop)
+    thread.join()
+    server_loop.close()
+    assert len(hits) == 2
+    assert not [w for w in caught if "Unclosed client session" in str(w.message) or "Unclosed connector" in str(w.message)]
@@ -0,0 +1,68 @@
+"""Startup schema upgrades against the database shipped with the repo (run from backend/: python -m pytest tests)"""
+import os
+import shutil
+
+from sqlalchemy import inspect
+from sqlmodel import Session, SQLModel, select
+
+from app.db.models import AnalysisJob, AnalysisResult
+from app.db.migrations import COLUMNS, INDEXES, upgrade_schema
+from app.db.session import build_engine
+
+SHIPPED_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "epimap.db")
+
+def legacy_engine(tmp_path):
+    path = tmp_path / "epimap.db"
+    shutil.copy(SHIPPED_DB, path)
+    return build_engine(f"sqlite:///{path}")
+
+def schema(engine):
+    inspector = inspect(engine)
+    return {table: [(c["name"], str(c["type"])) for c in inspector.get_columns(table)] for table in inspector.get_table_names()}
+
+def test_adds_listed_columns_and_indexes(tmp_path):
+    engine = legacy_engine(tmp_path)
+    SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
+
+    inspector = inspect(engine)
+    for table, column, _ in COLUMNS:
+        assert column in {c["name"] for c in inspector.get_columns(table)}, f"{table}.{column}"
+    for table, index in INDEXES:
+        assert index in {i["name"] for i in inspector.get_indexes(table)}, f"{table}.{index}"
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = legacy_engine(tmp_path)
+    SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
+    before = schema(engine)
+    upgrade_schema(engine)
+    assert schema(engine) == before
+
+def test_existing_rows_get_column_defaults(tmp_path):
+    engine = legacy_engine(tmp_path)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO analysisjob (id, name, status, progress, phenotype_column, covariates, model_type,"
+            " epigenome_file_id, phenotype_file_id, owner_id, created_at)"
+            " VALUES (1000, 'old', 'COMPLETED', 100, 'y', '[]', 'linear_regression', 1, 1, 1, '2024-01-01 00:00:00')"
+        )
+    SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
+    with engine.connect() as connection:
+        row = connection.exec_driver_sql("SELECT * FROM analysisjob WHERE id = 1000").mappings().one()
+    for table, column, default in COLUMNS:
+        if table == "analysisjob":
+            assert row[column] == default, column
+
+def test_analysis_tables_match_the_models(tmp_path):
+    engine = legacy_engine(tmp_path)
+    SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
+
+    for table in ("analysisjob", "analysisresult"):
+        columns = {c["name"] for c in inspect(engine).get_columns(table)}
+        assert set(SQLModel.metadata.tables[table].c.keys()) <= columns, table
+    with Session(engine) as session:
+        session.exec(select(AnalysisJob)).all()
+        session.exec(select(AnalysisResult).limit(10)).all()
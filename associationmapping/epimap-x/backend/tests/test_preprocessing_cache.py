@@ -0,0 +1,55 @@
+"""Preprocessing artifact cache (run from backend/: python -m pytest tests)"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import preprocessing_service
+from app.services.preprocessing_service import PreprocessingPipeline
+
+@pytest.fixture
+def inputs():
+    samples = [f"s{i}" for i in range(6)]
+    methylation = pd.DataFrame(
+        np.random.default_rng(0).uniform(0.05, 0.95, size=(20, 6)),
+        index=pd.Index([f"cg{i}" for i in range(20)], name="cpg"), columns=samples
+    )
+    phenotype = pd.DataFrame({"age": np.arange(6, dtype=float), "sex": list("MFMFMF")}, index=samples)
+    return methylation, phenotype
+
+def run(cache_path, inputs):
+    loads = []
+    def load():
+        loads.append(1)
+        return inputs
+    methylation, phenotype, info = PreprocessingPipeline.from_names(["m_values"], cache_path=str(cache_path)).run("input", load)
+    return methylation, phenotype, info, len(loads)
+
+def test_artifacts_round_trip_through_parquet(tmp_path, inputs):
+    first = run(tmp_path, inputs)
+    second = run(tmp_path, inputs)
+    assert (first[3], second[3]) == (1, 0)
+    assert second[2]["cached_steps"] == 2
+    pd.testing.assert_frame_equal(first[0], second[0])
+    pd.testing.assert_frame_equal(first[1], second[1])
+    assert os.path.isfile(os.path.join(tmp_path, first[2]["artifact"], "methylation.parquet"))
+
+def test_a_held_lock_skips_the_store(tmp_path, inputs):
+    key = run(tmp_path / "probe", inputs)[2]["artifact"]
+    os.makedirs(tmp_path / "cache")
+    with preprocessing_service._store_lock(str(tmp_path / "cache" / f".{key}.lock")) as locked:
+        assert locked
+        run(tmp_path / "cache", inputs)
+    assert not os.path.exists(tmp_path / "cache" / key)
+    run(tmp_path / "cache", inputs)
+    assert os.path.isdir(tmp_path / "cache" / key)
+
+def test_pickle_artifacts_from_an_older_version_are_replaced(tmp_path, inputs):
+    key = run(tmp_path / "probe", inputs)[2]["artifact"]
+    stale = tmp_path / "cache" / key
+    os.makedirs(stale)
+    inputs[0].to_pickle(stale / "methylation.pkl")
+    assert run(tmp_path / "cache", inputs)[3] == 1
+    assert run(tmp_path / "cache", inputs)[3] == 0
+    assert sorted(os.listdir(stale)) == ["methylation.parquet", "phenotype.parquet"]
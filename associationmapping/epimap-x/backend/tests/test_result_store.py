@@ -0,0 +1,57 @@
+"""Parquet result store (run from backend/: python -m pytest tests)"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.config import settings
+from app.services.result_store import ParquetResultStore, annotations_path, results_frame
+
+def make_results(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return results_frame([
+        {"cpg_id": f"cg{i}", "chromosome": f"chr{i % 3 + 1}", "position": i, "beta": 0.1, "p_value": float(p), "fdr": 0.5}
+        for i, p in enumerate(rng.uniform(size=n))
+    ])
+
+def test_annotation_chunks_are_readable_before_they_are_folded_in(tmp_path):
+    store = ParquetResultStore(str(tmp_path))
+    path = store.write(1, make_results(50))
+    chunk = pd.DataFrame({"cpg_id": ["cg3", "cg7"], "gene_symbol": ["A", "B"], "feature_type": ["promoter", "gene_body"]})
+    store.write_annotations(path, chunk)
+    store.write_annotations(path, chunk.assign(cpg_id=["cg4", "cg8"]))
+
+    df = store.read(path, ["position", "gene_symbol"]).set_index("position")
+    assert list(df.columns) == ["gene_symbol"]
+    assert df.loc[[3, 4, 7, 8], "gene_symbol"].tolist() == ["A", "A", "B", "B"]
+    assert df["gene_symbol"].notna().sum() == 4
+    batches = pd.concat(store.iter_batches(path, ["cpg_id", "feature_type"], batch_size=7))
+    assert batches["feature_type"].notna().sum() == 4
+
+    # Rewriting the file (with the annotations folded in) drops the sidecar
+    store.write(1, store.read(path))
+    assert not os.path.exists(annotations_path(path))
+    assert store.read(path, ["gene_symbol"])["gene_symbol"].notna().sum() == 4
+
+@pytest.mark.parametrize("head_rows", [0, 30, 5000])
+def test_top_pages_match_a_full_sort(tmp_path, monkeypatch, head_rows):
+    monkeypatch.setattr(settings, "RESULT_STORE_ROW_GROUP_SIZE", 64)
+    monkeypatch.setattr(settings, "RESULT_STORE_TOP_ROWS", head_rows)
+    store = ParquetResultStore(str(tmp_path))
+    results = make_results(1000)
+    # Ties and missing p-values
+    results.loc[::50, "p_value"] = 0.5
+    results.loc[::97, "p_value"] = np.nan
+    path = store.write(1, results)
+
+    stored = store.read(path)
+    expected = stored.iloc[np.argsort(stored["p_value"].fillna(np.inf).to_numpy(), kind="stable")]
+    for offset, limit in [(0, 10), (15, 40), (990, 100), (1000, 5)]:
+        page = store.top(path, limit, offset)
+        assert list(page.columns) == list(stored.columns)
+        assert page["cpg_id"].tolist() == expected["cpg_id"].iloc[offset:offset + limit].tolist()
+
+    best = expected["cpg_id"].iloc[0]
+    store.write_annotations(path, pd.DataFrame({"cpg_id": [best], "gene_symbol": ["A"], "feature_type": ["promoter"]}))
+    assert store.top(path, 1)["gene_symbol"].tolist() == ["A"]
@@ -0,0 +1,57 @@
+"""Job claiming, heartbeats and orphan detection (run from backend/: python -m pytest tests)"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, SQLModel
+
+from app.core.config import settings
+from app.db.models import AnalysisJob, AnalysisStatus
+from app.db.session import build_engine
+from app.tasks import watchdog
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = build_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(watchdog, "engine", engine)
+    return engine
+
+def add_job(engine, **fields) -> int:
+    job = AnalysisJob(
+        name="job", epigenome_file_id=1, phenotype_file_id=1, phenotype_column="y",
+        covariates="[]", model_type="linear_regression", owner_id=1, **fields
+    )
+    with Session(engine) as session:
+        session.add(job)
+        session.commit()
+        return job.id
+
+def test_only_one_worker_claims_a_pending_job(engine):
+    pending = add_job(engine)
+    running = add_job(engine, status=AnalysisStatus.RUNNING)
+    with Session(engine) as first, Session(engine) as second:
+        assert watchdog.claim_jobs(first, [pending, running]) == [pending]
+        assert watchdog.claim_jobs(second, [pending]) == []
+    with Session(engine) as session:
+        job = session.get(AnalysisJob, pending)
+        assert job.status == AnalysisStatus.RUNNING and job.heartbeat_at is not None
+
+def test_jobs_running_here_are_not_orphaned(engine):
+    stale = datetime.utcnow() - timedelta(seconds=settings.JOB_HEARTBEAT_TIMEOUT + 60)
+    here = add_job(engine, status=AnalysisStatus.RUNNING, heartbeat_at=stale)
+    lost = add_job(engine, status=AnalysisStatus.RUNNING, heartbeat_at=stale)
+    assert watchdog.requeue_orphaned_jobs(running_here=[here]) == [lost]
+    with Session(engine) as session:
+        assert session.get(AnalysisJob, here).status == AnalysisStatus.RUNNING
+        assert session.get(AnalysisJob, lost).status == AnalysisStatus.PENDING
+
+def test_heartbeat_is_refreshed_while_the_job_runs(engine):
+    stale = datetime.utcnow() - timedelta(hours=1)
+    running = add_job(engine, status=AnalysisStatus.RUNNING, heartbeat_at=stale)
+    finished = add_job(engine, status=AnalysisStatus.COMPLETED, heartbeat_at=stale)
+    with watchdog.JobHeartbeat([running, finished], interval=0.05):
+        time.sleep(0.3)
+    with Session(engine) as session:
+        assert session.get(AnalysisJob, running).heartbeat_at > stale
+        assert session.get(AnalysisJob, finished).heartbeat_at == stale